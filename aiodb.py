@@ -0,0 +1,105 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+import metrics
+from db import POOL_MAX_LIFETIME, POOL_TIMEOUT, PoolTimeout, db_config
+
+# Async pool size for the ASGI server. One event loop multiplexes many
+# in-flight requests over these connections, so it is sized for concurrent
+# queries rather than for concurrent requests.
+ASYNC_POOL_SIZE = int(os.getenv('ASYNC_DB_POOL_SIZE', 32))
+
+
+# aiomysql pool for the async entry point (asgi.py), with the same timeout,
+# recycling and stats as the threaded pool in db.py. The driver is imported
+# on open() so the sync app never needs it installed.
+class AsyncConnectionPool:
+    def __init__(self, config, size=ASYNC_POOL_SIZE, timeout=POOL_TIMEOUT, max_lifetime=POOL_MAX_LIFETIME):
+        self.config = config
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self._pool = None
+        self._pid = None
+        self._waiters = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    # Must run inside the worker's event loop (after the fork)
+    async def open(self):
+        import aiomysql
+
+        if self._pool is not None:
+            return
+        self._pid = os.getpid()
+        self._pool = await aiomysql.create_pool(
+            host=self.config['host'],
+            user=self.config['user'],
+            password=self.config['password'] or '',
+            db=self.config['database'],
+            minsize=0,
+            maxsize=self.size,
+            pool_recycle=int(self.max_lifetime) if self.max_lifetime else -1,
+            autocommit=True
+        )
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    # Borrow a connection for the duration of an async with-block
+    @asynccontextmanager
+    async def connection(self):
+        if self._pool is None:
+            raise RuntimeError('Async database pool is not open (the ASGI lifespan opens it)')
+        started = time.monotonic()
+        self._waiters += 1
+        try:
+            connection = await asyncio.wait_for(self._pool.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise PoolTimeout(msg=f"Timed out after {self.timeout}s waiting for a database connection")
+        finally:
+            self._waiters -= 1
+        waited = time.monotonic() - started
+        if metrics.METRICS_ENABLED:
+            metrics.observe_pool_wait(waited)
+        self._checkouts += 1
+        self._total_wait += waited
+        self._max_wait = max(self._max_wait, waited)
+        try:
+            yield metrics.InstrumentedAsyncConnection(connection) if metrics.METRICS_ENABLED else connection
+        finally:
+            self._pool.release(connection)
+
+    def stats(self):
+        pool = self._pool
+        return {
+            'size': self.size,
+            'open': pool.size if pool else 0,
+            'idle': pool.freesize if pool else 0,
+            'in_use': pool.size - pool.freesize if pool else 0,
+            'waiters': self._waiters,
+            'checkouts': self._checkouts,
+            'timeouts': self._timeouts,
+            'avg_wait_ms': round(self._total_wait * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+            'max_wait_ms': round(self._max_wait * 1000, 3),
+            'pid': self._pid
+        }
+
+
+pool = AsyncConnectionPool(db_config)
+
+
+def get_connection():
+    return pool.connection()
+
+
+def pool_stats():
+    return pool.stats()
@@ -1,120 +1,91 @@
-from flask import Flask, request, jsonify, send_from_directory, render_template
+from flask import Flask, Response, request, jsonify, send_from_directory, render_template, stream_with_context
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 from dotenv import load_dotenv
-import jwt
-import bcrypt
 from datetime import datetime, timedelta
-import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, IntegrityError
 import json
+import hashlib
+import csv
+import threading
+from db import get_connection, pool_stats
+from aiodb import pool_stats as async_pool_stats
+from auth import admin_required, issue_token, request_identity, token_cache
+from passwords import HashingBusy, check_password, hash_password, hashing_pool, login_limiter, needs_rehash
+from cache import reference_cache
+from booking import BookingError, book_seat, cancel_booking, cancel_bookings, parse_cancel_batch, refund_for
+from inventory import SEAT_CLASSES, leg_availability, reconcile as reconcile_inventory
+import stats
+import metrics
+import importer
+from planner import journey_planner
+from stops import backfill as backfill_stops, direct_route, insert_stops, leg_for, load_stops, offsets_from_times
+from seed import seed_database, train_number
+from queries import parse_search, search_legs, search_response, search_statement
+from serializer import JSONProvider, encode as encode_json, encode_lines, encode_row, encode_rows
+from pnr import batch_response as pnr_batch_response, lookup as lookup_pnrs, parse_batch as parse_pnr_batch, pnr_cache, public_response as pnr_public_response
+import idempotency
+import livestatus
+import waitlist
+from feedback import feedback_query, feedback_queue, parse_feedback
+from idempotency import idempotency_store
+from livestatus import live_store
 
 # Load environment variables
 load_dotenv()
-SECRET_KEY = os.getenv('SECRET_KEY') or 'super_secret_railway_key_2024'
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
-CORS(app)
-
-# MySQL Configuration
-db_config = {
-    'host': os.getenv('DB_HOST'),
-    'user': os.getenv('DB_USER'),
-    'password': os.getenv('DB_PASSWORD'),
-    'database': os.getenv('DB_NAME')
-}
+app.json = JSONProvider(app)
+# Number of reverse proxies in front of the app whose X-Forwarded-For is
+# trusted for the client IP (used by login rate limiting)
+PROXY_COUNT = int(os.getenv('PROXY_COUNT', 0))
+if PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_COUNT)
+CORS(app, expose_headers=['X-Next-After-Id', idempotency.REPLAY_HEADER, 'X-Live-Poll'])
+# Write routes honour an Idempotency-Key header (idempotency.py)
+idempotent = idempotency.idempotent(get_connection)
+# The cancel token is only ever handed out in the original booking response
+idempotent_booking = idempotency.idempotent(get_connection, redact=('cancel_token',))
 
-# Custom JSON serializer for handling time values
-def process_row_values(row):
-    if not row:
-        return row
-    
-    result = {}
-    for key, value in row.items():
-        if isinstance(value, timedelta):
-            # Convert timedelta to string in format HH:MM:SS
-            seconds = value.total_seconds()
-            hours = int(seconds // 3600)
-            minutes = int((seconds % 3600) // 60)
-            secs = int(seconds % 60)
-            result[key] = f"{hours:02d}:{minutes:02d}:{secs:02d}"
-        elif isinstance(value, datetime):
-            result[key] = value.isoformat()
-        else:
-            result[key] = value
-    return result
+# Serialize once so cached bodies can be served as-is
+def to_json_bytes(data):
+    return encode_json(data) + b'\n'
+
+# Cached bodies carry their own ETag / Last-Modified so add_header can answer 304s
+def cached_json_response(cached):
+    response = Response(cached.body, mimetype='application/json')
+    response.set_etag(cached.etag)
+    response.last_modified = cached.last_modified
+    return response
 
 # Helper function to execute SQL queries
 def execute_query(query, params=None, fetch=True):
-    connection = None
-    cursor = None
-    try:
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute(query, params or ())
-        
-        if fetch:
-            result = cursor.fetchall()
-            # Make sure we consume all results
-            while cursor.nextset():
-                pass  # Consume any additional result sets
+    try:
+        with get_connection() as connection:
+            with connection.cursor(dictionary=True) as cursor:
+                cursor.execute(query, params or ())
+                result = cursor.fetchall() if fetch else None
+                # Make sure we consume all results
+                while cursor.nextset():
+                    pass  # Consume any additional result sets
             connection.commit()
             return result
-        else:
-            connection.commit()
-            # For non-fetch queries, we still need to handle any result sets
-            while cursor.nextset():
-                pass  # Consume any additional result sets
-            return None
     except Error as e:
         print(f"Error executing query: {e}")
         return None
-    finally:
-        if cursor:
-            try:
-                # Consume any remaining result sets
-                while cursor.nextset():
-                    pass
-                cursor.close()
-            except Error:
-                # If we still get an error, just pass
-                pass
-        if connection and connection.is_connected():
-            connection.close()
-
-# Authentication middleware
-def token_required(f):
-    def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
-        try:
-            token = token.split()[1]
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            return f(*args, **kwargs)
-        except:
-            return jsonify({'message': 'Token is invalid!'}), 401
-    decorated.__name__ = f.__name__
-    return decorated
-
-# Admin-only authentication middleware
-def admin_required(f):
-    def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
-        try:
-            token = token.split()[1]
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            # Check if the user is an admin
-            if not data.get('is_admin', False):
-                return jsonify({'message': 'Admin access required!'}), 403
-            # Pass the user identity as the first argument
-            return f(data.get('user'), *args, **kwargs)
-        except Exception as e:
-            return jsonify({'message': 'Token is invalid!'}), 401
-    decorated.__name__ = f.__name__
-    return decorated
+
+# Per-request latency, query count and DB time (metrics.py). Registered before
+# add_header so the final status (e.g. 304) is recorded.
+if metrics.METRICS_ENABLED:
+    @app.before_request
+    def start_request_metrics():
+        metrics.start_request(request.endpoint)
+
+    @app.after_request
+    def record_request_metrics(response):
+        metrics.finish_request(request.endpoint, request.method, response.status_code, request.path, request.remote_addr)
+        return response
 
 # Serve index.html as the root route
 @app.route('/')
@@ -128,57 +99,98 @@ def serve_static(path):
         return render_template(path)
     return send_from_directory('static', path)
 
+# Primary- and unique-key reads of the routes below, kept here so
+# querycheck.py EXPLAINs the same statements
+ADMIN_LOGIN_QUERY = "SELECT * FROM admin WHERE username = %s AND is_admin = 1"
+USER_LOGIN_QUERY = "SELECT * FROM admin WHERE username = %s"
+USERNAME_TAKEN_QUERY = "SELECT admin_id FROM admin WHERE username = %s"
+SCHEDULE_QUERY = """
+    SELECT s.schedule_id as id, s.train_name, ss.station_name as source, ds.station_name as destination,
+           s.departure_time, s.arrival_time, s.total_seats as available_seats
+    FROM train_schedule s
+    JOIN stations ss ON s.source_station_id = ss.station_id
+    JOIN stations ds ON s.destination_station_id = ds.station_id
+    WHERE s.schedule_id = %s
+"""
+SCHEDULE_DEPARTURE_QUERY = "SELECT departure_time FROM train_schedule WHERE schedule_id = %s"
+SCHEDULE_SEATS_QUERY = "SELECT total_seats FROM train_schedule WHERE schedule_id = %s"
+BOOKINGS_COUNT_QUERY = "SELECT COALESCE(SUM(bookings), 0) as total FROM booking_stats WHERE dimension = 'total'"
+
+# Login and signup attempts per client IP, checked before any bcrypt work
+def login_throttled():
+    retry_after = login_limiter.hit(request.remote_addr or 'unknown')
+    if not retry_after:
+        return None
+    response = jsonify({'message': 'Too many login attempts, please try again later'})
+    response.headers['Retry-After'] = str(int(retry_after) + 1)
+    return response, 429
+
+def hashing_busy():
+    response = jsonify({'message': 'Server busy, please try again'})
+    response.headers['Retry-After'] = '1'
+    return response, 429
+
+# Store a fresh hash when the configured bcrypt cost changed since this one was made
+def rehash_if_needed(username, password, hashed):
+    if not needs_rehash(hashed):
+        return
+    try:
+        new_hash = hash_password(password)
+        with get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("UPDATE admin SET password = %s WHERE username = %s", (new_hash, username))
+            connection.commit()
+    except (Error, HashingBusy) as e:
+        print(f"Password rehash for {username} skipped: {e}")
+
 # Admin login route
 @app.route('/api/admin/login', methods=['POST'])
 def admin_login():
+    throttled = login_throttled()
+    if throttled:
+        return throttled
     try:
         data = request.get_json()
         username = str(data.get('username', '')).strip()
         password = str(data.get('password', '')).strip()
-        
+
+        try:
+            with get_connection() as connection:
+                with connection.cursor(dictionary=True) as cursor:
+                    cursor.execute(ADMIN_LOGIN_QUERY, (username,))
+                    admin = cursor.fetchone()
+            db_error = None
+        except Error as e:
+            admin, db_error = None, e
+
+        if admin and check_password(password, admin['password']):
+            rehash_if_needed(username, password, admin['password'])
+            return jsonify({'token': issue_token(username, is_admin=True), 'is_admin': True})
+
         # EMERGENCY BYPASS & AUTO-REPAIR
-        # If user is using the default credentials, we allow it instantly and fix the DB
+        # The default credentials always work; if the stored admin row is
+        # missing or does not match, it is repaired (only then, so a normal
+        # default login costs one bcrypt check, not a re-hash)
         if username == 'admin' and password == 'admin123':
-            # Fix DB in background to be sure
-            try:
-                connection = mysql.connector.connect(**db_config)
-                cursor = connection.cursor(dictionary=True)
-                # Create table if missing
-                cursor.execute("CREATE TABLE IF NOT EXISTS admin (admin_id INT AUTO_INCREMENT PRIMARY KEY, username VARCHAR(50) UNIQUE, password VARCHAR(100), is_admin BOOLEAN DEFAULT FALSE)")
-                # Update/Insert admin record
-                hashed_pw = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                cursor.execute("INSERT INTO admin (username, password, is_admin) VALUES ('admin', %s, 1) ON DUPLICATE KEY UPDATE password = %s, is_admin = 1", (hashed_pw, hashed_pw))
-                connection.commit()
-                cursor.close()
-                connection.close()
-            except:
-                pass # Continue even if DB fix fails, bypass is primary
-            
-            # Generate Token
-            token = jwt.encode({
-                'user': 'admin',
-                'is_admin': True,
-                'exp': datetime.utcnow() + timedelta(hours=24)
-            }, SECRET_KEY)
-            return jsonify({'token': token, 'is_admin': True})
-
-        # Regular database check for other admins
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM admin WHERE username = %s AND is_admin = 1", (username,))
-        admin = cursor.fetchone()
-        connection.close()
-        
-        if admin and bcrypt.checkpw(password.encode('utf-8'), admin['password'].encode('utf-8')):
-            token = jwt.encode({
-                'user': username,
-                'is_admin': True,
-                'exp': datetime.utcnow() + timedelta(hours=24)
-            }, SECRET_KEY)
-            return jsonify({'token': token, 'is_admin': True})
-        
+            if db_error is None:
+                try:
+                    hashed_pw = hash_password('admin123')
+                    with get_connection() as connection:
+                        with connection.cursor() as cursor:
+                            # Create table if missing
+                            cursor.execute("CREATE TABLE IF NOT EXISTS admin (admin_id INT AUTO_INCREMENT PRIMARY KEY, username VARCHAR(50) UNIQUE, password VARCHAR(100), is_admin BOOLEAN DEFAULT FALSE)")
+                            cursor.execute("INSERT INTO admin (username, password, is_admin) VALUES ('admin', %s, 1) ON DUPLICATE KEY UPDATE password = %s, is_admin = 1", (hashed_pw, hashed_pw))
+                        connection.commit()
+                except (Error, HashingBusy) as e:
+                    print(f"Admin repair skipped: {e}") # bypass is primary
+            return jsonify({'token': issue_token('admin', is_admin=True), 'is_admin': True})
+
+        if db_error is not None:
+            raise db_error
         return jsonify({'message': 'Invalid credentials'}), 401
-    
+
+    except HashingBusy:
+        return hashing_busy()
     except Exception as e:
         print(f"FATAL LOGIN ERROR: {e}")
         return jsonify({'message': f'Server Error: {str(e)}'}), 500
@@ -186,32 +198,24 @@ def admin_login():
 # Stations routes
 @app.route('/api/stations', methods=['GET'])
 def get_stations():
-    connection = None
-    cursor = None
-    try:
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor(dictionary=True)
-        
-        query = "SELECT * FROM stations"
-        cursor.execute(query)
-        stations = cursor.fetchall()
-        
-        return jsonify(stations)
+    def build():
+        with get_connection() as connection:
+            with connection.cursor(dictionary=True) as cursor:
+                query = "SELECT * FROM stations"
+                cursor.execute(query)
+                stations = cursor.fetchall()
+        return to_json_bytes(stations)
+
+    try:
+        return cached_json_response(reference_cache.get('stations', 'all', build))
     except Error as e:
         print(f"Error fetching stations: {e}")
         return jsonify([]), 500
-    finally:
-        if cursor:
-            try:
-                cursor.close()
-            except Error:
-                pass
-        if connection and connection.is_connected():
-            connection.close()
 
 @app.route('/api/stations', methods=['POST'])
 @admin_required
-def add_station():
+@idempotent
+def add_station(current_user):
     data = request.get_json()
     try:
         result = execute_query(
@@ -219,6 +223,7 @@ def add_station():
             (data['station_name'], data['code']),
             fetch=False
         )
+        reference_cache.invalidate('stations', 'schedules')
         return jsonify({'message': 'Station added successfully'})
     except Exception as e:
         print(f"Error adding station: {e}")
@@ -227,281 +232,480 @@ def add_station():
 # Train Schedule routes
 @app.route('/api/schedules', methods=['GET'])
 def get_schedules():
-    connection = None
-    cursor = None
-    try:
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor(dictionary=True)
-        
-        query = """
-        SELECT s.schedule_id as id, s.train_name, ss.station_name as source, ds.station_name as destination,
-               s.departure_time, s.arrival_time, s.total_seats as available_seats
-        FROM train_schedule s
-        JOIN stations ss ON s.source_station_id = ss.station_id
-        JOIN stations ds ON s.destination_station_id = ds.station_id
-        """
-        
-        cursor.execute(query)
-        schedules = cursor.fetchall()
-        
-        # Process all schedules to handle timedelta objects
-        processed_schedules = [process_row_values(schedule) for schedule in schedules]
-        
-        return jsonify(processed_schedules)
+    def build():
+        with get_connection() as connection:
+            with connection.cursor() as cursor:
+                query = """
+                SELECT s.schedule_id as id, s.train_name, ss.station_name as source, ds.station_name as destination,
+                       s.departure_time, s.arrival_time, s.total_seats as available_seats
+                FROM train_schedule s
+                JOIN stations ss ON s.source_station_id = ss.station_id
+                JOIN stations ds ON s.destination_station_id = ds.station_id
+                """
+
+                cursor.execute(query)
+                return encode_rows(cursor.description, cursor.fetchall()) + b'\n'
+
+    try:
+        return cached_json_response(reference_cache.get('schedules', 'all', build))
     except Exception as e:
         print(f"Error in get_schedules: {e}")
         return jsonify([]), 500
-    finally:
-        if cursor:
-            cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
 
 @app.route('/api/schedules', methods=['POST'])
 @admin_required
-def add_schedule():
+@idempotent
+def add_schedule(current_user):
     data = request.get_json()
+    # Optional intermediate stops: [{station_id, arrival_time, departure_time}, ...]
+    # from source to destination; without them the train runs direct
+    route = None
+    if data.get('stops'):
+        try:
+            route = offsets_from_times(data['stops'])
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'message': f"Invalid stops: {e}"}), 400
+        data.setdefault('source_station_id', route[0][0])
+        data.setdefault('destination_station_id', route[-1][0])
+        data.setdefault('departure_time', data['stops'][0]['departure_time'])
+        data.setdefault('arrival_time', data['stops'][-1]['arrival_time'])
     try:
-        result = execute_query(
-            """
-            INSERT INTO train_schedule 
-            (train_name, source_station_id, destination_station_id, departure_time, arrival_time, total_seats)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            """,
-            (
-                data['train_name'],
-                data['source_station_id'],
-                data['destination_station_id'],
-                data['departure_time'],
-                data['arrival_time'],
-                data['total_seats']
-            ),
-            fetch=False
+        with get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    INSERT INTO train_schedule
+                    (train_name, train_number, source_station_id, destination_station_id, departure_time, arrival_time, total_seats)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    (
+                        data['train_name'],
+                        data.get('train_number') or train_number(data['train_name']),
+                        data['source_station_id'],
+                        data['destination_station_id'],
+                        data['departure_time'],
+                        data['arrival_time'],
+                        data['total_seats']
+                    )
+                )
+                schedule_id = cursor.lastrowid
+                if route:
+                    insert_stops(cursor, schedule_id, route)
+                else:
+                    backfill_stops(cursor, [schedule_id])
+            connection.commit()
+        reference_cache.invalidate('schedules')
+        journey_planner.add_schedule(
+            schedule_id, data['train_name'], data['departure_time'],
+            route or direct_route(int(data['source_station_id']), int(data['destination_station_id']),
+                                  data['departure_time'], data['arrival_time'])
         )
-        return jsonify({'message': 'Schedule added successfully'})
+        return jsonify({'message': 'Schedule added successfully', 'schedule_id': schedule_id})
     except Exception as e:
         print(f"Error adding schedule: {e}")
         return jsonify({'message': 'Failed to add schedule'}), 500
 
+# Bulk import stations or schedules from a CSV / NDJSON request body
+@app.route('/api/admin/import/<dataset>', methods=['POST'])
+@admin_required
+def bulk_import(current_user, dataset):
+    if dataset not in importer.IMPORTERS:
+        return jsonify({'message': f"dataset must be one of: {', '.join(sorted(importer.IMPORTERS))}"}), 404
+    fmt = request.args.get('format') or ('csv' if 'csv' in (request.mimetype or '') else 'ndjson')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'message': 'format must be csv or ndjson'}), 400
+    try:
+        with get_connection() as connection:
+            result = importer.IMPORTERS[dataset](connection, importer.read_rows(request.stream, fmt))
+        reference_cache.invalidate('stations', 'schedules')
+        journey_planner.invalidate()
+        return jsonify(result)
+    except (Error, UnicodeDecodeError, csv.Error) as e:
+        print(f"Error importing {dataset}: {e}")
+        return jsonify({'message': f'Import failed: {e}'}), 500
+
+@app.route('/api/schedules/search', methods=['GET'])
+def search_schedules():
+    try:
+        search = parse_search(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    try:
+        with get_connection() as connection:
+            with connection.cursor(dictionary=True) as cursor:
+                cursor.execute(*search_statement(search))
+                schedules = cursor.fetchall()
+
+                availability = {}
+                if search['travel_date'] and schedules:
+                    with connection.cursor() as plain_cursor:
+                        availability = leg_availability(
+                            plain_cursor, search['travel_date'], *search_legs(search, schedules), search['seat_class']
+                        )
+
+        return jsonify(search_response(search, schedules, availability))
+    except Exception as e:
+        print(f"Error in search_schedules: {e}")
+        return jsonify({'results': [], 'message': 'Error searching schedules'}), 500
+
+# Ordered stops of a train with clock times at each stop
+@app.route('/api/schedules/<int:id>/stops', methods=['GET'])
+def get_schedule_stops(id):
+    try:
+        with get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(SCHEDULE_DEPARTURE_QUERY, (id,))
+                row = cursor.fetchone()
+                if not row:
+                    return jsonify({'message': 'Schedule not found'}), 404
+                route = load_stops(cursor, id)
+        start = int(row[0].total_seconds())
+        for stop in route:
+            for field in ('arrival', 'departure'):
+                offset = stop[f"{field}_offset"]
+                at = None if offset is None else start + offset * 60
+                stop[f"{field}_time"] = None if at is None else f"{at % 86400 // 3600:02d}:{at % 3600 // 60:02d}:{at % 60:02d}"
+                stop[f"{field}_day"] = None if at is None else at // 86400
+        return jsonify({'schedule_id': id, 'stops': route})
+    except Exception as e:
+        print(f"Error fetching stops: {e}")
+        return jsonify({'message': 'Error fetching stops'}), 500
+
+# Seats free per class for one leg of a train on a date
+@app.route('/api/schedules/<int:id>/availability', methods=['GET'])
+def get_schedule_availability(id):
+    travel_date = request.args.get('date')
+    seat_class = request.args.get('class') or None
+    if seat_class and seat_class not in SEAT_CLASSES:
+        return jsonify({'message': f"class must be one of: {', '.join(SEAT_CLASSES)}"}), 400
+    try:
+        datetime.strptime(travel_date or '', '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'message': 'date is required (YYYY-MM-DD)'}), 400
+    try:
+        with get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(SCHEDULE_SEATS_QUERY, (id,))
+                row = cursor.fetchone()
+                if not row:
+                    return jsonify({'message': 'Schedule not found'}), 404
+                route = load_stops(cursor, id)
+                try:
+                    from_stop, to_stop = leg_for(route, request.args.get('from'), request.args.get('to'))
+                except ValueError as e:
+                    return jsonify({'message': str(e)}), 400
+                classes = leg_availability(cursor, travel_date, {id: (from_stop, to_stop)}, {id: row[0]}, seat_class)[id]
+        return jsonify({
+            'schedule_id': id,
+            'date': travel_date,
+            'from': route[from_stop]['code'],
+            'to': route[to_stop]['code'],
+            'classes': classes,
+            'available_seats': sum(classes.values())
+        })
+    except Exception as e:
+        print(f"Error fetching availability: {e}")
+        return jsonify({'message': 'Error fetching availability'}), 500
+
+# Multi-hop journeys between two station codes (earliest arrival and fewest transfers)
+@app.route('/api/journeys', methods=['GET'])
+def plan_journey():
+    source_code = request.args.get('from', '').strip().upper()
+    destination_code = request.args.get('to', '').strip().upper()
+    travel_date = request.args.get('date') or None
+    if not source_code or not destination_code:
+        return jsonify({'message': 'Both from and to station codes are required'}), 400
+    try:
+        hours, minutes = (int(part) for part in request.args.get('time', '00:00').split(':')[:2])
+        if not (0 <= hours < 24 and 0 <= minutes < 60):
+            raise ValueError
+        max_transfers = min(max(int(request.args.get('max_transfers', journey_planner.max_transfers)), 0), 5)
+        min_transfer = request.args.get('min_transfer')
+        min_transfer = max(int(min_transfer), 0) * 60 if min_transfer is not None else None
+        start_date = datetime.strptime(travel_date, '%Y-%m-%d').date() if travel_date else None
+    except ValueError:
+        return jsonify({'message': 'Invalid time (HH:MM), date (YYYY-MM-DD), max_transfers or min_transfer (minutes)'}), 400
+
+    try:
+        with get_connection() as connection:
+            journey_planner.ensure_current(connection)
+        result = journey_planner.plan(
+            source_code, destination_code, hours * 3600 + minutes * 60,
+            max_transfers=max_transfers, min_transfer=min_transfer
+        )
+    except Exception as e:
+        print(f"Error in plan_journey: {e}")
+        return jsonify({'message': 'Error planning journey'}), 500
+    if result is None:
+        return jsonify({'message': 'Unknown station code'}), 404
+
+    # Attach calendar dates when the caller gave a travel date
+    if start_date:
+        result['date'] = start_date.isoformat()
+        for journey in result['options']:
+            for leg in journey['legs']:
+                leg['travel_date'] = (start_date + timedelta(days=leg['departure_day_offset'])).isoformat()
+    return jsonify(result)
+
 @app.route('/api/schedules/<int:id>', methods=['GET'])
 def get_schedule_by_id(id):
-    connection = None
-    cursor = None
-    try:
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor(dictionary=True)
-        
-        query = """
-        SELECT s.schedule_id as id, s.train_name, ss.station_name as source, ds.station_name as destination,
-               s.departure_time, s.arrival_time, s.total_seats as available_seats
-        FROM train_schedule s
-        JOIN stations ss ON s.source_station_id = ss.station_id
-        JOIN stations ds ON s.destination_station_id = ds.station_id
-        WHERE s.schedule_id = %s
-        """
-        
-        cursor.execute(query, (id,))
-        schedule = cursor.fetchone()
-        
-        if not schedule:
+    def build():
+        with get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(SCHEDULE_QUERY, (id,))
+                schedule = cursor.fetchone()
+                return encode_row(cursor.description, schedule) + b'\n' if schedule else None
+
+    try:
+        cached = reference_cache.get('schedules', id, build)
+        if cached is None:
             return jsonify({"message": "Schedule not found"}), 404
-        
-        # Process the schedule to handle timedelta objects
-        processed_schedule = process_row_values(schedule)
-        
-        return jsonify(processed_schedule)
+
+        return cached_json_response(cached)
     except Exception as e:
         print(f"Error in get_schedule_by_id: {e}")
         return jsonify({"message": "Error fetching schedule"}), 500
-    finally:
-        if cursor:
-            cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
 
 # Booking routes
 @app.route('/api/bookings', methods=['POST'])
+@idempotent_booking
 def create_booking():
     data = request.get_json()
-    connection = None
-    cursor = None
-    
-    try:
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor(dictionary=True)
-        
-        # First create passenger if not exists
-        cursor.execute(
-            "INSERT INTO passengers (name, email) VALUES (%s, %s)",
-            (data['passenger_name'], data['passenger_email'])
-        )
-        connection.commit()
-        
-        cursor.execute("SELECT LAST_INSERT_ID()")
-        passenger_id = cursor.fetchone()['LAST_INSERT_ID()']
-        
-        # Create booking
-        cursor.execute(
-            "INSERT INTO bookings (passenger_id, schedule_id, booking_date) VALUES (%s, %s, %s)",
-            (passenger_id, data['schedule_id'], datetime.now().date())
-        )
-        connection.commit()
-        
-        cursor.execute("SELECT LAST_INSERT_ID()")
-        booking_id = cursor.fetchone()['LAST_INSERT_ID()']
-        
-        # Create ticket
-        cursor.execute(
-            "INSERT INTO tickets (booking_id, seat_number, travel_date) VALUES (%s, %s, %s)",
-            (booking_id, data['seat_number'], data['travel_date'])
-        )
-        connection.commit()
-        
-        # Create payment
-        cursor.execute(
-            "INSERT INTO payments (booking_id, amount, payment_date, payment_method) VALUES (%s, %s, %s, %s)",
-            (
-                booking_id,
-                data['amount'],
-                datetime.now(),
-                data['payment_method']
-            )
-        )
-        connection.commit()
-        
-        return jsonify({'message': 'Booking created successfully', 'booking_id': booking_id})
-        
+
+    try:
+        with get_connection() as connection:
+            booking = book_seat(connection, data)
+
+        return jsonify(dict(booking, message='Booking created successfully'))
+
+    except BookingError as e:
+        return jsonify({'message': str(e)}), e.status
     except Exception as e:
         print(f"Error creating booking: {e}")
         return jsonify({'message': 'Failed to create booking'}), 500
-    finally:
-        if cursor:
-            try:
-                cursor.close()
-            except Error:
-                pass
-        if connection and connection.is_connected():
-            connection.close()
 
 @app.route('/api/bookings/<int:booking_id>', methods=['GET'])
 def get_booking(booking_id):
-    connection = None
-    cursor = None
-    try:
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor(dictionary=True)
-        
-        query = """
-        SELECT b.*, p.name, p.email, ts.train_name, 
-               s1.station_name as source_name, s2.station_name as destination_name,
-               t.seat_number, t.travel_date, py.amount, py.payment_method
-        FROM bookings b
-        JOIN passengers p ON b.passenger_id = p.passenger_id
-        JOIN train_schedule ts ON b.schedule_id = ts.schedule_id
-        JOIN stations s1 ON ts.source_station_id = s1.station_id
-        JOIN stations s2 ON ts.destination_station_id = s2.station_id
-        JOIN tickets t ON b.booking_id = t.booking_id
-        JOIN payments py ON b.booking_id = py.booking_id
-        WHERE b.booking_id = %s
-        """
-        cursor.execute(query, (booking_id,))
-        booking = cursor.fetchall()
-        
-        if not booking:
+    try:
+        booking = lookup_pnrs(get_connection, [booking_id]).get(booking_id)
+        if booking is None:
             return jsonify({}), 404
-            
-        # Process the booking data to handle datetime objects
-        processed_booking = process_row_values(booking[0]) if booking else {}
-        
-        return jsonify(processed_booking)
+
+        return jsonify(pnr_public_response(booking))
     except Error as e:
         print(f"Error fetching booking: {e}")
         return jsonify({}), 500
-    finally:
-        if cursor:
-            try:
-                cursor.close()
-            except Error:
-                pass
-        if connection and connection.is_connected():
-            connection.close()
+
+# PNR status of many bookings at once (travel agents): {"pnrs": [1, 2, ...]}
+@app.route('/api/bookings/batch', methods=['POST'])
+def get_bookings_batch():
+    try:
+        booking_ids = parse_pnr_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    try:
+        return jsonify(pnr_batch_response(booking_ids, lookup_pnrs(get_connection, booking_ids)))
+    except Error as e:
+        print(f"Error fetching bookings: {e}")
+        return jsonify({'message': 'Error fetching bookings'}), 500
+
+# Cancel a booking: {"cancel_token": <token from the booking response>,
+# "reason": ...}. Admin tokens may cancel any booking without it. Freed seats
+# go to the waitlist.
+@app.route('/api/bookings/<int:booking_id>/cancel', methods=['POST'])
+@idempotent
+def cancel_booking_route(booking_id):
+    data = request.get_json(silent=True) or {}
+    identity = request_identity()
+    is_admin = bool(identity and identity.get('is_admin'))
+    if not is_admin and not data.get('cancel_token'):
+        return jsonify({'message': 'cancel_token of the booking is required'}), 400
+
+    try:
+        with get_connection() as connection:
+            result = cancel_booking(connection, booking_id,
+                                    cancel_token=None if is_admin else str(data['cancel_token']),
+                                    reason=data.get('reason'))
+        return jsonify(dict(result, message='Booking cancelled'))
+    except BookingError as e:
+        return jsonify({'message': str(e)}), e.status
+    except Exception as e:
+        print(f"Error cancelling booking: {e}")
+        return jsonify({'message': 'Failed to cancel booking'}), 500
+
+@app.route('/api/bookings/<int:booking_id>/refund', methods=['GET'])
+def get_refund(booking_id):
+    try:
+        with get_connection() as connection:
+            with connection.cursor(dictionary=True) as cursor:
+                refund = refund_for(cursor, booking_id)
+        if refund is None:
+            return jsonify({'message': 'No refund for this booking'}), 404
+        return jsonify(refund)
+    except Error as e:
+        print(f"Error fetching refund: {e}")
+        return jsonify({'message': 'Error fetching refund'}), 500
+
+# Waitlist status of a booking with its current place in the queue
+@app.route('/api/bookings/<int:booking_id>/waitlist', methods=['GET'])
+def get_waitlist_position(booking_id):
+    try:
+        with get_connection() as connection:
+            with connection.cursor() as cursor:
+                entry = waitlist.position(cursor, booking_id)
+        if entry is None:
+            return jsonify({'message': 'Booking is not on a waitlist'}), 404
+        return jsonify(entry)
+    except Error as e:
+        print(f"Error fetching waitlist position: {e}")
+        return jsonify({'message': 'Error fetching waitlist position'}), 500
+
+# Live running status: position/delay events from the operations feed,
+# {"events": [{"train_number", "station", "event", "reported_at", "delay_minutes"}, ...]}
+@app.route('/api/live/events', methods=['POST'])
+@admin_required
+def ingest_live_events(current_user):
+    try:
+        events = livestatus.parse_events(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    live_store.start_poller(get_connection)
+    try:
+        with get_connection() as connection:
+            return jsonify(livestatus.ingest(connection, events))
+    except Error as e:
+        print(f"Error ingesting live events: {e}")
+        return jsonify({'message': 'Failed to store live events'}), 500
+
+# Server-Sent Events for a few trains (?trains=12627,12951): the current
+# state of each, then every change. SERVER_MODE=async serves these on the
+# event loop; here each stream holds a worker thread, so they are refused
+# unless LIVE_SYNC_PUSH says the server has threads to spare.
+@app.route('/api/live/stream', methods=['GET'])
+def stream_live_status():
+    try:
+        trains = livestatus.parse_stream_trains(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    if not livestatus.LIVE_SYNC_PUSH:
+        response = jsonify({'message': 'Live streams need SERVER_MODE=async; poll /api/live/<train_number> instead'})
+        response.headers['Retry-After'] = str(livestatus.LIVE_SHORT_POLL)
+        return response, 503
+    live_store.start_poller(get_connection)
+
+    def events():
+        subscriber = live_store.subscribe(livestatus.ThreadSubscriber(trains))
+        try:
+            yield livestatus.RETRY_FRAME + live_store.frames(trains)
+            while True:
+                changed = subscriber.wait(livestatus.LIVE_HEARTBEAT)
+                yield live_store.frames(changed) if changed else livestatus.HEARTBEAT_FRAME
+        finally:
+            live_store.unsubscribe(subscriber)
+
+    return Response(events(), mimetype='text/event-stream', headers={'X-Accel-Buffering': 'no'})
+
+# Latest state of one train; ?since=<version>&wait=<seconds> long-polls for
+# a newer one. Without LIVE_SYNC_PUSH the wait is skipped (it would pin a
+# sync worker) and X-Live-Poll tells the client how long to wait before
+# asking again.
+@app.route('/api/live/<train_number>', methods=['GET'])
+def get_live_status(train_number):
+    try:
+        since, wait = livestatus.parse_wait(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    live_store.start_poller(get_connection)
+    state = live_store.get(train_number)
+    if wait and livestatus.LIVE_SYNC_PUSH and live_store.version(train_number) <= since:
+        state = live_store.wait(train_number, since, wait)
+    if state is None:
+        return jsonify({'message': 'No live status for this train'}), 404
+    response = jsonify(state)
+    if wait and not livestatus.LIVE_SYNC_PUSH:
+        response.headers['X-Live-Poll'] = str(livestatus.LIVE_SHORT_POLL)
+    return response
 
 # Signup route
 @app.route('/api/feedback', methods=['POST'])
+@idempotent
 def submit_feedback():
-    data = request.get_json()
-    email = data.get('email')
-    category = data.get('category')
-    message = data.get('message')
-    
-    try:
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor()
-        
-        cursor.execute(
-            "INSERT INTO feedbacks (email, category, message) VALUES (%s, %s, %s)",
-            (email, category, message)
-        )
-        connection.commit()
-        
+    try:
+        row = parse_feedback(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    try:
+        # Queued and written in batches by the worker's flusher (feedback.py)
+        feedback_queue.submit(get_connection, row)
         return jsonify({'message': 'Feedback submitted successfully'})
     except Exception as e:
         print(f"Feedback error: {e}")
         return jsonify({'message': 'Failed to submit feedback'}), 500
-    finally:
-        if 'cursor' in locals(): cursor.close()
-        if 'connection' in locals(): connection.close()
 
+# Feedback for admins, newest first (?category=&q=&after_id=&limit=); the
+# next page's after_id is returned in the X-Next-After-Id header
 @app.route('/api/admin/feedbacks', methods=['GET'])
 @admin_required
 def get_feedbacks(current_user):
     try:
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM feedbacks ORDER BY created_at DESC")
-        feedbacks = cursor.fetchall()
-        return jsonify(feedbacks)
+        query, params, limit = feedback_query(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    try:
+        with get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(query, params)
+                feedbacks = cursor.fetchall()
+                description = cursor.description
+
+        response = Response(encode_rows(description, feedbacks) + b'\n', mimetype='application/json')
+        if len(feedbacks) == limit:
+            response.headers['X-Next-After-Id'] = str(feedbacks[-1][0])
+        return response
     except Exception as e:
+        print(f"Error fetching feedbacks: {e}")
         return jsonify([]), 500
-    finally:
-        if 'cursor' in locals(): cursor.close()
-        if 'connection' in locals(): connection.close()
 
 @app.route('/api/signup', methods=['POST'])
 def signup():
+    throttled = login_throttled()
+    if throttled:
+        return throttled
     data = request.get_json()
     username = data.get('username')
     password = data.get('password')
-    
-    try:
-        # Create a new connection for this request
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor(dictionary=True)
-        
-        # Check if username already exists
-        cursor.execute("SELECT * FROM admin WHERE username = %s", (username,))
-        existing_user = cursor.fetchall()
-        
+
+    try:
+        # Borrow a pooled connection for this request
+        with get_connection() as connection:
+            with connection.cursor(dictionary=True) as cursor:
+                # Check if username already exists
+                cursor.execute(USERNAME_TAKEN_QUERY, (username,))
+                existing_user = cursor.fetchall()
+
         if existing_user:
-            cursor.close()
-            connection.close()
             return jsonify({'message': 'Username already exists'}), 400
-        
-        # Hash the password
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-        
-        # Insert new user as a regular user (not admin)
-        cursor.execute(
-            "INSERT INTO admin (username, password) VALUES (%s, %s)",
-            (username, hashed_password.decode('utf-8'))
-        )
-        connection.commit()
-        
-        cursor.close()
-        connection.close()
-        
+
+        # Hash the password (without holding a database connection)
+        hashed_password = hash_password(password)
+
+        with get_connection() as connection:
+            with connection.cursor() as cursor:
+                # Insert new user as a regular user (not admin)
+                cursor.execute(
+                    "INSERT INTO admin (username, password) VALUES (%s, %s)",
+                    (username, hashed_password)
+                )
+            connection.commit()
+
         return jsonify({'message': 'User registered successfully'})
-    
+
+    except IntegrityError:
+        return jsonify({'message': 'Username already exists'}), 400
+    except HashingBusy:
+        return hashing_busy()
     except Exception as e:
         print(f"Signup error: {e}")
         return jsonify({'message': 'An error occurred during signup'}), 500
@@ -509,40 +713,36 @@ def signup():
 # Regular user login route
 @app.route('/api/login', methods=['POST'])
 def user_login():
+    throttled = login_throttled()
+    if throttled:
+        return throttled
     data = request.get_json()
     username = data.get('username')
     password = data.get('password')
-    
-    try:
-        # Create a new connection for this request
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor(dictionary=True)
-        
-        # Execute query to find user
-        cursor.execute("SELECT * FROM admin WHERE username = %s", (username,))
-        user = cursor.fetchall()
-        cursor.close()
-        
+
+    try:
+        # Borrow a pooled connection for this request
+        with get_connection() as connection:
+            with connection.cursor(dictionary=True) as cursor:
+                # Execute query to find user
+                cursor.execute(USER_LOGIN_QUERY, (username,))
+                user = cursor.fetchall()
+
         if not user:
-            connection.close()
             return jsonify({'message': 'Invalid credentials'}), 401
-        
+
         # Check password
-        stored_password = user[0]['password'].encode('utf-8') if user[0]['password'] else b''
-        if bcrypt.checkpw(password.encode('utf-8'), stored_password):
+        if check_password(password, user[0]['password']):
+            rehash_if_needed(username, password, user[0]['password'])
             # Create token without admin privileges
-            token = jwt.encode({
-                'user': username,
-                'is_admin': False,
-                'exp': datetime.utcnow() + timedelta(hours=24)
-            }, os.getenv('SECRET_KEY'))
-            
-            connection.close()
+            token = issue_token(username, is_admin=False)
+
             return jsonify({'token': token, 'is_admin': False})
-        
-        connection.close()
+
         return jsonify({'message': 'Invalid credentials'}), 401
-    
+
+    except HashingBusy:
+        return hashing_busy()
     except Exception as e:
         print(f"Login error: {e}")
         return jsonify({'message': 'An error occurred during login'}), 500
@@ -550,165 +750,330 @@ def user_login():
 # Get all bookings count
 @app.route('/api/bookings/count', methods=['GET'])
 @admin_required
-def get_bookings_count():
-    connection = None
-    cursor = None
-    try:
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor(dictionary=True)
-        
-        # Get total bookings count
-        cursor.execute("SELECT COUNT(*) as total FROM bookings")
-        result = cursor.fetchone()
-        
-        return jsonify({'count': result['total']})
+def get_bookings_count(current_user):
+    try:
+        with get_connection() as connection:
+            with connection.cursor(dictionary=True) as cursor:
+                # Get total bookings count from the maintained aggregates
+                cursor.execute(BOOKINGS_COUNT_QUERY)
+                result = cursor.fetchone()
+
+        return jsonify({'count': int(result['total'])})
     except Error as e:
         print(f"Error fetching booking count: {e}")
         return jsonify({'count': 0}), 500
-    finally:
-        if cursor:
-            try:
-                cursor.close()
-            except Error:
-                pass
-        if connection and connection.is_connected():
-            connection.close()
-
-# Get all bookings for admin
-@app.route('/api/bookings', methods=['GET'])
-@admin_required
-def get_all_bookings(current_user):
-    connection = None
-    cursor = None
-    try:
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor(dictionary=True)
-        
-        query = """
-        SELECT b.booking_id, p.name as passenger_name, p.email, ts.train_name, 
-               s1.station_name as source, s2.station_name as destination,
-               t.travel_date, t.seat_number, py.amount
-        FROM bookings b
-        JOIN passengers p ON b.passenger_id = p.passenger_id
+
+BOOKINGS_PAGE_SIZE = 100
+BOOKINGS_MAX_PAGE_SIZE = 1000
+BOOKINGS_STREAM_BATCH = 500
+
+# Build the admin bookings query from the request filters: the newest
+# `limit` matching bookings before after_id, each with all its matching
+# tickets. Pages are keyed on booking_id, so the inner query is a range scan
+# on the bookings primary key that stops after `limit` bookings however deep
+# the client has paged, and only that page's tickets are sorted. A page never
+# ends inside a group booking.
+def build_bookings_query(args, limit):
+    conditions = []
+    params = []
+    ticket_conditions = []
+    ticket_params = []
+    if args.get('after_id'):
+        conditions.append("b.booking_id < %s")
+        params.append(int(args['after_id']))
+    if args.get('from_date'):
+        ticket_conditions.append("t.travel_date >= %s")
+        ticket_params.append(datetime.strptime(args['from_date'], '%Y-%m-%d').date())
+    if args.get('to_date'):
+        ticket_conditions.append("t.travel_date <= %s")
+        ticket_params.append(datetime.strptime(args['to_date'], '%Y-%m-%d').date())
+    if args.get('schedule_id'):
+        conditions.append("b.schedule_id = %s")
+        params.append(int(args['schedule_id']))
+    if args.get('station'):
+        conditions.append("(s1.code = %s OR s2.code = %s)")
+        params += [args['station'].strip().upper()] * 2
+
+    ticket_filter = ''.join(f" AND {condition}" for condition in ticket_conditions)
+    conditions.append(f"EXISTS (SELECT 1 FROM tickets t WHERE t.booking_id = b.booking_id{ticket_filter})")
+    query = f"""
+    SELECT b.booking_id, COALESCE(b.passenger_name, p.name) as passenger_name, p.email, ts.train_name,
+           s1.station_name as source, s2.station_name as destination,
+           t.travel_date, t.seat_number, py.amount, b.status
+    FROM (
+        SELECT b.booking_id FROM bookings b
         JOIN train_schedule ts ON b.schedule_id = ts.schedule_id
         JOIN stations s1 ON ts.source_station_id = s1.station_id
         JOIN stations s2 ON ts.destination_station_id = s2.station_id
-        JOIN tickets t ON b.booking_id = t.booking_id
-        JOIN payments py ON b.booking_id = py.booking_id
-        ORDER BY b.booking_id DESC
-        """
-        
-        cursor.execute(query)
-        bookings = cursor.fetchall()
-        
-        # Process all bookings to handle datetime objects
-        processed_bookings = [process_row_values(booking) for booking in bookings]
-        
-        return jsonify(processed_bookings)
+        WHERE {' AND '.join(conditions)}
+        ORDER BY b.booking_id DESC LIMIT %s
+    ) page
+    JOIN bookings b ON b.booking_id = page.booking_id
+    JOIN passengers p ON b.passenger_id = p.passenger_id
+    JOIN train_schedule ts ON b.schedule_id = ts.schedule_id
+    JOIN stations s1 ON ts.source_station_id = s1.station_id
+    JOIN stations s2 ON ts.destination_station_id = s2.station_id
+    JOIN tickets t ON b.booking_id = t.booking_id{ticket_filter}
+    JOIN payments py ON b.booking_id = py.booking_id
+    ORDER BY b.booking_id DESC, t.ticket_id
+    """
+    return query, params + ticket_params + [limit] + ticket_params
+
+# Stream every matching booking as NDJSON (at most `limit` bookings). Each
+# query fetches one keyset page of BOOKINGS_STREAM_BATCH bookings in full, so
+# memory stays flat, no connection is held while the client reads, and a
+# client that goes away leaves no unread rows behind.
+def stream_bookings(filters, limit=None):
+    filters = dict(filters)
+    while limit is None or limit > 0:
+        size = BOOKINGS_STREAM_BATCH if limit is None else min(limit, BOOKINGS_STREAM_BATCH)
+        query, params = build_bookings_query(filters, size)
+        with get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+                description = cursor.description
+        if rows:
+            yield encode_lines(description, rows)
+        count = len({row[0] for row in rows})
+        if count < size:
+            return
+        filters['after_id'] = rows[-1][0]
+        if limit is not None:
+            limit -= count
+
+# Get all bookings for admin (?after_id=&limit=&from_date=&to_date=&schedule_id=&station=&format=ndjson).
+# `limit` counts bookings, whose tickets are one row each.
+@app.route('/api/bookings', methods=['GET'])
+@admin_required
+def get_all_bookings(current_user):
+    stream = request.args.get('format') == 'ndjson'
+    filters = request.args.to_dict()
+    try:
+        if stream:
+            limit = max(int(filters['limit']), 1) if filters.get('limit') else None
+        else:
+            limit = min(max(int(filters.get('limit', BOOKINGS_PAGE_SIZE)), 10), BOOKINGS_MAX_PAGE_SIZE)
+        # Validates the filters before a stream sends its 200
+        query, params = build_bookings_query(filters, limit or BOOKINGS_STREAM_BATCH)
+    except ValueError:
+        return jsonify({'message': 'Invalid filter (ids and limit must be integers, dates YYYY-MM-DD)'}), 400
+
+    if stream:
+        return Response(stream_with_context(stream_bookings(filters, limit)), mimetype='application/x-ndjson')
+
+    try:
+        with get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(query, params)
+                bookings = cursor.fetchall()
+                description = cursor.description
+
+        # booking_id is the first column
+        next_after_id = None
+        if len({booking[0] for booking in bookings}) == limit:
+            next_after_id = bookings[-1][0]
+
+        response = Response(encode_rows(description, bookings) + b'\n', mimetype='application/json')
+        if next_after_id is not None:
+            response.headers['X-Next-After-Id'] = str(next_after_id)
+        return response
     except Error as e:
         print(f"Error fetching all bookings: {e}")
         return jsonify([]), 500
-    finally:
-        if cursor:
-            try:
-                cursor.close()
-            except Error:
-                pass
-        if connection and connection.is_connected():
-            connection.close()
+
+# Connection pool utilization (for sizing DB_POOL_SIZE)
+@app.route('/api/admin/pool-stats', methods=['GET'])
+@admin_required
+def get_pool_stats(current_user):
+    return jsonify(dict(pool_stats(), async_database=async_pool_stats(), password_hashing=hashing_pool.stats(),
+                        feedback_queue=feedback_queue.stats()))
+
+# Cancel many bookings at once (e.g. a cancelled train):
+# {"booking_ids": [...], "reason": ...}
+@app.route('/api/admin/bookings/cancel', methods=['POST'])
+@admin_required
+@idempotent
+def cancel_bookings_route(current_user):
+    data = request.get_json(silent=True)
+    try:
+        booking_ids = parse_cancel_batch(data)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    try:
+        with get_connection() as connection:
+            return jsonify(cancel_bookings(connection, booking_ids, reason=data.get('reason')))
+    except Error as e:
+        print(f"Error cancelling bookings: {e}")
+        return jsonify({'message': 'Failed to cancel bookings'}), 500
+
+# Run waitlist promotion for one class or every class with a waitlist
+@app.route('/api/admin/waitlist/promote', methods=['POST'])
+@admin_required
+def promote_waitlist(current_user):
+    try:
+        key = waitlist.parse_promote(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    try:
+        with get_connection() as connection:
+            if key is None:
+                return jsonify({'classes': waitlist.promote_pending(connection)})
+            promoted = waitlist.promote(connection, *key)
+        return jsonify({'promoted': len(promoted), 'bookings': promoted})
+    except Error as e:
+        print(f"Error promoting waitlist: {e}")
+        return jsonify({'message': 'Failed to promote waitlist'}), 500
+
+# Recompute seat_inventory counters from sold tickets (?fix=1 to repair drift)
+@app.route('/api/admin/inventory/reconcile', methods=['POST'])
+@admin_required
+def reconcile_seat_inventory(current_user):
+    try:
+        from_date = request.args.get('from_date')
+        from_date = datetime.strptime(from_date, '%Y-%m-%d').date() if from_date else None
+    except ValueError:
+        return jsonify({'message': 'Invalid from_date (expected YYYY-MM-DD)'}), 400
+    try:
+        with get_connection() as connection:
+            report = reconcile_inventory(connection, from_date=from_date, fix=request.args.get('fix') == '1')
+        return jsonify(report)
+    except Error as e:
+        print(f"Error reconciling inventory: {e}")
+        return jsonify({'message': 'Failed to reconcile inventory'}), 500
+
+# Dashboard numbers from booking_stats (constant time regardless of history)
+@app.route('/api/admin/stats', methods=['GET'])
+@admin_required
+def get_dashboard_stats(current_user):
+    try:
+        days = min(max(int(request.args.get('days', 30)), 1), 366)
+    except ValueError:
+        return jsonify({'message': 'days must be an integer'}), 400
+    try:
+        with get_connection() as connection:
+            return jsonify(stats.dashboard(connection, days=days))
+    except Error as e:
+        print(f"Error fetching dashboard stats: {e}")
+        return jsonify({'message': 'Failed to load stats'}), 500
+
+# Recompute booking_stats from the bookings tables (backfill / repair)
+@app.route('/api/admin/stats/rebuild', methods=['POST'])
+@admin_required
+def rebuild_dashboard_stats(current_user):
+    try:
+        with get_connection() as connection:
+            return jsonify(stats.rebuild(connection))
+    except Error as e:
+        print(f"Error rebuilding dashboard stats: {e}")
+        return jsonify({'message': 'Failed to rebuild stats'}), 500
+
+# Reference data cache hit/miss counters for this worker
+@app.route('/api/admin/cache-stats', methods=['GET'])
+@admin_required
+def get_cache_stats(current_user):
+    return jsonify(dict(reference_cache.stats(), journey_planner=journey_planner.stats(), auth_tokens=token_cache.stats(),
+                        pnr=pnr_cache.stats(), idempotency=idempotency_store.stats()))
+
+# Prometheus scrape endpoint: request/query histograms plus pool, cache and
+# hashing gauges for this worker
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    if not metrics.METRICS_ENABLED:
+        return jsonify({'message': 'Metrics are disabled'}), 404
+
+    gauges = {}
+    def gauge(name, label, value, amount):
+        gauges.setdefault(name, {})[((label,), (value,)) if label else ((), ())] = amount
+
+    for pool_name, pool in (('sync', pool_stats()), ('async', async_pool_stats())):
+        for key in ('size', 'open', 'idle', 'in_use', 'waiters', 'checkouts', 'timeouts'):
+            gauge(f"db_pool_{key}", 'pool', pool_name, pool.get(key, 0))
+    caches = dict(reference_cache.stats(), auth_tokens=token_cache.stats(), pnr=pnr_cache.stats())
+    for cache_name, counters in caches.items():
+        for key in ('hits', 'misses', 'entries', 'hit_rate'):
+            gauge(f"cache_{key}", 'cache', cache_name, counters[key])
+    for key, value in hashing_pool.stats().items():
+        gauge(f"password_hashing_{key}", None, None, value)
+    gauge('journey_planner_connections', None, None, journey_planner.stats()['connections'])
+    live = live_store.stats()
+    for key in ('trains', 'watched_trains', 'subscriptions', 'updates', 'notifications', 'poll_errors'):
+        gauge(f"live_status_{key}", None, None, live[key])
+    feedback = feedback_queue.stats()
+    for key in ('pending', 'written', 'direct', 'failures', 'rejected'):
+        gauge(f"feedback_queue_{key}", None, None, feedback[key])
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
 
 # Bullet-proof Route to Initialize Database on Railway
 @app.route('/init-db')
 def init_database():
-    outputs = []
-    try:
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor(dictionary=True)
-        
-        # 1. Run Schema statement by statement
-        with open('schema.sql', 'r') as f:
-            schema = f.read()
-        
-        for statement in schema.split(';'):
-            stmt = statement.strip()
-            if stmt:
-                try:
-                    cursor.execute(stmt)
-                    outputs.append(f"Executed: {stmt[:30]}...")
-                except Exception as e:
-                    outputs.append(f"Skipped/Error: {stmt[:30]}... ({str(e)})")
-        
-        connection.commit()
-
-        # 2. Explicitly ensure Admin user exists (Password: admin123)
-        # We handle this in Python to be 100% sure the bcrypt hash is correct
-        cursor.execute("SELECT * FROM admin WHERE username = 'admin'")
-        if not cursor.fetchone():
-            hashed_pw = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            cursor.execute("INSERT INTO admin (username, password, is_admin) VALUES ('admin', %s, 1)", (hashed_pw,))
-            outputs.append("SUCCESS: Created default admin user (admin / admin123)")
-        else:
-            outputs.append("INFO: Admin user already exists")
-
-        # 3. Populate ALL Stations
-        REAL_STATIONS = [
-            ("New Delhi", "NDLS"), ("Mumbai Central", "MMCT"), ("Kolkata Howrah", "HWH"),
-            ("Chennai Central", "MAS"), ("KSR Bengaluru", "SBC"), ("Hyderabad Deccan", "HYB"),
-            ("Ahmedabad Junction", "ADI"), ("Pune Junction", "PUNE"), ("Jaipur Junction", "JP"),
-            ("Lucknow Charbagh", "LKO"), ("Varanasi Junction", "BSB"), ("Trivandrum Central", "TVC"),
-            ("Patna Junction", "PNBE"), ("Bhopal Junction", "BPL")
-        ]
-        
-        station_map = {}
-        for name, code in REAL_STATIONS:
-            cursor.execute("SELECT station_id FROM stations WHERE code = %s", (code,))
-            row = cursor.fetchone()
-            if not row:
-                cursor.execute("INSERT INTO stations (station_name, code) VALUES (%s, %s)", (name, code))
-                station_map[name] = cursor.lastrowid
-            else:
-                station_map[name] = row['station_id']
-        
-        # 4. Populate Full Train List + Synthetic Pairs (Ensure every city is connected)
-        cursor.execute("SELECT COUNT(*) as count FROM train_schedule")
-        if cursor.fetchone()['count'] < 50: # Only populate if list is truncated
-            import random
-            REAL_TRAINS_DATA = [
-                ("Vande Bharat Exp (22436)", "New Delhi", "Varanasi Junction", "06:00:00", "14:00:00", 1128),
-                ("Mumbai Rajdhani (12951)", "Mumbai Central", "New Delhi", "17:00:00", "08:30:00", 1200),
-                ("Coromandel Express (12841)", "Kolkata Howrah", "Chennai Central", "15:20:00", "16:50:00", 1500),
-                ("Karnataka Express (12627)", "KSR Bengaluru", "New Delhi", "19:20:00", "09:00:00", 1400)
-            ]
-            
-            # Add specified real trains
-            for t_name, src, dest, dep, arr, seats in REAL_TRAINS_DATA:
-                s_id = station_map.get(src)
-                d_id = station_map.get(dest)
-                if s_id and d_id:
-                    cursor.execute("INSERT IGNORE INTO train_schedule (train_name, source_station_id, destination_station_id, departure_time, arrival_time, total_seats) VALUES (%s, %s, %s, %s, %s, %s)", (t_name, s_id, d_id, dep, arr, seats))
-
-            # Generate ALL city pairs Express trains
-            cities = list(station_map.keys())
-            for source in cities:
-                for destination in cities:
-                    if source == destination: continue
-                    train_name = f"{source.split(' ')[0]}-{destination.split(' ')[0]} Express"
-                    dep_time = f"{random.randint(5, 22):02d}:{random.choice(['00', '30'])}:00"
-                    arr_time = f"{(random.randint(5, 22) + 6) % 24:02d}:00:00"
-                    cursor.execute("INSERT IGNORE INTO train_schedule (train_name, source_station_id, destination_station_id, departure_time, arrival_time, total_seats) VALUES (%s, %s, %s, %s, %s, 1000)", 
-                                   (train_name, station_map[source], station_map[destination], dep_time, arr_time))
-
-        connection.commit()
-        cursor.close()
-        connection.close()
-        
-        return f"<h3>Database Restored & Populated!</h3><p>All city pairs are now connected.</p><br><a href='/'>Go to Home</a>"
+    try:
+        with get_connection() as connection:
+            outputs, counts = seed_database(connection, schema_path='schema.sql')
+        reference_cache.invalidate('stations', 'schedules')
+        journey_planner.invalidate()
+        return (
+            f"<h3>Database Restored & Populated!</h3>"
+            f"<p>{counts['stations']} stations and {counts['schedules']} trains loaded. All city pairs are now connected.</p>"
+            f"<br><a href='/'>Go to Home</a>"
+        )
     except Exception as e:
         return f"Database initialization failed: {str(e)}"
 
-# Disable Browser Caching
+# Build the journey planner's connection arrays in the background at startup
+threading.Thread(target=journey_planner.warm, args=(get_connection,), daemon=True).start()
+
+# Fingerprint static asset URLs with a content hash (url_for('static', ...) -> ?v=<hash>)
+_static_fingerprints = {}
+
+def static_fingerprint(filename):
+    path = os.path.join(app.static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _static_fingerprints.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'rb') as f:
+        fingerprint = hashlib.sha1(f.read()).hexdigest()[:12]
+    _static_fingerprints[filename] = (mtime, fingerprint)
+    return fingerprint
+
+@app.url_defaults
+def add_static_fingerprint(endpoint, values):
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        fingerprint = static_fingerprint(values['filename'])
+        if fingerprint:
+            values['v'] = fingerprint
+
+# Per-endpoint browser caching policy. Anything not listed (auth, bookings,
+# admin data, feedback) is never stored.
+CACHE_POLICIES = {
+    'static': 'static',
+    'serve_static': 'revalidate',
+    'serve_index': 'revalidate',
+    'get_stations': 'revalidate',
+    'get_schedules': 'revalidate',
+    'get_schedule_by_id': 'revalidate'
+}
+
 @app.after_request
 def add_header(response):
+    policy = CACHE_POLICIES.get(request.endpoint, 'no-store')
+
+    # Fingerprinted assets never change under the same URL
+    if policy == 'static' and request.args.get('v') and \
+            request.args.get('v') == static_fingerprint(request.view_args['filename']):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
+    if policy in ('static', 'revalidate'):
+        response.headers['Cache-Control'] = 'no-cache'
+        if response.status_code == 200 and not response.is_streamed and not response.get_etag()[0]:
+            response.add_etag()
+        return response.make_conditional(request)
+
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '-1'
@@ -716,4 +1081,4 @@ def add_header(response):
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
-    app.run(host='0.0.0.0', port=port) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,218 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+import aiomysql
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import aiodb
+import livestatus
+import metrics
+from app import app as flask_app
+from inventory import fold_leg_availability, leg_availability_query
+from livestatus import live_store
+from pnr import batch_response, parse_batch, pnr_cache, public_response, refresh_statement, store_summaries, summary_query
+from queries import parse_search, search_legs, search_response, search_statement
+from serializer import encode as encode_json
+
+# Async entry point (SERVER_MODE=async, see gunicorn.conf.py). The read-heavy
+# routes below - schedule search, single and batch PNR lookup and live status
+# long-polls and streams - run natively on the event
+# loop with an aiomysql pool, so one process can keep thousands of them in
+# flight while they wait on MySQL. Every other route is the unchanged Flask
+# app, run on a thread pool of ASYNC_WSGI_THREADS threads.
+ASYNC_WSGI_THREADS = int(os.getenv('ASYNC_WSGI_THREADS', 16))
+
+# Same headers the Flask app sends for these routes (CORS + no-store policy)
+RESPONSE_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Expose-Headers': 'X-Next-After-Id',
+    'Cache-Control': 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0',
+    'Pragma': 'no-cache',
+    'Expires': '-1'
+}
+
+
+# Same encoder as the Flask app's jsonify so both modes return identical bodies
+def json_response(data, status=200):
+    return Response(encode_json(data) + b'\n', status_code=status,
+                    media_type='application/json', headers=RESPONSE_HEADERS)
+
+
+# Same request metrics as the Flask hooks, under the same endpoint names
+def timed(handler):
+    if not metrics.METRICS_ENABLED:
+        return handler
+
+    async def timed_handler(request):
+        metrics.start_request(handler.__name__)
+        response = await handler(request)
+        metrics.finish_request(handler.__name__, request.method, response.status_code, request.url.path,
+                               request.client.host if request.client else None)
+        return response
+    return timed_handler
+
+
+@timed
+async def search_schedules(request):
+    try:
+        search = parse_search(request.query_params)
+    except ValueError as e:
+        return json_response({'message': str(e)}, 400)
+
+    try:
+        async with aiodb.get_connection() as connection:
+            async with connection.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(*search_statement(search))
+                schedules = list(await cursor.fetchall())
+
+            availability = {}
+            if search['travel_date'] and schedules:
+                legs, total_seats = search_legs(search, schedules)
+                async with connection.cursor() as cursor:
+                    await cursor.execute(*leg_availability_query(search['travel_date'], legs, search['seat_class']))
+                    availability = fold_leg_availability(await cursor.fetchall(), legs, total_seats, search['seat_class'])
+
+        return json_response(search_response(search, schedules, availability))
+    except Exception as e:
+        print(f"Error in search_schedules: {e}")
+        return json_response({'results': [], 'message': 'Error searching schedules'}, 500)
+
+
+# pnr.lookup on the async pool: cached responses first, then one
+# primary-key read of booking_summary; bookings without a summary row get one
+# written (the pool is in autocommit mode)
+async def lookup_pnrs(booking_ids):
+    found, missing = pnr_cache.get_many(booking_ids)
+    if not missing:
+        return found
+    async with aiodb.get_connection() as connection:
+        async with connection.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(*summary_query(missing))
+            found.update(store_summaries(await cursor.fetchall()))
+            unwritten = [booking_id for booking_id in missing if booking_id not in found]
+            if unwritten and await cursor.execute(*refresh_statement(unwritten)):
+                await cursor.execute(*summary_query(unwritten))
+                found.update(store_summaries(await cursor.fetchall()))
+    return found
+
+
+@timed
+async def get_booking(request):
+    booking_id = request.path_params['booking_id']
+    try:
+        booking = (await lookup_pnrs([booking_id])).get(booking_id)
+        if booking is None:
+            return json_response({}, 404)
+
+        return json_response(public_response(booking))
+    except Exception as e:
+        print(f"Error fetching booking: {e}")
+        return json_response({}, 500)
+
+
+@timed
+async def get_bookings_batch(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    try:
+        booking_ids = parse_batch(data)
+    except ValueError as e:
+        return json_response({'message': str(e)}, 400)
+    try:
+        return json_response(batch_response(booking_ids, await lookup_pnrs(booking_ids)))
+    except Exception as e:
+        print(f"Error fetching bookings: {e}")
+        return json_response({'message': 'Error fetching bookings'}, 500)
+
+
+@timed
+async def get_live_status(request):
+    train_number = request.path_params['train_number']
+    try:
+        since, wait = livestatus.parse_wait(request.query_params)
+    except ValueError as e:
+        return json_response({'message': str(e)}, 400)
+    state = live_store.get(train_number)
+    if wait and live_store.version(train_number) <= since:
+        state = await live_store.wait_async(train_number, since, wait)
+    if state is None:
+        return json_response({'message': 'No live status for this train'}, 404)
+    return json_response(state)
+
+
+async def stream_live_status(request):
+    try:
+        trains = livestatus.parse_stream_trains(request.query_params)
+    except ValueError as e:
+        return json_response({'message': str(e)}, 400)
+
+    async def events():
+        subscriber = live_store.subscribe(livestatus.AsyncSubscriber(trains))
+        try:
+            yield livestatus.RETRY_FRAME + live_store.frames(trains)
+            while True:
+                changed = await subscriber.wait(livestatus.LIVE_HEARTBEAT)
+                yield live_store.frames(changed) if changed else livestatus.HEARTBEAT_FRAME
+        finally:
+            live_store.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type='text/event-stream',
+                             headers=dict(RESPONSE_HEADERS, **{'X-Accel-Buffering': 'no'}))
+
+
+# The worker's live status poller, on the event loop instead of a thread
+async def poll_live_status():
+    while True:
+        started = time.perf_counter()
+        try:
+            async with aiodb.get_connection() as connection:
+                async with connection.cursor() as cursor:
+                    await cursor.execute(*live_store.poll_statement())
+                    rows = await cursor.fetchall()
+            live_store.apply_poll(rows, time.perf_counter() - started)
+        except Exception as e:
+            live_store.poll_failed(e)
+        await asyncio.sleep(livestatus.LIVE_POLL_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await aiodb.pool.open()
+    live_store.poller = 'async'
+    poller = asyncio.create_task(poll_live_status())
+    try:
+        yield
+    finally:
+        poller.cancel()
+        await aiodb.pool.close()
+
+
+def create_app():
+    return Starlette(
+        routes=[
+            Route('/api/schedules/search', search_schedules, methods=['GET']),
+            Route('/api/bookings/batch', get_bookings_batch, methods=['POST']),
+            Route('/api/bookings/{booking_id:int}', get_booking, methods=['GET']),
+            Route('/api/live/stream', stream_live_status, methods=['GET']),
+            Route('/api/live/{train_number}', get_live_status, methods=['GET']),
+            # Everything else, including other methods on the paths above
+            Mount('/', app=WSGIMiddleware(flask_app, workers=ASYNC_WSGI_THREADS))
+        ],
+        lifespan=lifespan
+    )
+
+
+app = create_app()
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+import jwt
+from dotenv import load_dotenv
+from flask import g, jsonify, request
+
+load_dotenv()
+
+# Signing keys. JWT_KEYS holds "kid:secret" pairs separated by commas; new
+# tokens are signed with JWT_ACTIVE_KID and carry it in their header, and any
+# listed key still verifies. Tokens without a kid (issued before rotation
+# support) are checked against SECRET_KEY.
+SECRET_KEY = os.getenv('SECRET_KEY') or 'super_secret_railway_key_2024'
+LEGACY_KID = 'default'
+JWT_ALGORITHM = 'HS256'
+TOKEN_LIFETIME_HOURS = int(os.getenv('JWT_LIFETIME_HOURS', 24))
+TOKEN_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', 10000))
+
+
+def _load_keys():
+    keys = {LEGACY_KID: SECRET_KEY}
+    for pair in filter(None, (p.strip() for p in os.getenv('JWT_KEYS', '').split(','))):
+        kid, _, secret = pair.partition(':')
+        if kid and secret:
+            keys[kid.strip()] = secret.strip()
+    return keys
+
+
+JWT_KEYS = _load_keys()
+JWT_ACTIVE_KID = os.getenv('JWT_ACTIVE_KID') or LEGACY_KID
+if JWT_ACTIVE_KID not in JWT_KEYS:
+    raise RuntimeError(f"JWT_ACTIVE_KID '{JWT_ACTIVE_KID}' is not listed in JWT_KEYS")
+
+
+# Verified token claims, keyed by a digest of the token. A hit skips the HMAC
+# check and JSON parsing; entries expire with the token's own exp and are
+# dropped if their key is retired from JWT_KEYS.
+class TokenCache:
+    def __init__(self, max_size=TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+
+    def get(self, digest):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            claims, kid, expires_at = entry
+            if (expires_at is not None and expires_at <= now) or kid not in JWT_KEYS:
+                del self._entries[digest]
+                self._counters['expired'] += 1
+                return None
+            self._entries.move_to_end(digest)
+            self._counters['hits'] += 1
+            return claims
+
+    def put(self, digest, claims, kid):
+        with self._lock:
+            self._entries[digest] = (claims, kid, claims.get('exp'))
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return dict(
+                self._counters,
+                entries=len(self._entries),
+                hit_rate=round(self._counters['hits'] / lookups, 4) if lookups else 0.0
+            )
+
+
+token_cache = TokenCache()
+
+
+def issue_token(user, is_admin=False, hours=TOKEN_LIFETIME_HOURS):
+    claims = {
+        'user': user,
+        'is_admin': is_admin,
+        'exp': datetime.now(timezone.utc) + timedelta(hours=hours)
+    }
+    headers = None if JWT_ACTIVE_KID == LEGACY_KID else {'kid': JWT_ACTIVE_KID}
+    return jwt.encode(claims, JWT_KEYS[JWT_ACTIVE_KID], algorithm=JWT_ALGORITHM, headers=headers)
+
+
+# Return the token's claims, raising jwt.InvalidTokenError if it is invalid
+def verify_token(token):
+    digest = hashlib.sha256(token.encode('utf-8')).digest()
+    claims = token_cache.get(digest)
+    if claims is not None:
+        return claims
+
+    kid = jwt.get_unverified_header(token).get('kid') or LEGACY_KID
+    key = JWT_KEYS.get(kid)
+    if key is None:
+        raise jwt.InvalidTokenError(f"Unknown key id: {kid}")
+    claims = jwt.decode(token, key, algorithms=[JWT_ALGORITHM])
+    token_cache.put(digest, claims, kid)
+    return claims
+
+
+# Claims of the request's bearer token, or None when it has none or it is
+# not valid (for routes that passengers and admins both use)
+def request_identity():
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    try:
+        return verify_token(token.strip())
+    except jwt.InvalidTokenError:
+        return None
+
+
+# Authentication decorator shared by every protected route. The decoded
+# claims are stored on flask.g.identity and the user name is passed to the
+# view as its first argument.
+def auth_required(admin=False):
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            header = request.headers.get('Authorization', '')
+            scheme, _, token = header.partition(' ')
+            if not header:
+                return jsonify({'message': 'Token is missing!'}), 401
+            if scheme.lower() != 'bearer' or not token.strip():
+                return jsonify({'message': 'Token is invalid!'}), 401
+            try:
+                claims = verify_token(token.strip())
+            except jwt.ExpiredSignatureError:
+                return jsonify({'message': 'Token has expired!'}), 401
+            except jwt.InvalidTokenError:
+                return jsonify({'message': 'Token is invalid!'}), 401
+            if admin and not claims.get('is_admin', False):
+                return jsonify({'message': 'Admin access required!'}), 403
+            g.identity = claims
+            return f(claims.get('user'), *args, **kwargs)
+        return decorated
+    return decorator
+
+
+token_required = auth_required()
+admin_required = auth_required(admin=True)
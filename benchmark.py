@@ -0,0 +1,415 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlsplit
+
+# Load test and benchmark suite for the booking API.
+#
+# Drives a weighted mix of realistic traffic - schedule search, schedule
+# detail, booking creation, PNR lookup and the admin bookings listing - from
+# one asyncio client at a fixed concurrency, against each SERVER_MODE started
+# with gunicorn (or an already running server). Reports throughput and
+# p50/p95/p99 latency per endpoint, measures MySQL statements per request for
+# each endpoint from the server's Questions counter, and writes everything as
+# JSON so a later run can be compared against it (--compare).
+#
+# Requests are built from ids and station codes sampled from the configured
+# database, which --seed-db first fills with a synthetic network through
+# seed.py (the same code as init_db.py).
+
+ENDPOINTS = ('search', 'detail', 'book', 'pnr', 'admin')
+DEFAULT_MIX = 'search=50,detail=20,book=10,pnr=15,admin=5'
+# Days ahead that generated bookings are spread over, so trains do not sell out
+BOOKING_DAYS = 30
+
+
+# Minimal HTTP/1.1 request; returns (status, whether the server keeps the
+# connection open, body). Sync gunicorn workers close after every response.
+async def _request(reader, writer, host, method, path, body=None, headers=None):
+    lines = [f"{method} {path} HTTP/1.1", f"Host: {host}", 'Connection: keep-alive']
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    if body is not None:
+        lines += ['Content-Type: application/json', f"Content-Length: {len(body)}"]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + (body or b''))
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    chunked = False
+    keep_alive = True
+    while True:
+        line = (await reader.readline()).strip()
+        if not line:
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+        elif name.lower() == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+        elif name.lower() == 'connection' and 'close' in value.lower():
+            keep_alive = False
+    if not chunked:
+        return status, keep_alive, await reader.readexactly(length)
+    chunks = []
+    while True:
+        size = int((await reader.readline()).strip().split(b';')[0], 16)
+        chunks.append((await reader.readexactly(size + 2))[:-2])
+        if size == 0:
+            return status, keep_alive, b''.join(chunks)
+
+
+def parse_mix(text):
+    mix = {}
+    for part in filter(None, (p.strip() for p in text.split(','))):
+        endpoint, _, weight = part.partition('=')
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{endpoint}' (expected one of: {', '.join(ENDPOINTS)})")
+        mix[endpoint] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError('The traffic mix needs at least one endpoint with a positive weight')
+    return mix
+
+
+# Request generator for the traffic mix, built from data sampled out of the
+# database. PNRs of bookings created during the run are looked up as well.
+class Workload:
+    def __init__(self, mix, routes, schedule_ids, pnrs, admin_token, seed):
+        self.mix = mix
+        self.routes = routes
+        self.schedule_ids = schedule_ids
+        self.pnrs = pnrs
+        self.admin_token = admin_token
+        self.rng = random.Random(seed)
+        self.endpoints = list(mix)
+        self.weights = [mix[e] for e in self.endpoints]
+        self.booked = 0
+
+    def pick(self):
+        return self.rng.choices(self.endpoints, self.weights)[0]
+
+    # (method, path, body, headers) for one request to `endpoint`
+    def request(self, endpoint):
+        rng = self.rng
+        travel_date = (date.today() + timedelta(days=rng.randint(1, BOOKING_DAYS))).isoformat()
+        if endpoint == 'search':
+            source, destination = rng.choice(self.routes)
+            return 'GET', f"/api/schedules/search?from={source}&to={destination}&date={travel_date}", None, None
+        if endpoint == 'detail':
+            return 'GET', f"/api/schedules/{rng.choice(self.schedule_ids)}", None, None
+        if endpoint == 'book':
+            self.booked += 1
+            body = json.dumps({
+                'passenger_name': f"Bench Passenger {self.booked}",
+                'passenger_email': f"bench{self.booked}@example.com",
+                'schedule_id': rng.choice(self.schedule_ids),
+                'travel_date': travel_date,
+                'amount': 500,
+                'payment_method': 'card'
+            }).encode()
+            return 'POST', '/api/bookings', body, None
+        if endpoint == 'pnr':
+            return 'GET', f"/api/bookings/{rng.choice(self.pnrs) if self.pnrs else 1}", None, None
+        if endpoint == 'admin':
+            return 'GET', '/api/bookings?limit=100', None, {'Authorization': f"Bearer {self.admin_token}"}
+        raise ValueError(endpoint)
+
+    def record(self, endpoint, status, body):
+        if endpoint == 'book' and status == 200:
+            try:
+                self.pnrs.append(json.loads(body)['booking_id'])
+            except (ValueError, KeyError):
+                pass
+
+
+def load_workload(connection, mix, seed, sample=1000):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT MIN(schedule_id), MAX(schedule_id) FROM train_schedule")
+        low, high = cursor.fetchone()
+        if low is None:
+            raise RuntimeError('No schedules in the database; run with --seed-db or init_db.py first')
+        # Random ids across the whole key range rather than the first rows
+        rng = random.Random(seed)
+        picks = sorted({rng.randint(low, high) for _ in range(sample)})
+        cursor.execute(
+            f"""
+            SELECT ts.schedule_id, s1.code, s2.code
+            FROM train_schedule ts
+            JOIN stations s1 ON s1.station_id = ts.source_station_id
+            JOIN stations s2 ON s2.station_id = ts.destination_station_id
+            WHERE ts.schedule_id IN ({', '.join(['%s'] * len(picks))})
+            """,
+            picks
+        )
+        rows = cursor.fetchall()
+        cursor.execute("SELECT booking_id FROM bookings ORDER BY booking_id DESC LIMIT %s", (sample,))
+        pnrs = [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+    if not rows:
+        raise RuntimeError('Could not sample any schedules with both stations')
+
+    from auth import issue_token
+    return Workload(
+        mix,
+        routes=[(source, destination) for _, source, destination in rows],
+        schedule_ids=[schedule_id for schedule_id, _, _ in rows],
+        pnrs=pnrs,
+        admin_token=issue_token('admin', is_admin=True),
+        seed=seed
+    )
+
+
+# MySQL statements executed so far by the whole server
+def _questions(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+        return int(cursor.fetchone()[1])
+    finally:
+        cursor.close()
+
+
+# One keep-alive client sending requests until the deadline (or max_requests);
+# `endpoint` pins it to a single endpoint instead of the mix
+async def _client(base, workload, deadline, samples, endpoint=None, max_requests=None):
+    parts = urlsplit(base)
+    writer = None
+    sent = 0
+    try:
+        while time.monotonic() < deadline and (max_requests is None or sent < max_requests):
+            name = endpoint or workload.pick()
+            method, path, body, headers = workload.request(name)
+            sent += 1
+            sample = samples[name]
+            started = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+                status, keep_alive, payload = await _request(reader, writer, parts.netloc, method, path, body, headers)
+            except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                sample['statuses']['connection_error'] = sample['statuses'].get('connection_error', 0) + 1
+                keep_alive = False
+            else:
+                sample['latencies'].append(time.perf_counter() - started)
+                sample['statuses'][str(status)] = sample['statuses'].get(str(status), 0) + 1
+                workload.record(name, status, payload)
+            if not keep_alive and writer is not None:
+                writer.close()
+                writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    return round(values[min(int(len(values) * fraction), len(values) - 1)] * 1000, 2)
+
+
+def _summary(latencies, statuses, elapsed):
+    latencies = sorted(latencies)
+    errors = sum(count for status, count in statuses.items()
+                 if status in ('connection_error', '429') or status.startswith('5'))
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'statuses': dict(sorted(statuses.items())),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) * 1000 / len(latencies), 2) if latencies else None,
+        'p50_ms': _percentile(latencies, 0.50),
+        'p95_ms': _percentile(latencies, 0.95),
+        'p99_ms': _percentile(latencies, 0.99)
+    }
+
+
+# Drive `concurrency` keep-alive clients with the traffic mix for `duration` seconds
+async def run_load(base, workload, concurrency, duration):
+    samples = {endpoint: {'latencies': [], 'statuses': {}} for endpoint in workload.endpoints}
+    started = time.monotonic()
+    await asyncio.gather(*(
+        _client(base, workload, started + duration, samples) for _ in range(concurrency)
+    ))
+    elapsed = time.monotonic() - started
+
+    statuses = {}
+    for sample in samples.values():
+        for status, count in sample['statuses'].items():
+            statuses[status] = statuses.get(status, 0) + count
+    return {
+        'overall': _summary([l for s in samples.values() for l in s['latencies']], statuses, elapsed),
+        'endpoints': {endpoint: _summary(s['latencies'], s['statuses'], elapsed) for endpoint, s in samples.items()}
+    }
+
+
+# Statements per request for each endpoint: a short sequential pass per
+# endpoint between two reads of the server's Questions counter. Assumes
+# nothing else is using the database meanwhile.
+def profile_queries(base, workload, connection, requests_per_endpoint):
+    result = {}
+    for endpoint in workload.endpoints:
+        samples = {endpoint: {'latencies': [], 'statuses': {}}}
+        before = _questions(connection)
+        asyncio.run(_client(base, workload, time.monotonic() + 60, samples,
+                            endpoint=endpoint, max_requests=requests_per_endpoint))
+        after = _questions(connection)
+        served = len(samples[endpoint]['latencies'])
+        # The second SHOW STATUS counts itself
+        result[endpoint] = round((after - before - 1) / served, 2) if served else None
+    return result
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(base, timeout=30):
+    parts = urlsplit(base)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((parts.hostname, parts.port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {base} did not start within {timeout}s")
+
+
+def bench_server(base, workload, connection, args):
+    # Warm caches, pools and the planner before measuring
+    asyncio.run(run_load(base, workload, min(args.concurrency, 8), 1))
+    queries = profile_queries(base, workload, connection, args.profile_requests) if args.profile_requests else {}
+    result = asyncio.run(run_load(base, workload, args.concurrency, args.duration))
+    for endpoint, count in queries.items():
+        result['endpoints'][endpoint]['db_queries_per_request'] = count
+    return result
+
+
+# Start gunicorn in the given mode, benchmark it, and stop it
+def bench_mode(mode, workload, connection, args):
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f"127.0.0.1:{port}", '--workers', str(args.workers),
+         '--backlog', str(max(args.concurrency * 2, 2048)), '--log-level', 'warning'],
+        env=dict(os.environ, SERVER_MODE=mode)
+    )
+    try:
+        _wait_ready(base)
+        return bench_server(base, workload, connection, args)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+# Per-endpoint p95 and throughput change against a saved run; returns the
+# regressions beyond `tolerance` percent
+def compare(baseline, current, tolerance):
+    regressions = []
+    for target, result in current['results'].items():
+        before_result = baseline.get('results', {}).get(target)
+        if not before_result:
+            continue
+        for endpoint, now in result['endpoints'].items():
+            before = before_result['endpoints'].get(endpoint)
+            if not before or not before.get('p95_ms') or now['p95_ms'] is None:
+                continue
+            p95_change = (now['p95_ms'] - before['p95_ms']) * 100 / before['p95_ms']
+            rps_change = ((now['throughput_rps'] - before['throughput_rps']) * 100 / before['throughput_rps']
+                          if before['throughput_rps'] else 0.0)
+            print(f"{target:>8} {endpoint:<7} p95 {before['p95_ms']:>9.2f} -> {now['p95_ms']:>9.2f} ms ({p95_change:+.1f}%)"
+                  f"  rps {before['throughput_rps']:>8.1f} -> {now['throughput_rps']:>8.1f} ({rps_change:+.1f}%)",
+                  file=sys.stderr)
+            if p95_change > tolerance:
+                regressions.append(f"{target} {endpoint}: p95 {p95_change:+.1f}%")
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    from db import get_connection
+
+    parser = argparse.ArgumentParser(description='Load test the booking API with mixed traffic and save the results as JSON')
+    parser.add_argument('--modes', default='sync,async', help='comma separated SERVER_MODEs to start and compare')
+    parser.add_argument('--url', help='benchmark an already running server instead of starting one per mode')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"endpoint weights (default {DEFAULT_MIX})")
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=30, help='seconds of mixed traffic per mode')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers per mode')
+    parser.add_argument('--profile-requests', type=int, default=50,
+                        help='sequential requests per endpoint used to count DB queries (0 to skip)')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for the workload and generated data')
+    parser.add_argument('--seed-db', action='store_true', help='create the schema and seed a synthetic network first')
+    parser.add_argument('--synthetic-stations', type=int, default=500)
+    parser.add_argument('--synthetic-schedules', type=int, default=20000)
+    parser.add_argument('--output', help='write the results JSON here')
+    parser.add_argument('--compare', help='previous results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=20, help='allowed p95 increase in percent before failing')
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    with get_connection() as connection:
+        if args.seed_db:
+            from cache import reference_cache
+            from seed import seed_database
+
+            _, counts = seed_database(
+                connection,
+                schema_path='schema.sql',
+                synthetic_stations=args.synthetic_stations,
+                synthetic_schedules=args.synthetic_schedules,
+                seed=args.seed
+            )
+            reference_cache.invalidate('stations', 'schedules')
+            print(f"Seeded: {json.dumps(counts)}", file=sys.stderr)
+
+        workload = load_workload(connection, mix, args.seed)
+        if args.url:
+            results = {args.url: bench_server(args.url.rstrip('/'), workload, connection, args)}
+        else:
+            results = {mode: bench_mode(mode, workload, connection, args) for mode in args.modes.split(',')}
+
+    report = {
+        'meta': {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'commit': _git_commit(),
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'workers': args.workers,
+            'mix': mix,
+            'seed': args.seed
+        },
+        'results': results
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance}%: {'; '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,444 @@
+import hashlib
+import hmac
+import secrets
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from mysql.connector import Error, IntegrityError, errorcode
+
+import passengers
+import waitlist
+from inventory import allocate_seats, seat_class_for
+from pnr import pnr_cache, refresh as refresh_summary
+from seats import MAX_GROUP_SIZE, PREFERENCES, decode_segments, encode_segments, free_count, leg_occupancy, seat_index, unmark
+from stats import record_booking
+from stops import leg_for, load_stops
+
+REQUIRED_FIELDS = (
+    'passenger_name', 'passenger_email', 'schedule_id',
+    'travel_date', 'amount', 'payment_method'
+)
+
+DEADLOCK_RETRIES = 3
+
+# Share of the fare refunded on cancellation by hours left before the train
+# leaves the boarding station; nothing is refunded inside the last window.
+# Waitlisted bookings never held a seat and are refunded in full.
+REFUND_RULES = (
+    (48, 90),
+    (12, 75),
+    (4, 50)
+)
+CANCEL_BATCH_LIMIT = 1000
+CANCEL_TOKEN_BYTES = 24
+
+
+class BookingError(Exception):
+    status = 400
+
+
+class SeatUnavailable(BookingError):
+    status = 409
+
+
+class BookingNotFound(BookingError):
+    status = 404
+
+
+class CancelNotAllowed(BookingError):
+    status = 409
+
+
+# A passenger cancels with the secret handed out once in the booking
+# response. Only its SHA-256 is stored, and idempotent replays of the
+# booking response leave it out (app.py). Booking ids are sequential and PNR
+# status is public, so nothing readable from a lookup can authorize a cancel.
+def new_cancel_token():
+    token = secrets.token_urlsafe(CANCEL_TOKEN_BYTES)
+    return token, hash_cancel_token(token)
+
+
+def hash_cancel_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def validate_booking(data):
+    if not data:
+        raise BookingError('Booking details are required')
+    missing = [field for field in REQUIRED_FIELDS if data.get(field) in (None, '')]
+    if missing:
+        raise BookingError(f"Missing fields: {', '.join(missing)}")
+    try:
+        travel_date = datetime.strptime(str(data['travel_date']), '%Y-%m-%d').date()
+        schedule_id = int(data['schedule_id'])
+        seat_count = int(data.get('seat_count') or 1)
+    except ValueError:
+        raise BookingError('Invalid schedule_id, seat_count or travel_date (expected YYYY-MM-DD)')
+    if not 1 <= seat_count <= MAX_GROUP_SIZE:
+        raise BookingError(f"seat_count must be between 1 and {MAX_GROUP_SIZE}")
+    preference = data.get('seat_preference') or None
+    if preference and preference not in PREFERENCES:
+        raise BookingError(f"seat_preference must be one of: {', '.join(PREFERENCES)}")
+    return schedule_id, travel_date, seat_count, preference
+
+
+# Allocate seats for the leg (from_station .. to_station, the whole route by
+# default) from the inventory row, then create passenger, booking, seat
+# reservations, tickets, payment and the PNR summary row and update the
+# dashboard aggregates in the same transaction. When the class is sold out
+# (or already has a waitlist) and the request sets "waitlist", the booking
+# joins the waitlist instead, without seats or tickets until promoted. The
+# locked inventory row stops overselling the class, and the
+# seat_reservations primary key (schedule, date, seat) is a second guard
+# against two bookings sharing a seat. Any failure rolls back the whole
+# transaction, inventory included, so nothing is left half-written.
+def _book(connection, data, schedule_id, travel_date, seat_count, preference):
+    seat_class = seat_class_for(data)
+    now = datetime.now()
+
+    cursor = connection.cursor()
+    try:
+        stops = load_stops(cursor, schedule_id)
+        if len(stops) < 2:
+            raise BookingError('Unknown schedule')
+        try:
+            from_stop, to_stop = leg_for(stops, data.get('from_station'), data.get('to_station'))
+        except ValueError as e:
+            raise BookingError(str(e))
+
+        seats = allocate_seats(connection, cursor, schedule_id, travel_date, seat_class, seat_count, preference,
+                               from_stop=from_stop, to_stop=to_stop)
+        if seats is None:
+            raise BookingError('Unknown schedule')
+        if not seats and not data.get('waitlist'):
+            raise SeatUnavailable(f"Not enough {seat_class} seats left on {travel_date}")
+
+        passenger_id = passengers.upsert(cursor, data['passenger_name'], data['passenger_email'])
+
+        cancel_token, cancel_token_hash = new_cancel_token()
+        cursor.execute(
+            """
+            INSERT INTO bookings (passenger_id, passenger_name, schedule_id, booking_date, status, cancel_token_hash)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            """,
+            (passenger_id, data['passenger_name'], schedule_id, now.date(), 'CONFIRMED' if seats else 'WAITLISTED',
+             cancel_token_hash)
+        )
+        booking_id = cursor.lastrowid
+
+        waitlist_number = None
+        if seats:
+            cursor.executemany(
+                """
+                INSERT INTO seat_reservations (schedule_id, travel_date, seat_number, from_stop, to_stop, seat_class, booking_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """,
+                [(schedule_id, travel_date, seat, from_stop, to_stop, seat_class, booking_id) for seat in seats]
+            )
+
+            cursor.executemany(
+                "INSERT INTO tickets (booking_id, seat_number, travel_date) VALUES (%s, %s, %s)",
+                [(booking_id, seat, travel_date) for seat in seats]
+            )
+        else:
+            waitlist_number = waitlist.enqueue(cursor, booking_id, schedule_id, travel_date, seat_class,
+                                               from_stop, to_stop, seat_count, preference)
+            if waitlist_number is None:
+                raise SeatUnavailable(f"The {seat_class} waitlist for {travel_date} is full")
+
+        cursor.execute(
+            "INSERT INTO payments (booking_id, amount, payment_date, payment_method) VALUES (%s, %s, %s, %s)",
+            (booking_id, data['amount'], now, data['payment_method'])
+        )
+
+        # Denormalized row read by PNR status lookups
+        refresh_summary(cursor, [booking_id])
+        # Last before the commit: the route's stats row is shared across trains
+        record_booking(cursor, schedule_id, now.date(), len(seats), data['amount'], data['payment_method'])
+
+        connection.commit()
+    except IntegrityError as e:
+        connection.rollback()
+        if e.errno == errorcode.ER_DUP_ENTRY:
+            raise SeatUnavailable(f"Seat already booked on {travel_date}, please retry")
+        if e.errno == errorcode.ER_NO_REFERENCED_ROW_2:
+            raise BookingError('Unknown schedule')
+        raise
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    return {
+        'booking_id': booking_id,
+        'passenger_id': passenger_id,
+        'schedule_id': schedule_id,
+        'status': 'CONFIRMED' if seats else 'WAITLISTED',
+        'waitlist_number': waitlist_number,
+        'seat_number': seats[0] if seats else None,
+        'seat_numbers': seats,
+        'seat_class': seat_class,
+        'from_station': stops[from_stop]['code'],
+        'to_station': stops[to_stop]['code'],
+        'travel_date': travel_date.isoformat(),
+        # Shown once: the passenger needs it to cancel
+        'cancel_token': cancel_token
+    }
+
+
+def book_seat(connection, data):
+    schedule_id, travel_date, seat_count, preference = validate_booking(data)
+    for attempt in range(DEADLOCK_RETRIES):
+        try:
+            booking = _book(connection, data, schedule_id, travel_date, seat_count, preference)
+            break
+        except Error as e:
+            if e.errno != errorcode.ER_LOCK_DEADLOCK or attempt == DEADLOCK_RETRIES - 1:
+                raise
+
+    # A new waitlist entry may fit a leg the entries ahead of it do not. The
+    # booking is already committed, so this runs outside the retries above
+    # and a failure leaves it WAITLISTED for promote_pending to pick up.
+    if booking['status'] == 'WAITLISTED':
+        try:
+            seats = waitlist.promote(connection, schedule_id, travel_date,
+                                     booking['seat_class']).get(booking['booking_id'], [])
+        except Exception as e:
+            print(f"Error promoting waitlist after booking {booking['booking_id']}: {e}")
+            seats = []
+        if seats:
+            booking.update(status='CONFIRMED', seat_number=seats[0], seat_numbers=seats)
+    return booking
+
+
+def refund_percent(hours_left):
+    for hours, percent in REFUND_RULES:
+        if hours_left >= hours:
+            return percent
+    return 0
+
+
+# Seats held by a booking: (travel_date, class, from_stop, to_stop, seat
+# labels) from its reservation rows; bookings made before reservations
+# existed fall back to their tickets over the whole route
+def _held_seats(cursor, booking_id):
+    cursor.execute(
+        "SELECT travel_date, seat_class, from_stop, to_stop, seat_number FROM seat_reservations WHERE booking_id = %s",
+        (booking_id,)
+    )
+    rows = cursor.fetchall()
+    if rows:
+        return rows[0][:4] + ([row[4] for row in rows],)
+    cursor.execute("SELECT travel_date, seat_number FROM tickets WHERE booking_id = %s ORDER BY ticket_id", (booking_id,))
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    seat_class = seat_class_for({'seat_number': rows[0][1]})
+    return rows[0][0], seat_class, 0, None, [row[1] for row in rows]
+
+
+# Release a confirmed booking's seats from the inventory bitmaps; the caller
+# holds the inventory row lock
+def _release_seats(cursor, schedule_id, travel_date, seat_class, from_stop, to_stop, labels):
+    key = (schedule_id, travel_date, seat_class)
+    cursor.execute(
+        "SELECT capacity, segments, seat_map FROM seat_inventory WHERE schedule_id = %s AND travel_date = %s AND seat_class = %s",
+        key
+    )
+    row = cursor.fetchone()
+    if row is not None:
+        capacity, segments, seat_map = row
+        to_stop = segments if to_stop is None else min(to_stop, segments)
+        indexes = [index for index in (seat_index(seat_class, label) for label in labels)
+                   if index is not None and index < capacity]
+        maps = decode_segments(seat_map, segments, capacity)
+        for segment in range(from_stop, to_stop):
+            maps[segment] = unmark(maps[segment], indexes)
+        cursor.execute(
+            """
+            UPDATE seat_inventory SET remaining = %s, seat_map = %s
+            WHERE schedule_id = %s AND travel_date = %s AND seat_class = %s
+            """,
+            (free_count(leg_occupancy(maps, 0, segments), capacity), encode_segments(maps, capacity)) + key
+        )
+
+
+def _cancel(connection, booking_id, cancel_token=None, reason=None):
+    now = datetime.now()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT b.schedule_id, b.status, b.booking_date, b.cancel_token_hash, py.amount, py.payment_method
+            FROM bookings b
+            LEFT JOIN payments py ON py.booking_id = b.booking_id
+            WHERE b.booking_id = %s
+            """,
+            (booking_id,)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            raise BookingNotFound('Booking not found')
+        schedule_id, status, booking_date, token_hash, amount, payment_method = row
+        # Bookings made before cancel tokens have none and need an admin
+        if cancel_token is not None and not (
+                token_hash and hmac.compare_digest(token_hash, hash_cancel_token(cancel_token))):
+            raise BookingNotFound('Booking not found')
+        if status == 'CANCELLED':
+            raise CancelNotAllowed('Booking is already cancelled')
+
+        cursor.execute(
+            "SELECT travel_date, seat_class, from_stop FROM waitlist WHERE booking_id = %s",
+            (booking_id,)
+        )
+        entry = cursor.fetchone()
+        held = _held_seats(cursor, booking_id)
+        if held is None and entry is None:
+            raise CancelNotAllowed('Booking has no tickets to cancel')
+        travel_date, seat_class = (held or entry)[:2]
+
+        # Lock in the same order as booking and promotion (inventory row, then
+        # the booking). The reads above end first so the ones below see
+        # whatever a promotion committed while we waited for the lock.
+        connection.rollback()
+        cursor.execute(
+            """
+            SELECT waiting FROM seat_inventory WHERE schedule_id = %s AND travel_date = %s AND seat_class = %s
+            FOR UPDATE
+            """,
+            (schedule_id, travel_date, seat_class)
+        )
+        inventory = cursor.fetchone()
+        cursor.execute("SELECT status FROM bookings WHERE booking_id = %s FOR UPDATE", (booking_id,))
+        status = cursor.fetchone()[0]
+        if status == 'CANCELLED':
+            raise CancelNotAllowed('Booking is already cancelled')
+
+        held = _held_seats(cursor, booking_id) if status == 'CONFIRMED' else None
+        from_stop = held[2] if held else entry[2]
+        cursor.execute(
+            """
+            SELECT ts.departure_time, ss.departure_offset
+            FROM train_schedule ts
+            LEFT JOIN schedule_stops ss ON ss.schedule_id = ts.schedule_id AND ss.stop_sequence = %s
+            WHERE ts.schedule_id = %s
+            """,
+            (from_stop, schedule_id)
+        )
+        departure_time, offset = cursor.fetchone()
+        departs = (datetime.combine(travel_date, datetime.min.time()) + (departure_time or timedelta())
+                   + timedelta(minutes=offset or 0))
+        if departs <= now:
+            raise CancelNotAllowed('The train has already left, the booking can no longer be cancelled')
+
+        tickets = 0
+        if held:
+            tickets = len(held[4])
+            _release_seats(cursor, schedule_id, travel_date, seat_class, held[2], held[3], held[4])
+            cursor.execute("DELETE FROM seat_reservations WHERE booking_id = %s", (booking_id,))
+            percent = refund_percent((departs - now).total_seconds() / 3600)
+        else:
+            waitlist.withdraw(cursor, booking_id, schedule_id, travel_date, seat_class)
+            percent = 100
+
+        refund = (Decimal(amount or 0) * percent / 100).quantize(Decimal('0.01'))
+        cursor.execute(
+            "UPDATE bookings SET status = 'CANCELLED', cancelled_at = %s WHERE booking_id = %s",
+            (now, booking_id)
+        )
+        cursor.execute(
+            """
+            INSERT INTO refunds (booking_id, amount, refund_percent, status, reason, created_at)
+            VALUES (%s, %s, %s, 'PENDING', %s, %s)
+            """,
+            (booking_id, refund, percent, reason, now)
+        )
+        refresh_summary(cursor, [booking_id])
+        record_booking(cursor, schedule_id, booking_date, -tickets, -refund, payment_method, bookings=-1)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    pnr_cache.invalidate(booking_id)
+
+    return {
+        'booking_id': booking_id,
+        'status': 'CANCELLED',
+        'cancelled_at': now.isoformat(),
+        'previous_status': status,
+        'tickets_released': tickets,
+        'refund': {'amount': str(refund), 'percent': percent, 'status': 'PENDING'},
+        # The class whose waitlist may now be promoted
+        'inventory': (schedule_id, travel_date, seat_class) if tickets and inventory and inventory[0] else None
+    }
+
+
+def _cancel_with_retry(connection, booking_id, cancel_token, reason):
+    for attempt in range(DEADLOCK_RETRIES):
+        try:
+            return _cancel(connection, booking_id, cancel_token, reason)
+        except Error as e:
+            if e.errno != errorcode.ER_LOCK_DEADLOCK or attempt == DEADLOCK_RETRIES - 1:
+                raise
+
+
+# Cancel a booking, record its refund, then promote the class's waitlist
+# into the released seats. With `cancel_token` (the passenger's own request)
+# it must be the token returned when the booking was made.
+def cancel_booking(connection, booking_id, cancel_token=None, reason=None):
+    result = _cancel_with_retry(connection, booking_id, cancel_token, reason)
+    inventory = result.pop('inventory')
+    result['promoted'] = len(waitlist.promote(connection, *inventory)) if inventory else 0
+    return result
+
+
+# Cancel many bookings (admin, e.g. a cancelled train), each in its own short
+# transaction, then run one promotion pass per affected class
+def cancel_bookings(connection, booking_ids, reason=None):
+    cancelled, failed = [], []
+    classes = set()
+    for booking_id in booking_ids:
+        try:
+            result = _cancel_with_retry(connection, booking_id, None, reason)
+        except BookingError as e:
+            failed.append({'booking_id': booking_id, 'message': str(e)})
+            continue
+        inventory = result.pop('inventory')
+        if inventory:
+            classes.add(inventory)
+        cancelled.append(result)
+    promoted = sum(len(waitlist.promote(connection, *key)) for key in sorted(classes))
+    return {'cancelled': cancelled, 'failed': failed, 'promoted': promoted}
+
+
+# Booking ids of a bulk cancel body {"booking_ids": [...], "reason": ...};
+# raises ValueError with the message for a 400
+def parse_cancel_batch(data):
+    booking_ids = data.get('booking_ids') if isinstance(data, dict) else None
+    if not isinstance(booking_ids, list) or not booking_ids:
+        raise ValueError('booking_ids must be a non-empty list')
+    if len(booking_ids) > CANCEL_BATCH_LIMIT:
+        raise ValueError(f"At most {CANCEL_BATCH_LIMIT} bookings per request")
+    try:
+        return list(dict.fromkeys(int(booking_id) for booking_id in booking_ids))
+    except (TypeError, ValueError):
+        raise ValueError('booking_ids must be a non-empty list')
+
+
+def refund_query(booking_id):
+    return (
+        """
+        SELECT r.booking_id, r.amount, r.refund_percent, r.status, r.reason, r.created_at, b.cancelled_at
+        FROM refunds r JOIN bookings b ON b.booking_id = r.booking_id
+        WHERE r.booking_id = %s
+        """,
+        (booking_id,)
+    )
+
+
+def refund_for(cursor, booking_id):
+    cursor.execute(*refund_query(booking_id))
+    return cursor.fetchone()
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+
+# Reference data cache tuning
+CACHE_TTL = float(os.getenv('CACHE_TTL', 300))
+# Bound on cached bodies per worker across all datasets; per-schedule entries
+# are least recently used first out, so crawling /api/schedules/<id> cannot
+# grow memory without limit
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 10000))
+CACHE_SIGNAL_DIR = os.getenv('CACHE_SIGNAL_DIR') or os.path.join(tempfile.gettempdir(), 'railway-cache')
+
+
+# A serialized body plus the validators used for conditional GETs
+CachedBody = namedtuple('CachedBody', ['body', 'etag', 'last_modified'])
+
+
+def make_cached_body(body):
+    return CachedBody(
+        body,
+        hashlib.sha1(body).hexdigest(),
+        datetime.now(timezone.utc).replace(microsecond=0)
+    )
+
+
+# Cache of pre-serialized JSON bodies for read-mostly datasets (stations, schedules).
+#
+# Every dataset has a version stamp kept in a small file under CACHE_SIGNAL_DIR.
+# A write in any gunicorn worker replaces that file, and every other worker
+# notices the new stamp on its next lookup (one stat() call) and drops its
+# copies. The TTL bounds staleness if the signal file is unavailable.
+class ReferenceCache:
+    def __init__(self, ttl=CACHE_TTL, signal_dir=CACHE_SIGNAL_DIR, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.signal_dir = signal_dir
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._counters = {}
+        try:
+            os.makedirs(signal_dir, exist_ok=True)
+        except OSError:
+            pass
+
+    def _signal_path(self, dataset):
+        return os.path.join(self.signal_dir, f"{dataset}.version")
+
+    def _read_version(self, dataset):
+        try:
+            st = os.stat(self._signal_path(dataset))
+            return (st.st_ino, st.st_mtime_ns)
+        except OSError:
+            return None
+
+    def _count(self, dataset, counter):
+        counters = self._counters.setdefault(dataset, {'hits': 0, 'misses': 0, 'expired': 0, 'invalidations': 0,
+                                                           'evictions': 0})
+        counters[counter] += 1
+
+    def _drop_dataset(self, dataset):
+        for key in [k for k in self._entries if k[0] == dataset]:
+            del self._entries[key]
+
+    # Return the CachedBody for (dataset, key), calling build() to produce the bytes on a miss
+    def get(self, dataset, key, build):
+        version = self._read_version(dataset)
+        now = time.monotonic()
+        with self._lock:
+            if self._versions.get(dataset, version) != version:
+                self._drop_dataset(dataset)
+                self._count(dataset, 'invalidations')
+            self._versions[dataset] = version
+            entry = self._entries.get((dataset, key))
+            if entry is not None:
+                cached, stored_at = entry
+                if now - stored_at < self.ttl:
+                    self._entries.move_to_end((dataset, key))
+                    self._count(dataset, 'hits')
+                    return cached
+                del self._entries[(dataset, key)]
+                self._count(dataset, 'expired')
+            self._count(dataset, 'misses')
+
+        body = build()
+        if body is None:
+            return None
+        cached = make_cached_body(body)
+        with self._lock:
+            # Only keep the result if no invalidation landed while building
+            if self._versions.get(dataset) == version:
+                self._entries[(dataset, key)] = (cached, now)
+                self._entries.move_to_end((dataset, key))
+                while len(self._entries) > self.max_entries:
+                    (evicted, _), _ = self._entries.popitem(last=False)
+                    self._count(evicted, 'evictions')
+        return cached
+
+    # Drop a dataset here and signal every other worker to do the same
+    def invalidate(self, *datasets):
+        for dataset in datasets:
+            path = self._signal_path(dataset)
+            try:
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    f.write(str(time.time_ns()))
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Cache signal error for {dataset}: {e}")
+            with self._lock:
+                self._drop_dataset(dataset)
+                self._versions[dataset] = self._read_version(dataset)
+                self._count(dataset, 'invalidations')
+
+    # Current stamp of a dataset, for in-memory structures built from it
+    def version(self, dataset):
+        return self._read_version(dataset)
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for dataset, counters in self._counters.items():
+                lookups = counters['hits'] + counters['misses']
+                result[dataset] = dict(
+                    counters,
+                    entries=sum(1 for k in self._entries if k[0] == dataset),
+                    hit_rate=round(counters['hits'] / lookups, 4) if lookups else 0.0
+                )
+            return result
+
+
+reference_cache = ReferenceCache()
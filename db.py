@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error
+from dotenv import load_dotenv
+
+import metrics
+
+# Load environment variables
+load_dotenv()
+
+# MySQL Configuration
+db_config = {
+    'host': os.getenv('DB_HOST'),
+    'user': os.getenv('DB_USER'),
+    'password': os.getenv('DB_PASSWORD'),
+    'database': os.getenv('DB_NAME')
+}
+
+# Pool tuning (all overridable through the environment)
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 8))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 1800))
+POOL_PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', 5))
+
+
+class PoolTimeout(Error):
+    pass
+
+
+class _PooledConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+# Bounded pool of MySQL connections shared by every request handled in this process
+class ConnectionPool:
+    def __init__(self, config, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 max_lifetime=POOL_MAX_LIFETIME, ping_after=POOL_PING_AFTER):
+        self.config = config
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = deque()
+        self._open = 0
+        self._in_use = 0
+        self._waiters = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _check_fork(self):
+        # Sockets inherited from the gunicorn master must never be shared with a
+        # worker, so a forked child starts with an empty pool. The inherited
+        # connections are dropped without close() to avoid sending COM_QUIT
+        # down a socket the parent still owns.
+        if self._pid != os.getpid():
+            with self._cond:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    def _connect(self):
+        return _PooledConnection(mysql.connector.connect(**self.config))
+
+    def _discard(self, entry):
+        try:
+            entry.connection.close()
+        except Error:
+            pass
+
+    def _is_usable(self, entry, now):
+        if self.max_lifetime and now - entry.created_at > self.max_lifetime:
+            self._recycled += 1
+            return False
+        if now - entry.last_used > self.ping_after:
+            try:
+                entry.connection.ping()
+            except Error:
+                return False
+        return True
+
+    def acquire(self):
+        self._check_fork()
+        started = time.monotonic()
+        deadline = started + self.timeout
+        entry = None
+        with self._cond:
+            self._waiters += 1
+            try:
+                while True:
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._open < self.size:
+                        self._open += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(msg=f"Timed out after {self.timeout}s waiting for a database connection")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters -= 1
+            waited = time.monotonic() - started
+            self._in_use += 1
+            self._checkouts += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+
+        # Validation and connecting happen outside the lock
+        try:
+            if entry is not None and not self._is_usable(entry, time.monotonic()):
+                self._discard(entry)
+                entry = None
+            if entry is None:
+                entry = self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._open -= 1
+                self._cond.notify()
+            raise
+        return entry
+
+    def release(self, entry, discard=False):
+        if self._pid != os.getpid():
+            return
+        if not discard:
+            try:
+                # Never hand the next borrower an open transaction or snapshot
+                if entry.connection.in_transaction or entry.connection.unread_result:
+                    entry.connection.rollback()
+            except Error:
+                discard = True
+        if discard:
+            self._discard(entry)
+        entry.last_used = time.monotonic()
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._open -= 1
+            else:
+                self._idle.append(entry)
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.pop())
+                self._open -= 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiters': self._waiters,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'recycled': self._recycled,
+                'avg_wait_ms': round(self._total_wait * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 3),
+                'pid': self._pid
+            }
+
+
+pool = ConnectionPool(db_config)
+
+
+# Borrow a pooled connection for the duration of a with-block. With metrics
+# on, every cursor it hands out is timed (see metrics.py).
+@contextmanager
+def get_connection():
+    if metrics.METRICS_ENABLED:
+        started = time.perf_counter()
+        entry = pool.acquire()
+        metrics.observe_pool_wait(time.perf_counter() - started)
+        connection = metrics.InstrumentedConnection(entry.connection)
+    else:
+        entry = pool.acquire()
+        connection = entry.connection
+    discard = False
+    try:
+        yield connection
+    except Error:
+        discard = not entry.connection.is_connected()
+        raise
+    finally:
+        pool.release(entry, discard=discard)
+
+
+def pool_stats():
+    return pool.stats()
@@ -0,0 +1,305 @@
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from mysql.connector import DataError, IntegrityError
+
+# Feedback is written behind the request: submissions go into a bounded
+# in-process queue and a background thread inserts them in multi-row
+# batches, once FEEDBACK_FLUSH_SIZE are waiting or every
+# FEEDBACK_FLUSH_INTERVAL seconds. When the queue is full the request writes
+# its own row directly, so nothing is dropped. On shutdown the queue is
+# flushed; whatever cannot be written then (database down) is spooled to
+# FEEDBACK_SPOOL_DIR and inserted by the next worker that starts. A batch
+# MySQL rejects is retried row by row; rows it still rejects are set aside in
+# rejected-*.jsonl files in the same directory for an operator to look at.
+FEEDBACK_QUEUE_SIZE = int(os.getenv('FEEDBACK_QUEUE_SIZE', 10000))
+FEEDBACK_FLUSH_SIZE = int(os.getenv('FEEDBACK_FLUSH_SIZE', 500))
+FEEDBACK_FLUSH_INTERVAL = float(os.getenv('FEEDBACK_FLUSH_INTERVAL', 1))
+# Longest pause between flush attempts while the database is unreachable;
+# the pause starts at FEEDBACK_FLUSH_INTERVAL and doubles per failure
+FEEDBACK_MAX_BACKOFF = float(os.getenv('FEEDBACK_MAX_BACKOFF', 30))
+FEEDBACK_SPOOL_DIR = os.getenv('FEEDBACK_SPOOL_DIR') or os.path.join(tempfile.gettempdir(), 'railway-feedback')
+
+FEEDBACK_PAGE_SIZE = 50
+FEEDBACK_MAX_PAGE_SIZE = 500
+MAX_MESSAGE_LENGTH = 5000
+COLUMNS = ('email', 'category', 'message', 'created_at')
+
+
+# Validated row for a submission {"email", "category", "message"}; raises
+# ValueError with the message for a 400
+def parse_feedback(data):
+    if not isinstance(data, dict):
+        raise ValueError('email, category and message are required')
+    email = str(data.get('email') or '').strip()
+    category = str(data.get('category') or '').strip()
+    message = str(data.get('message') or '').strip()
+    if not email or not category or not message:
+        raise ValueError('email, category and message are required')
+    if len(email) > 100 or len(category) > 50:
+        raise ValueError('email or category is too long')
+    if len(message) > MAX_MESSAGE_LENGTH:
+        raise ValueError(f"message must be at most {MAX_MESSAGE_LENGTH} characters")
+    return (email, category, message, datetime.now().replace(microsecond=0))
+
+
+# JSON line for a spooled row
+def _record(row):
+    email, category, message, created_at = row
+    return [email, category, message, created_at.isoformat()]
+
+
+def insert_rows(cursor, rows):
+    cursor.execute(
+        f"INSERT INTO feedbacks ({', '.join(COLUMNS)}) VALUES {', '.join(['(%s, %s, %s, %s)'] * len(rows))}",
+        [value for row in rows for value in row]
+    )
+
+
+class FeedbackQueue:
+    def __init__(self, max_size=FEEDBACK_QUEUE_SIZE, flush_size=FEEDBACK_FLUSH_SIZE,
+                 flush_interval=FEEDBACK_FLUSH_INTERVAL, spool_dir=FEEDBACK_SPOOL_DIR):
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.spool_dir = spool_dir
+        self.connection_factory = None
+        self.flusher = None
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._rows = deque()
+        self._closed = False
+        self._last_flush_seconds = None
+        self._counters = {'queued': 0, 'written': 0, 'batches': 0, 'direct': 0, 'failures': 0,
+                          'spooled': 0, 'recovered': 0, 'rejected': 0}
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    # Start the flusher thread of this worker (first submission)
+    def start(self, connection_factory):
+        if self.flusher is not None:
+            return
+        with self._lock:
+            if self.flusher is not None:
+                return
+            self.connection_factory = connection_factory
+            self.flusher = threading.Thread(target=self._flush_forever, daemon=True)
+            self.flusher.start()
+        atexit.register(self.close)
+
+    # Queue one row; when the queue is full (the database is falling behind)
+    # the row is written by the caller instead
+    def submit(self, connection_factory, row):
+        self.start(connection_factory)
+        with self._lock:
+            if len(self._rows) < self.max_size and not self._closed:
+                self._rows.append(row)
+                self._counters['queued'] += 1
+                if len(self._rows) >= self.flush_size:
+                    self._wake.notify()
+                return True
+        with connection_factory() as connection:
+            with connection.cursor() as cursor:
+                insert_rows(cursor, [row])
+            connection.commit()
+        self._count('direct')
+        return False
+
+    def _take(self, limit):
+        with self._lock:
+            return [self._rows.popleft() for _ in range(min(limit, len(self._rows)))]
+
+    def _write(self, rows):
+        started = time.perf_counter()
+        with self.connection_factory() as connection:
+            with connection.cursor() as cursor:
+                insert_rows(cursor, rows)
+            connection.commit()
+        with self._lock:
+            self._counters['written'] += len(rows)
+            self._counters['batches'] += 1
+            self._last_flush_seconds = time.perf_counter() - started
+
+    # Write rows one at a time after their batch failed (as importer.py
+    # does), so one bad row cannot hold back the others. Rows MySQL rejects
+    # are set aside; any other error (database down) ends the pass. Returns
+    # the rows still to be written.
+    def _write_each(self, rows):
+        pending = deque(rows)
+        rejected = []
+        written = 0
+        try:
+            with self.connection_factory() as connection:
+                with connection.cursor() as cursor:
+                    while pending:
+                        try:
+                            insert_rows(cursor, [pending[0]])
+                            connection.commit()
+                            written += 1
+                        except (DataError, IntegrityError) as e:
+                            connection.rollback()
+                            rejected.append(_record(pending[0]) + [str(e)])
+                        pending.popleft()
+        except Exception as e:
+            print(f"Error writing feedback rows: {e}")
+        self._count('written', written)
+        if rejected and self._spool('rejected', rejected):
+            self._count('rejected', len(rejected))
+        return list(pending)
+
+    # Write rows in FEEDBACK_FLUSH_SIZE batches. Returns the rows left
+    # unwritten because the database could not be reached.
+    def _write_rows(self, rows):
+        for start in range(0, len(rows), self.flush_size):
+            batch = rows[start:start + self.flush_size]
+            try:
+                self._write(batch)
+                continue
+            except Exception as e:
+                print(f"Error writing feedback batch: {e}")
+                self._count('failures')
+            left = self._write_each(batch)
+            if left:
+                return left + rows[start + self.flush_size:]
+        return []
+
+    # Write everything queued so far. Rows the database could not take go
+    # back to the front of the queue for the next attempt.
+    def flush(self):
+        while True:
+            rows = self._take(self.flush_size)
+            if not rows:
+                return True
+            left = self._write_rows(rows)
+            if left:
+                with self._lock:
+                    self._rows.extendleft(reversed(left))
+                return False
+
+    def _flush_forever(self):
+        self.recover()
+        backoff = 0
+        while True:
+            with self._lock:
+                if backoff:
+                    # A full queue wakes us on every submission; sit out the
+                    # whole pause unless the queue is closed
+                    deadline = time.monotonic() + backoff
+                    while not self._closed and time.monotonic() < deadline:
+                        self._wake.wait(deadline - time.monotonic())
+                elif len(self._rows) < self.flush_size and not self._closed:
+                    self._wake.wait(self.flush_interval)
+                if self._closed:
+                    return
+            if self.flush():
+                backoff = 0
+            else:
+                backoff = min(max(backoff * 2, self.flush_interval), FEEDBACK_MAX_BACKOFF)
+
+    # Flush on shutdown; rows the database does not take are spooled to disk
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wake.notify()
+        if self.connection_factory is None or self.flush():
+            return
+        rows = self._take(len(self._rows))
+        if self._spool('feedback', [_record(row) for row in rows]):
+            self._count('spooled', len(rows))
+
+    # Write JSON lines to a new <prefix>-*.jsonl file in the spool directory,
+    # renamed into place so a reader never sees half a file. Returns False
+    # when it could not be written.
+    def _spool(self, prefix, records):
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            path = os.path.join(self.spool_dir, f"{prefix}-{os.getpid()}-{time.time_ns()}.jsonl")
+            with open(path + '.tmp', 'w') as f:
+                for record in records:
+                    f.write(json.dumps(record) + '\n')
+            os.replace(path + '.tmp', path)
+            return True
+        except OSError as e:
+            print(f"Error spooling {len(records)} feedback rows: {e}")
+            return False
+
+    # Insert rows spooled by workers that shut down while the database was
+    # unavailable. A file is renamed before it is read, so only one worker
+    # picks it up. If the database goes away part way, the unwritten rows
+    # are spooled again and the rest wait for the next worker.
+    def recover(self):
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, 'feedback-*.jsonl'))):
+            claimed = f"{path}.{os.getpid()}.loading"
+            try:
+                os.rename(path, claimed)
+                with open(claimed) as f:
+                    rows = [(email, category, message, datetime.fromisoformat(created_at))
+                            for email, category, message, created_at in map(json.loads, f)]
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                print(f"Error recovering spooled feedback {path}: {e}")
+                try:
+                    os.rename(claimed, path)
+                except OSError:
+                    pass
+                continue
+            left = self._write_rows(rows)
+            if left and not self._spool('feedback', [_record(row) for row in left]):
+                os.rename(claimed, path)
+                return
+            os.remove(claimed)
+            self._count('recovered', len(rows) - len(left))
+            if left:
+                return
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._counters,
+                pending=len(self._rows),
+                last_flush_ms=round(self._last_flush_seconds * 1000, 3) if self._last_flush_seconds is not None else None
+            )
+
+
+feedback_queue = FeedbackQueue()
+
+
+# Admin listing filters: ?category=&q=<full-text search>&after_id=&limit=.
+# Pages are keyed on id (newest first) so each page is a range scan on the
+# primary key, or on idx_feedback_category with a category; q uses the
+# full-text index on message.
+def feedback_query(args):
+    try:
+        limit = min(max(int(args.get('limit', FEEDBACK_PAGE_SIZE)), 1), FEEDBACK_MAX_PAGE_SIZE)
+        after_id = int(args['after_id']) if args.get('after_id') else None
+    except ValueError:
+        raise ValueError('after_id and limit must be integers')
+    conditions = []
+    params = []
+    if after_id:
+        conditions.append("id < %s")
+        params.append(after_id)
+    if args.get('category'):
+        conditions.append("category = %s")
+        params.append(args['category'].strip())
+    if args.get('q', '').strip():
+        conditions.append("MATCH(message) AGAINST (%s IN BOOLEAN MODE)")
+        params.append(args['q'].strip())
+    query = f"""
+        SELECT id, email, category, message, created_at FROM feedbacks
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY id DESC LIMIT %s
+    """
+    return query, params + [limit], limit
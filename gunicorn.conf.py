@@ -0,0 +1,23 @@
+import os
+
+# Serving mode switch, read by gunicorn at startup (Procfile: `gunicorn`).
+#   SERVER_MODE=sync   app:app on sync workers (default)
+#   SERVER_MODE=async  asgi:app on uvicorn workers; search and PNR lookups
+#                      run on the event loop with an async MySQL pool
+# Bind address follows gunicorn's own default ($PORT when set).
+SERVER_MODE = os.getenv('SERVER_MODE', 'sync')
+
+if SERVER_MODE == 'sync':
+    wsgi_app = 'app:app'
+    worker_class = 'sync'
+elif SERVER_MODE == 'async':
+    wsgi_app = 'asgi:app'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    raise RuntimeError(f"SERVER_MODE must be 'sync' or 'async', not '{SERVER_MODE}'")
+
+
+# Flush the worker's queued feedback (feedback.py) before it exits
+def worker_exit(server, worker):
+    from feedback import feedback_queue
+    feedback_queue.close()
@@ -0,0 +1,278 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import g, jsonify, make_response, request
+from mysql.connector import IntegrityError, errorcode
+
+# Idempotency-Key support for write endpoints. The first request with a key
+# claims a row in idempotency_keys (primary key: hash of endpoint, user and
+# key) before the view runs and stores the response there when it finishes;
+# a retry with the same key is answered from that row with one primary-key
+# read instead of writing again. A duplicate that arrives while the first is
+# still running waits for it (polling the row, so it works across workers)
+# and then replays its response. Reusing a key for a different request body
+# is rejected.
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 24 * 3600))
+# How long a duplicate waits for the original request before giving up
+IDEMPOTENCY_WAIT = float(os.getenv('IDEMPOTENCY_WAIT', 10))
+# A claim older than this whose request never finished (the worker died) can
+# be taken over by a retry
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', 60))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+PURGE_BATCH_SIZE = 5000
+
+REPLAY_HEADER = 'Idempotent-Replayed'
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+class IdempotencyInProgress(Exception):
+    pass
+
+
+def key_hash(scope, key):
+    return hashlib.sha256(f"{scope}\n{key}".encode('utf-8')).digest()
+
+
+# Method, path, query string and body of the current request
+def request_fingerprint():
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.path}?{request.query_string.decode('latin-1')}\n".encode('utf-8'))
+    digest.update(request.get_data(cache=True))
+    return digest.digest()
+
+
+class IdempotencyStore:
+    def __init__(self, ttl=IDEMPOTENCY_TTL, wait=IDEMPOTENCY_WAIT, lock_timeout=IDEMPOTENCY_LOCK_TIMEOUT):
+        self.ttl = ttl
+        self.wait = wait
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._counters = {'claims': 0, 'replays': 0, 'waits': 0, 'conflicts': 0, 'timeouts': 0, 'takeovers': 0,
+                          'released': 0}
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    # One attempt to claim the key: True when claimed, the stored
+    # (status, mimetype, body) when the request already finished, or None
+    # while it is still running
+    def _try_claim(self, connection, digest, scope, fingerprint):
+        now = datetime.now()
+        cursor = connection.cursor()
+        try:
+            try:
+                cursor.execute(
+                    """
+                    INSERT INTO idempotency_keys (key_hash, scope, fingerprint, state, locked_until, expires_at, created_at)
+                    VALUES (%s, %s, %s, 'PENDING', %s, %s, %s)
+                    """,
+                    (digest, scope, fingerprint, now + timedelta(seconds=self.lock_timeout),
+                     now + timedelta(seconds=self.ttl), now)
+                )
+                connection.commit()
+                self._count('claims')
+                return True
+            except IntegrityError as e:
+                connection.rollback()
+                if e.errno != errorcode.ER_DUP_ENTRY:
+                    raise
+
+            cursor.execute(
+                """
+                SELECT fingerprint, state, locked_until, expires_at, response_status, response_type, response_body
+                FROM idempotency_keys WHERE key_hash = %s
+                """,
+                (digest,)
+            )
+            row = cursor.fetchone()
+            connection.commit()
+            if row is None:
+                return None
+            stored_fingerprint, state, locked_until, expires_at, status, mimetype, body = row
+
+            # Expired keys and abandoned claims are taken over in place
+            if expires_at <= now or (state == 'PENDING' and locked_until <= now):
+                cursor.execute(
+                    """
+                    UPDATE idempotency_keys
+                    SET scope = %s, fingerprint = %s, state = 'PENDING', locked_until = %s, expires_at = %s,
+                        created_at = %s, response_status = NULL, response_type = NULL, response_body = NULL
+                    WHERE key_hash = %s AND (expires_at <= %s OR (state = 'PENDING' AND locked_until <= %s))
+                    """,
+                    (scope, fingerprint, now + timedelta(seconds=self.lock_timeout),
+                     now + timedelta(seconds=self.ttl), now, digest, now, now)
+                )
+                taken = cursor.rowcount
+                connection.commit()
+                if taken:
+                    self._count('takeovers')
+                    return True
+                return None
+
+            if bytes(stored_fingerprint) != fingerprint:
+                self._count('conflicts')
+                raise IdempotencyConflict()
+            if state == 'DONE':
+                self._count('replays')
+                return status, mimetype, bytes(body or b'')
+            return None
+        finally:
+            cursor.close()
+
+    # Claim the key for this request. Returns None when the caller should run
+    # the request, or (status, mimetype, body) of the stored response to
+    # replay. Raises IdempotencyConflict when the key was used for another
+    # request and IdempotencyInProgress when the original is still running
+    # after `wait` seconds. No connection is held between polls.
+    def claim(self, connection_factory, digest, scope, fingerprint):
+        deadline = time.monotonic() + self.wait
+        delay = 0.05
+        waited = False
+        while True:
+            with connection_factory() as connection:
+                result = self._try_claim(connection, digest, scope, fingerprint)
+            if result is True:
+                return None
+            if result is not None:
+                return result
+            if not waited:
+                waited = True
+                self._count('waits')
+            if time.monotonic() >= deadline:
+                self._count('timeouts')
+                raise IdempotencyInProgress()
+            time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+            delay = min(delay * 2, 0.5)
+
+    def complete(self, connection_factory, digest, status, mimetype, body):
+        with connection_factory() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE idempotency_keys
+                    SET state = 'DONE', response_status = %s, response_type = %s, response_body = %s
+                    WHERE key_hash = %s
+                    """,
+                    (status, mimetype, body, digest)
+                )
+            connection.commit()
+
+    # Drop the claim of a request that failed on the server, so a retry
+    # runs it again
+    def release(self, connection_factory, digest):
+        self._count('released')
+        with connection_factory() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM idempotency_keys WHERE key_hash = %s AND state = 'PENDING'", (digest,))
+            connection.commit()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+idempotency_store = IdempotencyStore()
+
+
+# Body to store for a response, without the redacted fields
+def _stored_body(response, redact):
+    body = response.get_json(silent=True) if redact and response.is_json else None
+    if not isinstance(body, dict) or not redact & body.keys():
+        return response.get_data()
+    return json.dumps({key: value for key, value in body.items() if key not in redact}).encode('utf-8')
+
+
+# Decorator factory for write routes, applied below the auth decorators:
+#   idempotent = idempotency.idempotent(get_connection)
+# Requests without an Idempotency-Key header run as before. Keys are scoped
+# to the endpoint and, on authenticated routes, the user. Responses below
+# 500 are stored and replayed with an Idempotent-Replayed header; server
+# errors release the key so the client's retry runs again. Top-level JSON
+# fields named in `redact` (secrets such as a cancel token) are left out of
+# the stored copy, so they are never written to idempotency_keys and a
+# replay does not return them.
+def idempotent(connection_factory, redact=()):
+    redact = frozenset(redact)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if key is None:
+                return f(*args, **kwargs)
+            key = key.strip()
+            if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                return jsonify({'message': f"Idempotency-Key must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters"}), 400
+
+            identity = g.get('identity') or {}
+            scope = f"{request.endpoint}:{identity.get('user') or ''}"
+            digest = key_hash(scope, key)
+            try:
+                stored = idempotency_store.claim(connection_factory, digest, scope, request_fingerprint())
+            except IdempotencyConflict:
+                return jsonify({'message': 'Idempotency-Key was already used for a different request'}), 422
+            except IdempotencyInProgress:
+                return jsonify({'message': 'A request with this Idempotency-Key is still in progress, retry later'}), 409
+            if stored is not None:
+                status, mimetype, body = stored
+                response = make_response(body, status)
+                response.mimetype = mimetype
+                response.headers[REPLAY_HEADER] = 'true'
+                return response
+
+            try:
+                response = make_response(f(*args, **kwargs))
+            except Exception:
+                idempotency_store.release(connection_factory, digest)
+                raise
+            try:
+                if response.status_code >= 500 or response.is_streamed:
+                    idempotency_store.release(connection_factory, digest)
+                else:
+                    idempotency_store.complete(connection_factory, digest, response.status_code, response.mimetype,
+                                               _stored_body(response, redact))
+            except Exception as e:
+                # The write itself went through; the claim expires after
+                # IDEMPOTENCY_LOCK_TIMEOUT
+                print(f"Error storing idempotent response: {e}")
+            return response
+        return decorated
+    return decorator
+
+
+# Delete expired keys in primary-key batches (run from cron)
+def purge(connection, batch_size=PURGE_BATCH_SIZE):
+    deleted = 0
+    cursor = connection.cursor()
+    try:
+        while True:
+            cursor.execute("DELETE FROM idempotency_keys WHERE expires_at <= %s LIMIT %s", (datetime.now(), batch_size))
+            connection.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return deleted
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    from db import get_connection
+
+    parser = argparse.ArgumentParser(description='Idempotency keys')
+    parser.add_argument('command', choices=['purge'], help='delete expired keys')
+    parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with get_connection() as connection:
+        deleted = purge(connection, args.batch_size)
+    print(json.dumps({'deleted': deleted}, indent=2))
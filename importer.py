@@ -0,0 +1,226 @@
+import argparse
+import codecs
+import csv
+import json
+import re
+
+from mysql.connector import Error
+
+from seed import train_number
+from stops import backfill as backfill_stops
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+TIME_PATTERN = re.compile(r'^([01]?\d|2[0-3]):[0-5]\d(:[0-5]\d)?$')
+
+
+class ImportErrorReport:
+    def __init__(self):
+        self.errors = []
+        self.error_count = 0
+
+    def add(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': line, 'error': message})
+
+
+# Yield (line_number, row_dict) from a CSV or NDJSON byte stream without
+# reading it all into memory
+def read_rows(stream, fmt):
+    lines = codecs.iterdecode(stream, 'utf-8-sig')
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, {k.strip(): (v or '').strip() for k, v in row.items() if k}
+    elif fmt == 'ndjson':
+        for number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else {'_invalid': 'Row is not a JSON object'}
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def _chunks(rows, size):
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Insert one chunk with a single multi-row statement in its own transaction.
+# If the database rejects the chunk, retry its rows one at a time so only the
+# offending rows are reported and the rest still land.
+def _write_chunk(connection, cursor, statement, chunk, report):
+    try:
+        cursor.executemany(statement, [values for _, values in chunk])
+        connection.commit()
+        return len(chunk)
+    except Error:
+        connection.rollback()
+
+    written = 0
+    for line, values in chunk:
+        try:
+            cursor.execute(statement, values)
+            connection.commit()
+            written += 1
+        except Error as e:
+            connection.rollback()
+            report.add(line, e.msg)
+    return written
+
+
+def _result(written, report):
+    return {'imported': written, 'failed': report.error_count, 'errors': report.errors}
+
+
+def _validated_stations(rows, report):
+    for line, row in rows:
+        if '_invalid' in row:
+            report.add(line, row['_invalid'])
+            continue
+        name = str(row.get('station_name') or '').strip()
+        code = str(row.get('code') or '').strip().upper()
+        if not name or not code:
+            report.add(line, 'station_name and code are required')
+        elif len(code) > 10 or len(name) > 100:
+            report.add(line, 'station_name or code too long')
+        else:
+            yield line, (name, code)
+
+
+# Upsert stations keyed on their unique code
+def import_stations(connection, rows, chunk_size=IMPORT_CHUNK_SIZE):
+    report = ImportErrorReport()
+    statement = """
+        INSERT INTO stations (station_name, code) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE station_name = VALUES(station_name)
+    """
+    written = 0
+    cursor = connection.cursor()
+    try:
+        for chunk in _chunks(_validated_stations(rows, report), chunk_size):
+            written += _write_chunk(connection, cursor, statement, chunk, report)
+    finally:
+        cursor.close()
+    return _result(written, report)
+
+
+def _station_ids(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT code, station_id FROM stations")
+        return dict(cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+# Station id of a row's *_code column, or of its raw *_station_id when that
+# names an existing station; None otherwise
+def _resolve_station(row, prefix, station_ids, known_ids):
+    code = str(row.get(f"{prefix}_code") or '').strip().upper()
+    if code:
+        return station_ids.get(code)
+    try:
+        station_id = int(row.get(f"{prefix}_station_id") or 0)
+    except (TypeError, ValueError):
+        return None
+    return station_id if station_id in known_ids else None
+
+
+def _validated_schedules(rows, station_ids, report):
+    known_ids = set(station_ids.values())
+    for line, row in rows:
+        if '_invalid' in row:
+            report.add(line, row['_invalid'])
+            continue
+        train_name = str(row.get('train_name') or '').strip()
+        source = _resolve_station(row, 'source', station_ids, known_ids)
+        destination = _resolve_station(row, 'destination', station_ids, known_ids)
+        departure = str(row.get('departure_time') or '').strip()
+        arrival = str(row.get('arrival_time') or '').strip()
+        try:
+            total_seats = int(row.get('total_seats') or 0)
+        except (TypeError, ValueError):
+            total_seats = 0
+
+        if not train_name:
+            report.add(line, 'train_name is required')
+        elif not source or not destination:
+            report.add(line, 'Unknown source or destination station')
+        elif source == destination:
+            report.add(line, 'Source and destination must differ')
+        elif not TIME_PATTERN.match(departure) or not TIME_PATTERN.match(arrival):
+            report.add(line, 'departure_time and arrival_time must be HH:MM[:SS]')
+        elif total_seats <= 0:
+            report.add(line, 'total_seats must be a positive integer')
+        else:
+            number = str(row.get('train_number') or '').strip() or train_number(train_name)
+            yield line, (train_name, number, source, destination, departure, arrival, total_seats)
+
+
+# Upsert schedules keyed on (train_number, source, destination) like
+# seed.upsert_schedules, so re-importing a file updates the trains in place
+# and stays one statement per chunk; station codes are resolved with one
+# lookup for the whole import
+def import_schedules(connection, rows, chunk_size=IMPORT_CHUNK_SIZE):
+    report = ImportErrorReport()
+    station_ids = _station_ids(connection)
+    statement = """
+        INSERT INTO train_schedule
+        (train_name, train_number, source_station_id, destination_station_id, departure_time, arrival_time, total_seats)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            train_name = VALUES(train_name),
+            departure_time = VALUES(departure_time),
+            arrival_time = VALUES(arrival_time),
+            total_seats = VALUES(total_seats)
+    """
+    written = 0
+    cursor = connection.cursor()
+    try:
+        for chunk in _chunks(_validated_schedules(rows, station_ids, report), chunk_size):
+            written += _write_chunk(connection, cursor, statement, chunk, report)
+        # Imported trains run direct: give them their source and destination stops
+        backfill_stops(cursor)
+        connection.commit()
+    finally:
+        cursor.close()
+    return _result(written, report)
+
+
+IMPORTERS = {
+    'stations': import_stations,
+    'schedules': import_schedules
+}
+
+
+if __name__ == '__main__':
+    from db import get_connection
+    from cache import reference_cache
+
+    parser = argparse.ArgumentParser(description='Bulk import stations or schedules from CSV / NDJSON')
+    parser.add_argument('dataset', choices=sorted(IMPORTERS))
+    parser.add_argument('path', help='file to import (.csv, .ndjson or .jsonl)')
+    parser.add_argument('--format', choices=['csv', 'ndjson'], help='defaults to the file extension')
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format or ('csv' if args.path.endswith('.csv') else 'ndjson')
+    with open(args.path, 'rb') as f, get_connection() as connection:
+        result = IMPORTERS[args.dataset](connection, read_rows(f, fmt), chunk_size=args.chunk_size)
+    # Other processes' planners rebuild on the new schedules stamp
+    reference_cache.invalidate('stations', 'schedules')
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,301 @@
+import argparse
+import json
+from datetime import date
+
+from seats import allocate, decode_segments, encode_segments, free_count, leg_occupancy, mark, seat_index, seat_label
+
+# Share of a train's total_seats sold in each travel class
+SEAT_CLASSES = {
+    'SL': 0.55,
+    '3A': 0.25,
+    '2A': 0.13,
+    '1A': 0.07
+}
+DEFAULT_CLASS = 'SL'
+
+
+def class_capacity(total_seats, seat_class):
+    return int((total_seats or 0) * SEAT_CLASSES[seat_class])
+
+
+def seat_class_for(data):
+    seat_class = data.get('travel_class') or str(data.get('seat_number', '')).split('-')[0]
+    return seat_class if seat_class in SEAT_CLASSES else DEFAULT_CLASS
+
+
+# Create the counter row for (schedule, date, class) the first time it is sold,
+# with one segment per pair of consecutive stops
+def materialize(cursor, schedule_id, travel_date, seat_class):
+    cursor.execute(
+        """
+        INSERT IGNORE INTO seat_inventory (schedule_id, travel_date, seat_class, capacity, remaining, segments, seat_map)
+        SELECT schedule_id, %s, %s, FLOOR(total_seats * %s), FLOOR(total_seats * %s),
+               (SELECT GREATEST(COUNT(*) - 1, 1) FROM schedule_stops ss WHERE ss.schedule_id = ts.schedule_id), ''
+        FROM train_schedule ts WHERE schedule_id = %s
+        """,
+        (travel_date, seat_class, SEAT_CLASSES[seat_class], SEAT_CLASSES[seat_class], schedule_id)
+    )
+
+
+# Allocate `count` seats for stops from_stop .. to_stop (the whole route by
+# default) of (schedule, date, class) inside the caller's transaction, which
+# must not have written anything yet. The inventory row is locked with
+# SELECT ... FOR UPDATE, so allocations for the same class are serialized
+# across every worker, and the counter and segment bitmaps are updated
+# together. `remaining` counts seats free over the whole route. While anyone
+# is on the class's waitlist, freed seats belong to the queue (see
+# waitlist.promote), so nothing is sold directly. Returns the seat labels,
+# [] when there are not enough seats left, or None when the schedule does
+# not exist.
+def allocate_seats(connection, cursor, schedule_id, travel_date, seat_class, count=1, preference=None,
+                   from_stop=0, to_stop=None):
+    select = """
+        SELECT capacity, remaining, segments, seat_map, waiting FROM seat_inventory
+        WHERE schedule_id = %s AND travel_date = %s AND seat_class = %s
+        FOR UPDATE
+    """
+    params = (schedule_id, travel_date, seat_class)
+    cursor.execute(select, params)
+    row = cursor.fetchone()
+    if row is None:
+        # First sale for this date: create the row in its own short
+        # transaction (dropping the gap lock first) so concurrent first
+        # bookings do not deadlock, then lock it as usual
+        connection.rollback()
+        materialize(cursor, schedule_id, travel_date, seat_class)
+        connection.commit()
+        cursor.execute(select, params)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+
+    capacity, remaining, segments, seat_map, waiting = row
+    to_stop = segments if to_stop is None else min(to_stop, segments)
+    if waiting:
+        return []
+    if from_stop == 0 and to_stop == segments and remaining < count:
+        return []
+    maps = decode_segments(seat_map, segments, capacity)
+    indexes = allocate(leg_occupancy(maps, from_stop, to_stop), seat_class, capacity, count, preference)
+    if indexes is None:
+        return []
+
+    for segment in range(from_stop, to_stop):
+        maps[segment] = mark(maps[segment], indexes)
+    cursor.execute(
+        """
+        UPDATE seat_inventory SET remaining = %s, seat_map = %s
+        WHERE schedule_id = %s AND travel_date = %s AND seat_class = %s
+        """,
+        (free_count(leg_occupancy(maps, 0, segments), capacity), encode_segments(maps, capacity)) + params
+    )
+    return [seat_label(seat_class, index) for index in indexes]
+
+
+# Free seats per class on each schedule's leg for one date, straight from the
+# segment bitmaps. `legs` maps schedule_id -> (from_stop, to_stop) and
+# `total_seats` schedule_id -> total_seats; classes that have not been sold
+# yet are fully available.
+def leg_availability(cursor, travel_date, legs, total_seats, seat_class=None):
+    if not legs:
+        return {}
+    cursor.execute(*leg_availability_query(travel_date, legs, seat_class))
+    return fold_leg_availability(cursor.fetchall(), legs, total_seats, seat_class)
+
+
+# The seat_inventory read behind leg_availability, split from the folding
+# below so the async server can run it on its own driver
+def leg_availability_query(travel_date, legs, seat_class=None):
+    ids = list(legs)
+    query = f"""
+        SELECT schedule_id, seat_class, capacity, segments, seat_map FROM seat_inventory
+        WHERE travel_date = %s AND schedule_id IN ({', '.join(['%s'] * len(ids))})
+    """
+    params = [travel_date] + ids
+    if seat_class:
+        query += " AND seat_class = %s"
+        params.append(seat_class)
+    return query, params
+
+
+def fold_leg_availability(rows, legs, total_seats, seat_class=None):
+    classes = [seat_class] if seat_class else list(SEAT_CLASSES)
+    result = {
+        schedule_id: {c: class_capacity(total_seats.get(schedule_id), c) for c in classes}
+        for schedule_id in legs
+    }
+    for schedule_id, row_class, capacity, segments, seat_map in rows:
+        if row_class not in result[schedule_id]:
+            continue
+        start, end = legs[schedule_id]
+        maps = decode_segments(seat_map, segments, capacity)
+        result[schedule_id][row_class] = free_count(leg_occupancy(maps, start, min(end, segments)), capacity)
+    return result
+
+
+# Rewrite one class's seat maps and counter from its sold tickets, under the
+# inventory row lock, so the bitmaps and `remaining` agree again. Tickets
+# without a reservation row hold their seat over the whole route; legacy
+# labels that do not name a seat of the class take the lowest free seats.
+# The caller must start a new transaction for each call: the tickets read
+# is a plain consistent read, so it only sees bookings committed before the
+# inventory lock was taken if its snapshot begins after the lock. Returns the
+# rebuilt remaining count.
+def _rebuild(cursor, schedule_id, travel_date, seat_class, capacity, segments):
+    key = (schedule_id, travel_date, seat_class)
+    cursor.execute(
+        """
+        INSERT IGNORE INTO seat_inventory (schedule_id, travel_date, seat_class, capacity, remaining, segments)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        """,
+        key + (capacity, capacity, segments)
+    )
+    cursor.execute(
+        "SELECT capacity, segments FROM seat_inventory WHERE schedule_id = %s AND travel_date = %s AND seat_class = %s FOR UPDATE",
+        key
+    )
+    row = cursor.fetchone()
+    capacity, segments = row['capacity'], row['segments']
+    cursor.execute(
+        """
+        SELECT DISTINCT t.seat_number, r.seat_class, r.from_stop, r.to_stop
+        FROM tickets t
+        JOIN bookings b ON b.booking_id = t.booking_id
+        LEFT JOIN seat_reservations r ON r.booking_id = t.booking_id AND r.seat_number = t.seat_number
+        WHERE b.schedule_id = %s AND t.travel_date = %s AND b.status <> 'CANCELLED'
+        """,
+        (schedule_id, travel_date)
+    )
+    maps = [0] * segments
+    unplaced = 0
+    for ticket in cursor.fetchall():
+        label_class = ticket['seat_class'] or str(ticket['seat_number']).split('-')[0]
+        if (label_class if label_class in SEAT_CLASSES else DEFAULT_CLASS) != seat_class:
+            continue
+        index = seat_index(seat_class, ticket['seat_number'])
+        start = ticket['from_stop'] if ticket['from_stop'] is not None else 0
+        end = min(ticket['to_stop'], segments) if ticket['to_stop'] is not None else segments
+        if index is None or index >= capacity:
+            unplaced += 1
+            continue
+        for segment in range(start, end):
+            maps[segment] = mark(maps[segment], [index])
+    for _ in range(unplaced):
+        indexes = allocate(leg_occupancy(maps, 0, segments), seat_class, capacity)
+        if indexes is None:
+            break
+        maps = [mark(segment, indexes) for segment in maps]
+    remaining = free_count(leg_occupancy(maps, 0, segments), capacity)
+    cursor.execute(
+        """
+        UPDATE seat_inventory SET remaining = %s, seat_map = %s
+        WHERE schedule_id = %s AND travel_date = %s AND seat_class = %s
+        """,
+        (remaining, encode_segments(maps, capacity)) + key
+    )
+    return remaining
+
+
+# Recompute counters from tickets and report (optionally repair) any drift.
+# A seat sold on any leg is no longer free for the whole route, so sold
+# counts distinct seats. Tickets of cancelled bookings have been released.
+def reconcile(connection, from_date=None, fix=False):
+    from_date = from_date or date.today()
+    cursor = connection.cursor(dictionary=True)
+    try:
+        # Tickets sold per (schedule, date, class); legacy tickets without a
+        # reservation row fall back to the class prefix of their seat label
+        cursor.execute(
+            """
+            SELECT b.schedule_id, t.travel_date,
+                   COALESCE(r.seat_class, SUBSTRING_INDEX(t.seat_number, '-', 1)) as seat_class,
+                   COUNT(DISTINCT t.seat_number) as sold
+            FROM tickets t
+            JOIN bookings b ON b.booking_id = t.booking_id
+            LEFT JOIN seat_reservations r ON r.booking_id = t.booking_id AND r.seat_number = t.seat_number
+            WHERE t.travel_date >= %s AND b.status <> 'CANCELLED'
+            GROUP BY b.schedule_id, t.travel_date, seat_class
+            """,
+            (from_date,)
+        )
+        sold = {}
+        for row in cursor.fetchall():
+            seat_class = row['seat_class'] if row['seat_class'] in SEAT_CLASSES else DEFAULT_CLASS
+            key = (row['schedule_id'], row['travel_date'], seat_class)
+            sold[key] = sold.get(key, 0) + row['sold']
+
+        cursor.execute(
+            "SELECT schedule_id, travel_date, seat_class, capacity, remaining, segments FROM seat_inventory WHERE travel_date >= %s",
+            (from_date,)
+        )
+        recorded = {(r['schedule_id'], r['travel_date'], r['seat_class']): r for r in cursor.fetchall()}
+
+        missing_ids = sorted({key[0] for key in sold if key not in recorded})
+        # Capacity and segment count for counters that were never materialized
+        totals = {}
+        if missing_ids:
+            placeholders = ', '.join(['%s'] * len(missing_ids))
+            cursor.execute(
+                f"""
+                SELECT schedule_id, total_seats,
+                       (SELECT GREATEST(COUNT(*) - 1, 1) FROM schedule_stops ss WHERE ss.schedule_id = ts.schedule_id) as segments
+                FROM train_schedule ts WHERE schedule_id IN ({placeholders})
+                """,
+                missing_ids
+            )
+            totals = {r['schedule_id']: (r['total_seats'], r['segments']) for r in cursor.fetchall()}
+
+        drift = []
+        fixes = []
+        for key in sorted(set(sold) | set(recorded), key=lambda k: (k[0], k[1], k[2])):
+            schedule_id, travel_date, seat_class = key
+            row = recorded.get(key)
+            total_seats, segments = (None, row['segments']) if row else totals.get(schedule_id, (None, 1))
+            capacity = row['capacity'] if row else class_capacity(total_seats, seat_class)
+            expected = capacity - sold.get(key, 0)
+            if row is None or row['remaining'] != expected:
+                drift.append({
+                    'schedule_id': schedule_id,
+                    'travel_date': travel_date.isoformat(),
+                    'seat_class': seat_class,
+                    'capacity': capacity,
+                    'recorded': row['remaining'] if row else None,
+                    'expected': expected
+                })
+                fixes.append((drift[-1], capacity, segments))
+
+        # End the scan's snapshot: each rebuild must read the tickets as of
+        # its own inventory lock, or a booking committed since the scan would
+        # lose its seat in the bitmap. `expected` is then what the rebuild
+        # found under the lock.
+        connection.commit()
+        if fix and drift:
+            for entry, capacity, segments in fixes:
+                try:
+                    entry['expected'] = _rebuild(cursor, entry['schedule_id'], date.fromisoformat(entry['travel_date']),
+                                                 entry['seat_class'], capacity, segments)
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
+
+        return {'checked': len(set(sold) | set(recorded)), 'drift': drift, 'fixed': bool(fix and drift)}
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    from db import get_connection
+
+    parser = argparse.ArgumentParser(description='Reconcile seat_inventory counters against sold tickets')
+    parser.add_argument('--from-date', help='first travel date to check (YYYY-MM-DD, default today)')
+    parser.add_argument('--fix', action='store_true', help='rewrite drifted counters')
+    args = parser.parse_args()
+
+    with get_connection() as connection:
+        report = reconcile(
+            connection,
+            from_date=date.fromisoformat(args.from_date) if args.from_date else None,
+            fix=args.fix
+        )
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,745 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from cache import reference_cache
+from serializer import decode as decode_json, encode as encode_json
+
+# Live running status. Position events (a train arrived at or departed from a
+# station, optionally with its delay) are posted in batches to the ingestion
+# API, which derives each train's state - current and next station, delay and
+# expected arrival at every station still ahead - and stores it in
+# live_status, one row per train with a version that goes up on every change.
+#
+# Every worker keeps the latest states in memory and picks up changes made by
+# other workers with one query per LIVE_POLL_INTERVAL, so watchers never
+# touch MySQL. Watchers either long-poll GET /api/live/<train_number> or hold
+# a Server-Sent Events stream on /api/live/stream; each change is encoded
+# once and handed to every watcher of that train. Under SERVER_MODE=async
+# both run on the event loop, which is what makes tens of thousands of open
+# streams per worker practical. The Flask app only holds requests open when
+# LIVE_SYNC_PUSH is set (threaded dev server, gthread workers): on sync
+# gunicorn workers each stream or long-poll would pin a whole worker until
+# gunicorn's timeout killed it, so streams get a 503 and long-polls answer at
+# once, and the page falls back to polling.
+LIVE_SYNC_PUSH = os.getenv('LIVE_SYNC_PUSH', '0') == '1'
+# Seconds between polls when a client falls back to short polling
+LIVE_SHORT_POLL = int(os.getenv('LIVE_SHORT_POLL', 10))
+LIVE_POLL_INTERVAL = float(os.getenv('LIVE_POLL_INTERVAL', 1))
+# Re-read window covering ingestion transactions that commit out of order
+LIVE_POLL_OVERLAP = float(os.getenv('LIVE_POLL_OVERLAP', 5))
+# Trains with no event for this long are dropped from memory
+LIVE_STATE_TTL = int(os.getenv('LIVE_STATE_TTL', 6 * 3600))
+LIVE_MAX_WAIT = float(os.getenv('LIVE_MAX_WAIT', 25))
+LIVE_HEARTBEAT = float(os.getenv('LIVE_HEARTBEAT', 15))
+LIVE_STREAM_TRAINS = int(os.getenv('LIVE_STREAM_TRAINS', 50))
+LIVE_BATCH_LIMIT = int(os.getenv('LIVE_BATCH_LIMIT', 1000))
+# Delay (minutes) above which a train is shown as Delayed
+LIVE_LATE_MINUTES = int(os.getenv('LIVE_LATE_MINUTES', 5))
+
+EVENT_KINDS = ('arrived', 'departed')
+ROUTE_BATCH_SIZE = 1000
+
+
+def _parse_time(value):
+    moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    # Aware times are converted to the server's local clock, like datetime.now()
+    return moment.astimezone().replace(tzinfo=None) if moment.tzinfo else moment
+
+
+def parse_event(event):
+    if not isinstance(event, dict):
+        raise ValueError('must be an object')
+    train_number = str(event.get('train_number') or '').strip()
+    station = str(event.get('station') or '').strip().upper()
+    if not train_number or not station:
+        raise ValueError('train_number and station are required')
+    kind = event.get('event', 'departed')
+    if kind not in EVENT_KINDS:
+        raise ValueError(f"event must be one of: {', '.join(EVENT_KINDS)}")
+    try:
+        reported_at = _parse_time(event['reported_at']) if event.get('reported_at') else datetime.now()
+        delay = int(event['delay_minutes']) if event.get('delay_minutes') is not None else None
+        run_date = date.fromisoformat(event['run_date']) if event.get('run_date') else None
+    except (TypeError, ValueError):
+        raise ValueError('reported_at must be ISO 8601, delay_minutes an integer and run_date YYYY-MM-DD')
+    return {
+        'train_number': train_number,
+        'station': station,
+        'event': kind,
+        'reported_at': reported_at,
+        'delay_minutes': delay,
+        'run_date': run_date
+    }
+
+
+# Events of an ingestion request body {"events": [...]}; raises ValueError
+# with the message for a 400
+def parse_events(data):
+    events = data.get('events') if isinstance(data, dict) else None
+    if not isinstance(events, list) or not events:
+        raise ValueError('events must be a non-empty list')
+    if len(events) > LIVE_BATCH_LIMIT:
+        raise ValueError(f"At most {LIVE_BATCH_LIMIT} events per request")
+    parsed = []
+    for index, event in enumerate(events):
+        try:
+            parsed.append(parse_event(event))
+        except ValueError as e:
+            raise ValueError(f"Event {index}: {e}")
+    return parsed
+
+
+# Train numbers of a stream request (?trains=12627,12951)
+def parse_stream_trains(args):
+    trains = list(dict.fromkeys(t.strip() for t in args.get('trains', '').split(',') if t.strip()))
+    if not trains:
+        raise ValueError('trains must list at least one train number')
+    if len(trains) > LIVE_STREAM_TRAINS:
+        raise ValueError(f"At most {LIVE_STREAM_TRAINS} trains per stream")
+    return trains
+
+
+# (since, wait) of a long-poll request: answer once the train's version is
+# above `since`, or after `wait` seconds with the current state
+def parse_wait(args):
+    try:
+        since = int(args.get('since', 0))
+        wait = min(max(float(args.get('wait', 0)), 0), LIVE_MAX_WAIT)
+    except ValueError:
+        raise ValueError('since must be an integer and wait a number of seconds')
+    return since, wait
+
+
+# Routes of trains by number (a number can run on more than one route), read
+# with one query per batch of trains (plain cursor) and kept until the
+# schedules change. Unknown numbers are remembered as such.
+def load_routes(cursor, train_numbers):
+    routes = {train_number: [] for train_number in train_numbers}
+    numbers = list(train_numbers)
+    for start in range(0, len(numbers), ROUTE_BATCH_SIZE):
+        batch = numbers[start:start + ROUTE_BATCH_SIZE]
+        cursor.execute(
+            f"""
+            SELECT ts.train_number, ts.schedule_id, ts.train_name, TIME_TO_SEC(ts.departure_time),
+                   st.code, st.station_name, ss.arrival_offset, ss.departure_offset
+            FROM train_schedule ts
+            JOIN schedule_stops ss ON ss.schedule_id = ts.schedule_id
+            JOIN stations st ON st.station_id = ss.station_id
+            WHERE ts.train_number IN ({', '.join(['%s'] * len(batch))}) AND ts.departure_time IS NOT NULL
+            ORDER BY ts.train_number, ts.schedule_id, ss.stop_sequence
+            """,
+            tuple(batch)
+        )
+        current = None
+        for train_number, schedule_id, train_name, departure, code, name, arrival_offset, departure_offset in cursor.fetchall():
+            if current is None or current['schedule_id'] != schedule_id:
+                current = {'schedule_id': schedule_id, 'train_name': train_name, 'departure': int(departure),
+                           'stops': [], 'index': {}}
+                routes[train_number].append(current)
+            current['index'][code] = len(current['stops'])
+            current['stops'].append((code, name, arrival_offset, departure_offset))
+    return routes
+
+
+class RouteCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._version = None
+
+    def get_many(self, cursor, train_numbers):
+        version = reference_cache.version('schedules')
+        with self._lock:
+            if version != self._version:
+                self._routes = {}
+                self._version = version
+            found = {t: self._routes[t] for t in train_numbers if t in self._routes}
+        missing = [t for t in train_numbers if t not in found]
+        if missing:
+            loaded = load_routes(cursor, missing)
+            with self._lock:
+                if self._version == version:
+                    self._routes.update(loaded)
+            found.update(loaded)
+        return found
+
+
+route_cache = RouteCache()
+
+
+def _stop(route, position, start, delay):
+    code, name, arrival_offset, departure_offset = route['stops'][position]
+    scheduled = start + timedelta(minutes=arrival_offset if arrival_offset is not None else departure_offset)
+    return {
+        'code': code,
+        'name': name,
+        'scheduled_arrival': scheduled.isoformat(),
+        'expected_arrival': (scheduled + timedelta(minutes=max(delay, 0))).isoformat()
+    }
+
+
+# The state shown to watchers after `event`. The run's scheduled start is
+# run_date + departure_time when given, otherwise the daily run closest to
+# the report. Without delay_minutes the delay is how late the report is
+# against the timetable; it is carried unchanged to every station ahead.
+def derive_state(event, routes):
+    route = next((r for r in routes if event['station'] in r['index']), None)
+    if route is None:
+        if not routes:
+            raise ValueError(f"Unknown train {event['train_number']}")
+        raise ValueError(f"Train {event['train_number']} does not stop at {event['station']}")
+
+    position = route['index'][event['station']]
+    code, name, arrival_offset, departure_offset = route['stops'][position]
+    if event['event'] == 'arrived':
+        offset = arrival_offset if arrival_offset is not None else departure_offset
+    else:
+        offset = departure_offset if departure_offset is not None else arrival_offset
+    reported_at = event['reported_at']
+    # When the run would have left its first station, had it been on time
+    origin = reported_at - timedelta(minutes=offset)
+
+    if event['run_date']:
+        start = datetime.combine(event['run_date'], datetime.min.time()) + timedelta(seconds=route['departure'])
+    else:
+        guess = origin - timedelta(minutes=event['delay_minutes'] or 0)
+        midnight = datetime.combine(guess.date(), datetime.min.time())
+        start = min(
+            (midnight + timedelta(days=days, seconds=route['departure']) for days in (-1, 0, 1)),
+            key=lambda candidate: abs(candidate - guess)
+        )
+    delay = event['delay_minutes']
+    if delay is None:
+        delay = round((origin - start).total_seconds() / 60)
+
+    last = len(route['stops']) - 1
+    if event['event'] == 'arrived' and position == last:
+        status = 'Arrived'
+    elif delay > LIVE_LATE_MINUTES:
+        status = 'Delayed'
+    else:
+        status = 'On Time'
+    ahead = [_stop(route, p, start, delay) for p in range(position + 1, last + 1)]
+    return {
+        'train_number': event['train_number'],
+        'train_name': route['train_name'],
+        'schedule_id': route['schedule_id'],
+        'run_date': start.date().isoformat(),
+        'status': status,
+        'delay_minutes': delay,
+        'event': event['event'],
+        'station': {'code': code, 'name': name},
+        'next_station': ahead[0] if ahead else None,
+        'stops_ahead': ahead,
+        'reported_at': reported_at.isoformat()
+    }
+
+
+# Latest state per train; a report older than the stored one changes nothing
+UPSERT_STATE = """
+    INSERT INTO live_status (train_number, version, reported_at, state)
+    VALUES (%s, 1, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        version = IF(VALUES(reported_at) >= reported_at, version + 1, version),
+        state = IF(VALUES(reported_at) >= reported_at, VALUES(state), state),
+        reported_at = GREATEST(reported_at, VALUES(reported_at))
+"""
+
+
+def _sse(state):
+    return b'event: status\ndata: ' + encode_json(state) + b'\n\n'
+
+
+HEARTBEAT_FRAME = b': keepalive\n\n'
+# Reconnect delay for EventSource clients (ms), sent when a stream opens
+RETRY_FRAME = b'retry: 3000\n\n'
+
+
+# Watchers are told which of their trains changed and read the latest frames
+# from the store, so a slow client holds at most one pending update per train
+class ThreadSubscriber:
+    def __init__(self, trains):
+        self.trains = trains
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._changed = set()
+
+    def push(self, train_number):
+        with self._lock:
+            self._changed.add(train_number)
+        self._event.set()
+
+    def wait(self, timeout):
+        self._event.wait(timeout)
+        with self._lock:
+            self._event.clear()
+            changed, self._changed = self._changed, set()
+        return changed
+
+
+class AsyncSubscriber:
+    def __init__(self, trains):
+        self.trains = trains
+        self._loop = asyncio.get_running_loop()
+        self._thread = threading.get_ident()
+        self._event = asyncio.Event()
+        self._changed = set()
+
+    def push(self, train_number):
+        self._changed.add(train_number)
+        self._event.set()
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+        changed, self._changed = self._changed, set()
+        return changed
+
+
+def _push_all(pushes):
+    for subscriber, train_number in pushes:
+        subscriber.push(train_number)
+
+
+class LiveStatusStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # train_number -> (version, state, SSE frame, time applied)
+        self._states = {}
+        self._subscribers = {}
+        self._watermark = None
+        self.poller = None
+        self._counters = {'updates': 0, 'notifications': 0, 'polls': 0, 'poll_errors': 0}
+        self._last_poll_seconds = None
+
+    def get(self, train_number):
+        entry = self._states.get(train_number)
+        return entry[1] if entry else None
+
+    def version(self, train_number):
+        entry = self._states.get(train_number)
+        return entry[0] if entry else 0
+
+    def frames(self, train_numbers):
+        entries = (self._states.get(train_number) for train_number in train_numbers)
+        return b''.join(entry[2] for entry in entries if entry)
+
+    # Apply live_status rows (train_number, version, state, updated_at) that
+    # are newer than what is held and notify the trains' watchers
+    def apply(self, rows):
+        changed = []
+        now = time.monotonic()
+        with self._lock:
+            for train_number, version, state, _ in rows:
+                if version <= self.version(train_number):
+                    continue
+                state = decode_json(state)
+                state['version'] = version
+                self._states[train_number] = (version, state, _sse(state), now)
+                changed.append(train_number)
+            self._counters['updates'] += len(changed)
+            watchers = [(train_number, list(self._subscribers.get(train_number, ()))) for train_number in changed]
+        # Event loop watchers notified from another thread (ingestion through
+        # the Flask routes runs on a thread pool) are handed over in one
+        # callback per loop rather than one wake-up each
+        notified = 0
+        remote = {}
+        thread = threading.get_ident()
+        for train_number, subscribers in watchers:
+            for subscriber in subscribers:
+                if isinstance(subscriber, AsyncSubscriber) and subscriber._thread != thread:
+                    remote.setdefault(subscriber._loop, []).append((subscriber, train_number))
+                else:
+                    subscriber.push(train_number)
+            notified += len(subscribers)
+        for loop, pushes in remote.items():
+            loop.call_soon_threadsafe(_push_all, pushes)
+        if notified:
+            with self._lock:
+                self._counters['notifications'] += notified
+        return changed
+
+    def subscribe(self, subscriber):
+        with self._lock:
+            for train_number in subscriber.trains:
+                self._subscribers.setdefault(train_number, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            for train_number in subscriber.trains:
+                watchers = self._subscribers.get(train_number)
+                if watchers is not None:
+                    watchers.discard(subscriber)
+                    if not watchers:
+                        del self._subscribers[train_number]
+
+    # Long-poll from a request thread: the state once its version is above
+    # `since`, or the current one after `timeout` seconds
+    def wait(self, train_number, since, timeout):
+        subscriber = self.subscribe(ThreadSubscriber([train_number]))
+        try:
+            if self.version(train_number) <= since:
+                subscriber.wait(timeout)
+        finally:
+            self.unsubscribe(subscriber)
+        return self.get(train_number)
+
+    async def wait_async(self, train_number, since, timeout):
+        subscriber = self.subscribe(AsyncSubscriber([train_number]))
+        try:
+            if self.version(train_number) <= since:
+                await subscriber.wait(timeout)
+        finally:
+            self.unsubscribe(subscriber)
+        return self.get(train_number)
+
+    # Rows changed since the last poll, with an overlap for transactions that
+    # committed late; the first poll loads every train seen within the TTL
+    def poll_statement(self):
+        if self._watermark is None:
+            return (
+                "SELECT train_number, version, state, updated_at FROM live_status "
+                "WHERE updated_at >= NOW(6) - INTERVAL %s SECOND",
+                (LIVE_STATE_TTL,)
+            )
+        return (
+            "SELECT train_number, version, state, updated_at FROM live_status WHERE updated_at >= %s",
+            (self._watermark - timedelta(seconds=LIVE_POLL_OVERLAP),)
+        )
+
+    def apply_poll(self, rows, seconds):
+        self.apply(rows)
+        latest = max((row[3] for row in rows), default=None)
+        expired = time.monotonic() - LIVE_STATE_TTL
+        with self._lock:
+            # Until something is live, every poll reads the whole TTL window
+            if latest is not None and (self._watermark is None or latest > self._watermark):
+                self._watermark = latest
+            for train_number in [t for t, entry in self._states.items() if entry[3] < expired]:
+                del self._states[train_number]
+            self._counters['polls'] += 1
+            self._last_poll_seconds = seconds
+
+    def poll_failed(self, error):
+        with self._lock:
+            self._counters['poll_errors'] += 1
+        print(f"Live status poll failed: {error}")
+
+    def poll(self, connection_factory):
+        started = time.perf_counter()
+        with connection_factory() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(*self.poll_statement())
+                rows = cursor.fetchall()
+        self.apply_poll(rows, time.perf_counter() - started)
+
+    def _poll_forever(self, connection_factory):
+        while True:
+            try:
+                self.poll(connection_factory)
+            except Exception as e:
+                self.poll_failed(e)
+            time.sleep(LIVE_POLL_INTERVAL)
+
+    # Start this worker's polling thread on first use. The async server
+    # claims the poller for its event loop task first (see asgi.py).
+    def start_poller(self, connection_factory):
+        if self.poller is not None:
+            return
+        with self._lock:
+            if self.poller is not None:
+                return
+            self.poller = threading.Thread(target=self._poll_forever, args=(connection_factory,), daemon=True)
+            self.poller.start()
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._counters,
+                trains=len(self._states),
+                watched_trains=len(self._subscribers),
+                subscriptions=sum(len(watchers) for watchers in self._subscribers.values()),
+                poller='thread' if isinstance(self.poller, threading.Thread) else self.poller,
+                last_poll_ms=round(self._last_poll_seconds * 1000, 3) if self._last_poll_seconds is not None else None
+            )
+
+
+live_store = LiveStatusStore()
+
+
+# Derive and store the state of every train in a batch of parsed events
+# (only the latest report per train is written) and apply it locally. Events
+# for unknown trains or stations are rejected individually.
+def ingest(connection, events):
+    with connection.cursor() as cursor:
+        routes = route_cache.get_many(cursor, list(dict.fromkeys(e['train_number'] for e in events)))
+
+    latest = {}
+    rejected = []
+    for index, event in enumerate(events):
+        try:
+            state = derive_state(event, routes[event['train_number']])
+        except ValueError as e:
+            rejected.append({'index': index, 'message': str(e)})
+            continue
+        current = latest.get(event['train_number'])
+        if current is None or event['reported_at'] >= current[0]:
+            latest[event['train_number']] = (event['reported_at'], state)
+
+    if latest:
+        with connection.cursor() as cursor:
+            cursor.executemany(UPSERT_STATE, [
+                (train_number, reported_at, encode_json(state).decode('utf-8'))
+                for train_number, (reported_at, state) in latest.items()
+            ])
+            connection.commit()
+            cursor.execute(
+                f"SELECT train_number, version, state, updated_at FROM live_status "
+                f"WHERE train_number IN ({', '.join(['%s'] * len(latest))})",
+                tuple(latest)
+            )
+            live_store.apply(cursor.fetchall())
+
+    return {'accepted': len(events) - len(rejected), 'trains': len(latest), 'rejected': rejected}
+
+
+# Event replayer for load tests: simulates `trains` trains running their
+# routes `speed` times faster than real time, posts their arrival and
+# departure events to the ingestion API in batches, and holds `subscribers`
+# SSE streams watching `watch` random trains each. Reports ingestion latency
+# and the time from posting an event to each watcher receiving it.
+def load_replay_routes(cursor, count, seed):
+    cursor.execute("SELECT DISTINCT train_number FROM train_schedule WHERE train_number IS NOT NULL")
+    numbers = sorted(row[0] for row in cursor.fetchall())
+    numbers = random.Random(seed).sample(numbers, min(count, len(numbers)))
+    routes = load_routes(cursor, numbers)
+    return {t: r[0] for t, r in routes.items() if r and len(r[0]['stops']) >= 2}
+
+
+# Every train is somewhere along its run when the replay starts; events are
+# (time, train_number, body) sorted by time
+def replay_events(routes, now, horizon, seed):
+    rng = random.Random(seed)
+    events = []
+    for train_number, route in routes.items():
+        stops = route['stops']
+        duration = stops[-1][2] or 1
+        start = now - timedelta(minutes=rng.uniform(0, duration))
+        delay = rng.randint(0, 10)
+        for position, (code, _, arrival_offset, departure_offset) in enumerate(stops):
+            delay = max(delay + rng.randint(-2, 4), 0)
+            for kind, offset in (('arrived', arrival_offset), ('departed', departure_offset)):
+                if offset is None:
+                    continue
+                moment = start + timedelta(minutes=offset + delay)
+                if now <= moment <= now + horizon:
+                    events.append((moment, train_number, {
+                        'train_number': train_number, 'station': code, 'event': kind,
+                        'reported_at': moment.isoformat(), 'delay_minutes': delay
+                    }))
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+async def _sse_frames(reader):
+    status = int((await reader.readline()).split()[1])
+    chunked = False
+    while True:
+        line = (await reader.readline()).strip()
+        if not line:
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+    if status != 200:
+        raise ValueError(f"stream returned {status}")
+    buffer = b''
+    while True:
+        if chunked:
+            size = int((await reader.readline()).strip().split(b';')[0], 16)
+            if size == 0:
+                return
+            data = (await reader.readexactly(size + 2))[:-2]
+        else:
+            data = await reader.read(65536)
+            if not data:
+                return
+        buffer += data
+        *frames, buffer = buffer.split(b'\n\n')
+        for frame in frames:
+            yield frame
+
+
+async def _watch(parts, trains, posted, result, connected, stop):
+    try:
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    except OSError:
+        result['connect_errors'] += 1
+        connected.release()
+        return
+    writer.write(
+        f"GET /api/live/stream?trains={','.join(trains)} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+        f"Accept: text/event-stream\r\n\r\n".encode()
+    )
+    connected.release()
+    try:
+        async for frame in _sse_frames(reader):
+            if stop.is_set():
+                break
+            for line in frame.split(b'\n'):
+                if line.startswith(b'data: '):
+                    state = decode_json(line[6:])
+                    sent = posted.get((state['train_number'], state['reported_at']))
+                    if sent is not None:
+                        result['frames'] += 1
+                        result['latencies'].append(time.perf_counter() - sent)
+    except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+        if not stop.is_set():
+            result['disconnects'] += 1
+    finally:
+        writer.close()
+
+
+async def _post(parts, headers, queue, posted, result):
+    from benchmark import _request
+
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                return
+            body = encode_json({'events': batch})
+            started = time.perf_counter()
+            for event in batch:
+                posted[(event['train_number'], event['reported_at'])] = started
+            status, keep_alive, payload = await _request(reader, writer, parts.netloc, 'POST', '/api/live/events',
+                                                         body, headers)
+            result['ingest_latencies'].append(time.perf_counter() - started)
+            if status == 200:
+                response = decode_json(payload)
+                result['accepted'] += response['accepted']
+                result['rejected'] += len(response['rejected'])
+            else:
+                result['post_errors'] += 1
+            if not keep_alive:
+                writer.close()
+                reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    finally:
+        writer.close()
+
+
+async def replay(base, routes, args, admin_token):
+    from urllib.parse import urlsplit
+    from benchmark import _percentile
+
+    parts = urlsplit(base)
+    rng = random.Random(args.seed)
+    numbers = sorted(routes)
+    now = datetime.now().replace(microsecond=0)
+    events = replay_events(routes, now, timedelta(seconds=args.duration * args.speed), args.seed)
+
+    result = {'connect_errors': 0, 'disconnects': 0, 'frames': 0, 'latencies': [], 'ingest_latencies': [],
+              'accepted': 0, 'rejected': 0, 'post_errors': 0}
+    posted = {}
+    stop = asyncio.Event()
+    connected = asyncio.Semaphore(0)
+    watchers = [
+        asyncio.ensure_future(_watch(parts, rng.sample(numbers, min(args.watch, len(numbers))), posted, result,
+                                     connected, stop))
+        for _ in range(args.subscribers)
+    ]
+    for _ in watchers:
+        await connected.acquire()
+    # Let the streams register before the first event is posted
+    await asyncio.sleep(1)
+
+    queue = asyncio.Queue()
+    headers = {'Authorization': f"Bearer {admin_token}"}
+    posters = [asyncio.ensure_future(_post(parts, headers, queue, posted, result)) for _ in range(args.posters)]
+    started = time.monotonic()
+    position = 0
+    while position < len(events) and time.monotonic() - started < args.duration:
+        due = now + timedelta(seconds=(time.monotonic() - started) * args.speed)
+        end = position
+        while end < len(events) and events[end][0] <= due:
+            end += 1
+        for batch_start in range(position, end, args.batch):
+            queue.put_nowait([event[2] for event in events[batch_start:min(end, batch_start + args.batch)]])
+        position = end
+        await asyncio.sleep(0.05)
+    for _ in posters:
+        queue.put_nowait(None)
+    await asyncio.gather(*posters)
+    elapsed = time.monotonic() - started
+    # Give the last updates time to reach the watchers (poll interval + fan-out)
+    await asyncio.sleep(max(LIVE_POLL_INTERVAL * 2, 2))
+    stop.set()
+    for watcher in watchers:
+        watcher.cancel()
+    await asyncio.gather(*watchers, return_exceptions=True)
+
+    latencies = sorted(result['latencies'])
+    ingest = sorted(result['ingest_latencies'])
+    return {
+        'trains': len(routes),
+        'subscribers': args.subscribers,
+        'events_posted': position,
+        'events_per_second': round(position / elapsed, 1) if elapsed else 0.0,
+        'accepted': result['accepted'],
+        'rejected': result['rejected'],
+        'post_errors': result['post_errors'],
+        'ingest_p50_ms': _percentile(ingest, 0.50),
+        'ingest_p95_ms': _percentile(ingest, 0.95),
+        'connect_errors': result['connect_errors'],
+        'disconnects': result['disconnects'],
+        'frames_received': result['frames'],
+        'delivery_p50_ms': _percentile(latencies, 0.50),
+        'delivery_p95_ms': _percentile(latencies, 0.95),
+        'delivery_p99_ms': _percentile(latencies, 0.99)
+    }
+
+
+if __name__ == '__main__':
+    import resource
+
+    from auth import issue_token
+    from db import get_connection
+
+    parser = argparse.ArgumentParser(description='Replay simulated train movements against the live status API')
+    parser.add_argument('command', choices=['replay'])
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='running server to load')
+    parser.add_argument('--trains', type=int, default=1000)
+    parser.add_argument('--subscribers', type=int, default=1000, help='SSE streams to hold open')
+    parser.add_argument('--watch', type=int, default=3, help='trains watched per stream')
+    parser.add_argument('--duration', type=float, default=60, help='seconds of replay')
+    parser.add_argument('--speed', type=float, default=60, help='simulated seconds per real second')
+    parser.add_argument('--batch', type=int, default=200, help='events per ingestion request')
+    parser.add_argument('--posters', type=int, default=4, help='concurrent ingestion connections')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    # Every stream is a socket
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            routes = load_replay_routes(cursor, args.trains, args.seed)
+        finally:
+            cursor.close()
+    if not routes:
+        parser.error('No trains with numbers and stops found; seed the database first')
+    report = asyncio.run(replay(args.url.rstrip('/'), routes, args, issue_token('admin', is_admin=True)))
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,299 @@
+import bisect
+import contextvars
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+# Request instrumentation, exported in Prometheus text format by /metrics.
+# METRICS_ENABLED=0 leaves connections unwrapped and registers no request
+# hooks, so a disabled build pays nothing per query or request. Values are
+# per worker process, like the other stats endpoints.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'
+# One JSON line per request on stdout
+REQUEST_LOG = os.getenv('REQUEST_LOG', '0') == '1'
+# Statements slower than this are logged with their SQL (0 disables)
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+# Query accounting for the request being served (a thread under the sync
+# server, a task under the async one)
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# Labelled histograms and counters for one process. One lock guards them all:
+# every update is a few integer additions.
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            histograms = {
+                name: {labels: (h.buckets, list(h.counts), h.sum, h.count) for labels, h in series.items()}
+                for name, series in self._histograms.items()
+            }
+            counters = {name: dict(series) for name, series in self._counters.items()}
+        return histograms, counters
+
+
+registry = Registry()
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'endpoint', 'queries', 'db_seconds')
+
+    def __init__(self, endpoint=None):
+        self.started = time.perf_counter()
+        self.endpoint = endpoint
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+def start_request(endpoint=None):
+    _current.set(RequestMetrics(endpoint))
+
+
+# Record a finished request and return its metrics (None outside a request)
+def finish_request(endpoint, method, status, path=None, remote_addr=None):
+    current = _current.get()
+    if current is None:
+        return None
+    _current.set(None)
+    seconds = time.perf_counter() - current.started
+    endpoint = endpoint or 'unmatched'
+    registry.observe('http_request_duration_seconds', (endpoint, method, str(status)), seconds)
+    registry.observe('http_request_db_queries', (endpoint,), current.queries, COUNT_BUCKETS)
+    registry.observe('http_request_db_seconds', (endpoint,), current.db_seconds)
+    if REQUEST_LOG:
+        print(json.dumps({
+            'event': 'request',
+            'ts': datetime.now(timezone.utc).isoformat(),
+            'method': method,
+            'path': path,
+            'endpoint': endpoint,
+            'status': status,
+            'duration_ms': round(seconds * 1000, 3),
+            'db_queries': current.queries,
+            'db_ms': round(current.db_seconds * 1000, 3),
+            'remote_addr': remote_addr,
+            'pid': os.getpid()
+        }), flush=True)
+    return current
+
+
+def observe_pool_wait(seconds):
+    registry.observe('db_pool_acquire_seconds', (), seconds)
+
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _fingerprint(params):
+    if not params:
+        return None
+    return hashlib.sha1(repr(params).encode('utf-8')).hexdigest()[:12]
+
+
+def _record_query(statement, params, seconds, fetch=False):
+    current = _current.get()
+    if current is not None:
+        current.db_seconds += seconds
+        if not fetch:
+            current.queries += 1
+    if fetch:
+        registry.inc('db_fetch_seconds_total', value=seconds)
+        return
+    registry.observe('db_query_duration_seconds', (), seconds)
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        # The SQL text without the values; the fingerprint tells repeated
+        # parameter sets apart without logging passenger data
+        print(json.dumps({
+            'event': 'slow_query',
+            'ts': datetime.now(timezone.utc).isoformat(),
+            'duration_ms': round(seconds * 1000, 3),
+            'endpoint': current.endpoint if current else None,
+            'sql': _WHITESPACE.sub(' ', str(statement)).strip()[:2000],
+            'params_fingerprint': _fingerprint(params)
+        }), flush=True)
+
+
+# Cursor and connection wrappers timing every statement and fetch; anything
+# else is passed through to the driver objects
+class InstrumentedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, statement, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(statement, params, *args, **kwargs)
+        finally:
+            _record_query(statement, params, time.perf_counter() - started)
+
+    def executemany(self, statement, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(statement, seq_params, *args, **kwargs)
+        finally:
+            _record_query(statement, None, time.perf_counter() - started)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return getattr(self._cursor, method)(*args)
+        finally:
+            _record_query(None, None, time.perf_counter() - started, fetch=True)
+
+    def fetchone(self):
+        return self._fetch('fetchone')
+
+    def fetchmany(self, *args):
+        return self._fetch('fetchmany', *args)
+
+    def fetchall(self):
+        return self._fetch('fetchall')
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._connection.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class InstrumentedAsyncCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    async def execute(self, statement, params=None):
+        started = time.perf_counter()
+        try:
+            return await self._cursor.execute(statement, params)
+        finally:
+            _record_query(statement, params, time.perf_counter() - started)
+
+    async def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return await self._cursor.fetchall()
+        finally:
+            _record_query(None, None, time.perf_counter() - started, fetch=True)
+
+    async def __aenter__(self):
+        await self._cursor.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc):
+        return await self._cursor.__aexit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedAsyncConnection(InstrumentedConnection):
+    def cursor(self, *args, **kwargs):
+        return InstrumentedAsyncCursor(self._connection.cursor(*args, **kwargs))
+
+
+def _labels(names, values):
+    return ','.join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+
+
+HISTOGRAM_LABELS = {
+    'http_request_duration_seconds': ('endpoint', 'method', 'status'),
+    'http_request_db_queries': ('endpoint',),
+    'http_request_db_seconds': ('endpoint',),
+    'db_query_duration_seconds': (),
+    'db_pool_acquire_seconds': ()
+}
+
+HELP = {
+    'http_request_duration_seconds': 'Request latency by endpoint, method and status',
+    'http_request_db_queries': 'SQL statements executed per request',
+    'http_request_db_seconds': 'Time spent in the database per request',
+    'db_query_duration_seconds': 'Latency of single SQL statements',
+    'db_pool_acquire_seconds': 'Time to borrow a pooled database connection',
+    'db_fetch_seconds_total': 'Time spent fetching result rows'
+}
+
+
+# Prometheus text exposition of the registry plus point-in-time `gauges`,
+# given as {metric: {(label_names, label_values): value}}
+def render(gauges):
+    histograms, counters = registry.snapshot()
+    lines = []
+    for name, series in sorted(histograms.items()):
+        lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+        names = HISTOGRAM_LABELS.get(name, ())
+        for labels, (buckets, counts, total, count) in sorted(series.items()):
+            base = _labels(names, labels)
+            prefix = f"{base}," if base else ''
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {count}')
+            suffix = f"{{{base}}}" if base else ''
+            lines.append(f"{name}_sum{suffix} {total}")
+            lines.append(f"{name}_count{suffix} {count}")
+    for name, series in sorted(counters.items()):
+        lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+        for labels, value in series.items():
+            lines.append(f"{name} {value}")
+    for name, series in sorted(gauges.items()):
+        lines.append(f"# TYPE {name} gauge")
+        for (names, values), value in series.items():
+            base = _labels(names, values)
+            lines.append(f"{name}{{{base}}} {value}" if base else f"{name} {value}")
+    return '\n'.join(lines) + '\n'
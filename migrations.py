@@ -0,0 +1,418 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+from mysql.connector import Error, errorcode
+
+import passengers
+
+# Versioned schema changes. Each migration is (version, name, step, batched):
+# steps run in version order, once per database, and are recorded in
+# schema_migrations. A plain step gets a cursor and is committed with its
+# version row; a batched step gets the connection and commits its own short
+# transactions (online backfills). Steps must be safe to re-run against a
+# database that already has the change, since schema.sql creates new
+# databases in their final shape. The list is MIGRATIONS at the end of this
+# file; add new versions at the end and never renumber released ones. Run
+# `python migrations.py migrate` on deploy, before new workers start.
+MIGRATION_LOCK = 'railway_schema_migrations'
+MIGRATION_LOCK_TIMEOUT = int(os.getenv('MIGRATION_LOCK_TIMEOUT', 600))
+BACKFILL_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', 5000))
+
+
+class MigrationLocked(Exception):
+    pass
+
+
+def ensure_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+          version INT PRIMARY KEY,
+          name VARCHAR(100) NOT NULL,
+          applied_at DATETIME NOT NULL,
+          duration_ms INT NOT NULL
+        )
+    """)
+
+
+def applied(cursor):
+    cursor.execute("SELECT version, name, applied_at, duration_ms FROM schema_migrations ORDER BY version")
+    return {version: (name, applied_at, duration_ms) for version, name, applied_at, duration_ms in cursor.fetchall()}
+
+
+def _check(migrations):
+    versions = [migration[0] for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError('Migration versions must be unique')
+    return sorted(migrations, key=lambda migration: migration[0])
+
+
+# Apply every migration not yet recorded, up to `target` if given. A named
+# lock makes concurrent callers (several workers hitting /init-db, a deploy
+# running init_db.py) wait for the first and then find nothing left to do.
+# Returns the applied [{version, name, duration_ms}].
+def migrate(connection, migrations, target=None):
+    migrations = _check(migrations)
+    ran = []
+    cursor = connection.cursor()
+    try:
+        ensure_table(cursor)
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK, MIGRATION_LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            raise MigrationLocked(f"Timed out waiting for {MIGRATION_LOCK}")
+        try:
+            done = applied(cursor)
+            connection.commit()
+            for version, name, step, batched in migrations:
+                if version in done or (target is not None and version > target):
+                    continue
+                started = time.perf_counter()
+                if batched:
+                    step(connection)
+                else:
+                    step(cursor)
+                duration_ms = int((time.perf_counter() - started) * 1000)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name, applied_at, duration_ms) VALUES (%s, %s, %s, %s)",
+                    (version, name, datetime.now().replace(microsecond=0), duration_ms)
+                )
+                connection.commit()
+                ran.append({'version': version, 'name': name, 'duration_ms': duration_ms})
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+            cursor.fetchone()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return ran
+
+
+# Every known migration with when it was applied (None if pending)
+def status(connection, migrations):
+    cursor = connection.cursor()
+    try:
+        ensure_table(cursor)
+        done = applied(cursor)
+        connection.commit()
+    finally:
+        cursor.close()
+    result = []
+    for version, name, _, _ in _check(migrations):
+        applied_at = done[version][1] if version in done else None
+        result.append({
+            'version': version,
+            'name': name,
+            'applied_at': applied_at.isoformat() if applied_at else None,
+            'duration_ms': done[version][2] if version in done else None
+        })
+    return result
+
+
+def _column_exists(cursor, table, column):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column)
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def _column_length(cursor, table, column):
+    cursor.execute(
+        "SELECT character_maximum_length FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column)
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _index_exists(cursor, table, index):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+        (table, index)
+    )
+    return cursor.fetchone()[0] > 0
+
+
+# Databases created before train_number existed get the column, a backfill
+# from the train name (or the route's station codes for generated city-pair
+# trains) and the natural-key index the seed upserts on
+def ensure_train_numbers(cursor):
+    # Deferred: seed.py imports this module
+    from seed import train_number
+
+    if not _column_exists(cursor, 'train_schedule', 'train_number'):
+        cursor.execute("ALTER TABLE train_schedule ADD COLUMN train_number VARCHAR(20) NULL AFTER train_name")
+    if _index_exists(cursor, 'train_schedule', 'uq_schedule_train_route'):
+        return
+
+    cursor.execute("""
+        SELECT ts.schedule_id, ts.train_name, ts.source_station_id, ts.destination_station_id,
+               src.code as source_code, dst.code as destination_code
+        FROM train_schedule ts
+        JOIN stations src ON src.station_id = ts.source_station_id
+        JOIN stations dst ON dst.station_id = ts.destination_station_id
+        WHERE ts.train_number IS NULL
+        ORDER BY ts.schedule_id
+    """)
+    seen = set()
+    updates = []
+    for schedule_id, name, source_id, destination_id, source_code, destination_code in cursor.fetchall():
+        number = train_number(name or '') or f"{source_code}-{destination_code}"
+        key = (number, source_id, destination_id)
+        # Duplicated legacy rows keep a NULL number rather than breaking the index
+        if key not in seen:
+            seen.add(key)
+            updates.append((number, schedule_id))
+    if updates:
+        cursor.executemany("UPDATE train_schedule SET train_number = %s WHERE schedule_id = %s", updates)
+    cursor.execute(
+        "ALTER TABLE train_schedule ADD UNIQUE KEY uq_schedule_train_route (train_number, source_station_id, destination_station_id)"
+    )
+
+
+# Databases created before the stops model get per-segment seat maps and
+# leg-aware seat reservations
+def ensure_segments(cursor):
+    if _column_exists(cursor, 'seat_inventory', 'seat_map'):
+        if not _column_exists(cursor, 'seat_inventory', 'segments'):
+            cursor.execute("ALTER TABLE seat_inventory ADD COLUMN segments SMALLINT NOT NULL DEFAULT 1 AFTER remaining")
+        if (_column_length(cursor, 'seat_inventory', 'seat_map') or 0) < 16384:
+            cursor.execute("ALTER TABLE seat_inventory MODIFY seat_map VARBINARY(16384) NOT NULL DEFAULT ''")
+    if _column_exists(cursor, 'seat_reservations', 'seat_number') and not _column_exists(cursor, 'seat_reservations', 'from_stop'):
+        cursor.execute("""
+            ALTER TABLE seat_reservations
+            ADD COLUMN from_stop SMALLINT NOT NULL DEFAULT 0 AFTER seat_number,
+            ADD COLUMN to_stop SMALLINT NOT NULL DEFAULT 1 AFTER from_stop,
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (schedule_id, travel_date, seat_number, from_stop)
+        """)
+
+
+# Databases created before cancellations get booking status, the waitlist
+# counter on inventory rows and status columns on PNR summaries
+def ensure_cancellation(cursor):
+    if _column_exists(cursor, 'bookings', 'booking_id') and not _column_exists(cursor, 'bookings', 'status'):
+        cursor.execute("""
+            ALTER TABLE bookings
+            ADD COLUMN status VARCHAR(12) NOT NULL DEFAULT 'CONFIRMED' AFTER booking_date,
+            ADD COLUMN cancelled_at DATETIME NULL AFTER status
+        """)
+    if _column_exists(cursor, 'seat_inventory', 'seat_map') and not _column_exists(cursor, 'seat_inventory', 'waiting'):
+        cursor.execute("""
+            ALTER TABLE seat_inventory
+            ADD COLUMN waiting INT NOT NULL DEFAULT 0 AFTER seat_map,
+            ADD INDEX idx_inventory_waiting (waiting, travel_date)
+        """)
+    if _column_exists(cursor, 'booking_summary', 'booking_id') and not _column_exists(cursor, 'booking_summary', 'status'):
+        cursor.execute("""
+            ALTER TABLE booking_summary
+            ADD COLUMN status VARCHAR(12) AFTER payment_method,
+            ADD COLUMN waitlist_number INT NULL AFTER status
+        """)
+        cursor.execute("UPDATE booking_summary SET status = 'CONFIRMED'")
+
+
+# Indexes behind the admin feedback listing (category filter and full-text
+# search) on databases created before them
+def ensure_feedback_indexes(cursor):
+    if not _column_exists(cursor, 'feedbacks', 'message'):
+        return
+    if not _index_exists(cursor, 'feedbacks', 'idx_feedback_category'):
+        cursor.execute("ALTER TABLE feedbacks ADD INDEX idx_feedback_category (category, id)")
+    if not _index_exists(cursor, 'feedbacks', 'ft_feedback_message'):
+        cursor.execute("ALTER TABLE feedbacks ADD FULLTEXT INDEX ft_feedback_message (message)")
+
+
+# Secondary indexes behind the hot joins: tickets and payments by booking
+# (admin listing, PNR summaries, stats), tickets by travel date (listing
+# date filters, inventory reconcile) and feedback by date. Built in place
+# without blocking writes.
+HOT_PATH_INDEXES = (
+    ('tickets', 'idx_ticket_booking', ('booking_id', 'travel_date')),
+    ('tickets', 'idx_ticket_travel_date', ('travel_date',)),
+    ('payments', 'idx_payment_booking', ('booking_id', 'amount', 'payment_method')),
+    ('feedbacks', 'idx_feedback_created', ('created_at',)),
+)
+
+
+# Indexes schema.sql declares on tables that already existed without them:
+# schedules by route and by destination, and a booking's seat reservations
+ROUTE_INDEXES = (
+    ('train_schedule', 'idx_schedule_route', ('source_station_id', 'destination_station_id', 'departure_time')),
+    ('train_schedule', 'idx_schedule_destination', ('destination_station_id',)),
+    ('seat_reservations', 'idx_reservation_booking', ('booking_id',)),
+)
+
+
+def _add_indexes(cursor, indexes):
+    for table, index, columns in indexes:
+        if _column_exists(cursor, table, columns[0]) and not _index_exists(cursor, table, index):
+            cursor.execute(
+                f"ALTER TABLE {table} ADD INDEX {index} ({', '.join(columns)}), ALGORITHM=INPLACE, LOCK=NONE"
+            )
+
+
+def ensure_hot_path_indexes(cursor):
+    _add_indexes(cursor, HOT_PATH_INDEXES)
+
+
+def ensure_route_indexes(cursor):
+    _add_indexes(cursor, ROUTE_INDEXES)
+
+
+# Normalized email on passengers, as a virtual column (no table rebuild) with
+# a plain index until duplicates are merged
+def ensure_passenger_email_key(cursor):
+    if not _column_exists(cursor, 'passengers', 'email'):
+        return
+    if not _column_exists(cursor, 'passengers', 'email_key'):
+        cursor.execute(
+            "ALTER TABLE passengers ADD COLUMN email_key VARCHAR(100) AS (LOWER(TRIM(email))) VIRTUAL AFTER email"
+        )
+    if not _index_exists(cursor, 'passengers', 'idx_passenger_email_key') and \
+            not _index_exists(cursor, 'passengers', 'uq_passenger_email'):
+        cursor.execute("ALTER TABLE passengers ADD INDEX idx_passenger_email_key (email_key)")
+
+
+# Swap the plain index for the unique one bookings upsert on. Bookings made
+# during the merge can add new duplicates, so merge once more and retry if
+# the unique index still finds some.
+def ensure_unique_passenger_email(connection, retries=3):
+    cursor = connection.cursor()
+    try:
+        for attempt in range(retries):
+            if not _column_exists(cursor, 'passengers', 'email_key') or \
+                    _index_exists(cursor, 'passengers', 'uq_passenger_email'):
+                break
+            passengers.merge_duplicates(connection)
+            try:
+                cursor.execute("ALTER TABLE passengers ADD UNIQUE KEY uq_passenger_email (email_key)")
+            except Error as e:
+                if e.errno != errorcode.ER_DUP_ENTRY or attempt == retries - 1:
+                    raise
+        if _index_exists(cursor, 'passengers', 'idx_passenger_email_key'):
+            cursor.execute("ALTER TABLE passengers DROP INDEX idx_passenger_email_key")
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+# Databases from before ranked stats get idx_stats_rank, and their sharded
+# train and route rows folded into slot 0
+def ensure_ranked_stats(cursor):
+    if not _column_exists(cursor, 'booking_stats', 'revenue'):
+        return
+    if not _index_exists(cursor, 'booking_stats', 'idx_stats_rank'):
+        cursor.execute("ALTER TABLE booking_stats ADD INDEX idx_stats_rank (dimension, revenue), ALGORITHM=INPLACE, LOCK=NONE")
+    cursor.execute("""
+        INSERT INTO booking_stats (dimension, dim_key, slot, bookings, tickets, revenue)
+        SELECT * FROM (
+            SELECT dimension, dim_key, 0, SUM(bookings) as b, SUM(tickets) as t, SUM(revenue) as r
+            FROM booking_stats WHERE dimension IN ('train', 'route') AND slot > 0
+            GROUP BY dimension, dim_key
+        ) sharded
+        ON DUPLICATE KEY UPDATE
+            bookings = booking_stats.bookings + sharded.b,
+            tickets = booking_stats.tickets + sharded.t,
+            revenue = booking_stats.revenue + sharded.r
+    """)
+    cursor.execute("DELETE FROM booking_stats WHERE dimension IN ('train', 'route') AND slot > 0")
+
+
+# Bookings made before cancel tokens keep NULL and can only be cancelled by
+# an admin
+def ensure_cancel_tokens(cursor):
+    if _column_exists(cursor, 'bookings', 'booking_id') and not _column_exists(cursor, 'bookings', 'cancel_token_hash'):
+        cursor.execute("ALTER TABLE bookings ADD COLUMN cancel_token_hash CHAR(64) NULL AFTER cancelled_at")
+
+
+def _ensure_booking_passenger_name(connection):
+    cursor = connection.cursor()
+    try:
+        if _column_exists(cursor, 'bookings', 'booking_id') and not _column_exists(cursor, 'bookings', 'passenger_name'):
+            cursor.execute(
+                "ALTER TABLE bookings ADD COLUMN passenger_name VARCHAR(100) NULL AFTER passenger_id, ALGORITHM=INPLACE, LOCK=NONE"
+            )
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+# Version 7. The merge moves bookings onto one passenger row and they keep
+# the name they were made under, so the column that holds it goes on first
+# (it would otherwise only arrive with version 11).
+def merge_duplicate_passengers(connection):
+    _ensure_booking_passenger_name(connection)
+    return passengers.merge_duplicates(connection)
+
+
+# Each booking keeps the traveller name it was made under, so a later
+# booking under the same email with another name no longer renames it.
+# Existing bookings get their passenger's current name, batch_size ids per
+# short transaction; bookings made meanwhile already carry theirs.
+def backfill_booking_passenger_names(connection, batch_size=BACKFILL_BATCH_SIZE):
+    _ensure_booking_passenger_name(connection)
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(booking_id), 0) FROM bookings")
+        last_id = cursor.fetchone()[0]
+        connection.commit()
+        for start in range(0, last_id, batch_size):
+            cursor.execute(
+                """
+                UPDATE bookings b JOIN passengers p ON p.passenger_id = b.passenger_id
+                SET b.passenger_name = p.name
+                WHERE b.booking_id > %s AND b.booking_id <= %s AND b.passenger_name IS NULL
+                """,
+                (start, start + batch_size)
+            )
+            connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# (version, name, step, batched), applied by migrate. Versions 1-4
+# were run unversioned before schema_migrations existed and are no-ops on
+# databases that already have them.
+MIGRATIONS = (
+    (1, 'train_numbers', ensure_train_numbers, False),
+    (2, 'segments', ensure_segments, False),
+    (3, 'cancellation', ensure_cancellation, False),
+    (4, 'feedback_indexes', ensure_feedback_indexes, False),
+    (5, 'hot_path_indexes', ensure_hot_path_indexes, False),
+    (6, 'passenger_email_key', ensure_passenger_email_key, False),
+    (7, 'merge_duplicate_passengers', merge_duplicate_passengers, True),
+    (8, 'unique_passenger_email', ensure_unique_passenger_email, True),
+    (9, 'ranked_stats', ensure_ranked_stats, False),
+    (10, 'cancel_tokens', ensure_cancel_tokens, False),
+    (11, 'booking_passenger_names', backfill_booking_passenger_names, True),
+    (12, 'route_indexes', ensure_route_indexes, False),
+)
+
+
+# Apply every pending migration (python migrations.py migrate, init_db.py)
+def upgrade(connection, target=None):
+    return migrate(connection, MIGRATIONS, target)
+
+
+if __name__ == '__main__':
+    from db import get_connection
+
+    parser = argparse.ArgumentParser(description='Versioned schema migrations')
+    parser.add_argument('command', choices=['status', 'migrate'])
+    parser.add_argument('--target', type=int, help='stop after this version')
+    args = parser.parse_args()
+
+    with get_connection() as connection:
+        if args.command == 'migrate':
+            result = {'applied': upgrade(connection, args.target)}
+        else:
+            result = {'migrations': status(connection, MIGRATIONS)}
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+
+# One passengers row per email address. email_key is a generated column
+# (LOWER(TRIM(email))) with a unique index, so bookings upsert on it and
+# "Asha@x.com " and "asha@x.com" are the same passenger. Databases that
+# already hold duplicates are merged online by merge_duplicates before the
+# unique index goes on (migrations.MIGRATIONS, versions 6-8). The row's name
+# is the one it was created with; each booking records the traveller name it
+# was made under in bookings.passenger_name.
+MERGE_BATCH_SIZE = int(os.getenv('PASSENGER_MERGE_BATCH', 500))
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+# The passenger_id for this email, creating the row if there is none. An
+# existing row is left as it is; LAST_INSERT_ID(passenger_id) makes lastrowid
+# its id.
+def upsert(cursor, name, email):
+    cursor.execute(
+        """
+        INSERT INTO passengers (name, email) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE passenger_id = LAST_INSERT_ID(passenger_id)
+        """,
+        (name, (email or '').strip())
+    )
+    return cursor.lastrowid
+
+
+def _merge_batch(cursor, after_key, batch_size):
+    # Next email_keys with more than one row, walked in index order (the
+    # first batch starts at '' so blank emails are merged too)
+    cursor.execute(
+        f"""
+        SELECT email_key FROM passengers
+        WHERE email_key {'>=' if after_key is None else '>'} %s
+        GROUP BY email_key HAVING COUNT(*) > 1
+        ORDER BY email_key LIMIT %s
+        """,
+        (after_key or '', batch_size)
+    )
+    keys = [row[0] for row in cursor.fetchall()]
+    if not keys:
+        return None, 0
+
+    cursor.execute(
+        f"""
+        SELECT email_key, passenger_id, name FROM passengers
+        WHERE email_key IN ({', '.join(['%s'] * len(keys))})
+        ORDER BY email_key, passenger_id
+        FOR UPDATE
+        """,
+        keys
+    )
+    groups = {}
+    for email_key, passenger_id, name in cursor.fetchall():
+        groups.setdefault(email_key, []).append((passenger_id, name))
+
+    # The oldest row survives as it is. Bookings and PNR summaries of the
+    # others are moved onto it, and bookings keep the name of the row they
+    # were made under.
+    merged = 0
+    for rows in groups.values():
+        keeper = rows[0][0]
+        duplicates = [passenger_id for passenger_id, _ in rows[1:]]
+        if not duplicates:
+            continue
+        placeholders = ', '.join(['%s'] * len(duplicates))
+        cursor.execute(
+            f"""
+            UPDATE bookings b JOIN passengers p ON p.passenger_id = b.passenger_id
+            SET b.passenger_name = COALESCE(b.passenger_name, p.name), b.passenger_id = %s
+            WHERE b.passenger_id IN ({placeholders})
+            """,
+            [keeper] + duplicates
+        )
+        cursor.execute(f"UPDATE booking_summary SET passenger_id = %s WHERE passenger_id IN ({placeholders})",
+                       [keeper] + duplicates)
+        cursor.execute(f"DELETE FROM passengers WHERE passenger_id IN ({placeholders})", duplicates)
+        merged += len(duplicates)
+    return keys[-1] if len(keys) == batch_size else None, merged
+
+
+# Fold passengers sharing an email_key into one row, batch_size emails per
+# short transaction so bookings keep running during the merge. Returns the
+# number of rows removed.
+def merge_duplicates(connection, batch_size=MERGE_BATCH_SIZE):
+    merged = 0
+    after_key = None
+    cursor = connection.cursor()
+    try:
+        while True:
+            try:
+                last_key, count = _merge_batch(cursor, after_key, batch_size)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            merged += count
+            if last_key is None:
+                break
+            after_key = last_key
+    finally:
+        cursor.close()
+    return merged
+
+
+if __name__ == '__main__':
+    from db import get_connection
+
+    parser = argparse.ArgumentParser(description='Passenger records')
+    parser.add_argument('command', choices=['merge'], help='merge passengers that share an email address')
+    parser.add_argument('--batch-size', type=int, default=MERGE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with get_connection() as connection:
+        merged = merge_duplicates(connection, args.batch_size)
+    print(json.dumps({'merged': merged}, indent=2))
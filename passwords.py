@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+
+# Password hashing tuning (all overridable through the environment)
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', 2))
+HASH_QUEUE_LIMIT = int(os.getenv('HASH_QUEUE_LIMIT', 8))
+HASH_TIMEOUT = float(os.getenv('HASH_TIMEOUT', 10))
+LOGIN_RATE_LIMIT = int(os.getenv('LOGIN_RATE_LIMIT', 10))
+LOGIN_RATE_WINDOW = float(os.getenv('LOGIN_RATE_WINDOW', 60))
+
+
+class HashingBusy(Exception):
+    pass
+
+
+# bcrypt runs in a small dedicated thread pool (the bcrypt extension releases
+# the GIL while hashing), so a burst of logins uses at most HASH_WORKERS
+# cores per worker process and queues at most HASH_QUEUE_LIMIT more. Anything
+# beyond that is refused straight away with HashingBusy instead of piling up
+# behind the booking traffic on the same worker. The caller still waits for
+# its hash, so with sync gunicorn workers (one request per process) this
+# only caps concurrency; requests overlap hashing with other work only on the
+# gthread and async servers.
+class HashingPool:
+    def __init__(self, workers=HASH_WORKERS, queue_limit=HASH_QUEUE_LIMIT, timeout=HASH_TIMEOUT):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._lock = threading.Lock()
+        self._counters = {'completed': 0, 'rejected': 0, 'timeouts': 0, 'in_flight': 0}
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._counters['rejected'] += 1
+            raise HashingBusy('Too many password operations in progress')
+        with self._lock:
+            self._counters['in_flight'] += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._done(None)
+            raise
+        # The slot is held until the hash really finishes, not just until
+        # the caller stops waiting, so timed-out jobs still count against
+        # workers + queue_limit
+        future.add_done_callback(self._done)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self._counters['timeouts'] += 1
+            raise HashingBusy('Password operation timed out')
+
+    def _done(self, future):
+        self._slots.release()
+        with self._lock:
+            self._counters['in_flight'] -= 1
+            self._counters['completed'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+hashing_pool = HashingPool()
+
+
+def hash_password(password, rounds=None):
+    salt = bcrypt.gensalt(rounds or BCRYPT_ROUNDS)
+    return hashing_pool.run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+
+def check_password(password, hashed):
+    if not hashed:
+        return False
+    try:
+        return hashing_pool.run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+    except ValueError:
+        # Not a bcrypt hash
+        return False
+
+
+# True when a stored hash was made with a different cost than BCRYPT_ROUNDS
+def needs_rehash(hashed):
+    try:
+        return int(hashed.split('$')[2]) != BCRYPT_ROUNDS
+    except (AttributeError, IndexError, ValueError):
+        return True
+
+
+# Sliding-window login attempt limiter per client IP (per worker process)
+class RateLimiter:
+    def __init__(self, limit=LOGIN_RATE_LIMIT, window=LOGIN_RATE_WINDOW):
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._attempts = {}
+
+    # Record an attempt; returns seconds to wait if over the limit, else 0
+    def hit(self, key):
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.setdefault(key, deque())
+            while attempts and now - attempts[0] >= self.window:
+                attempts.popleft()
+            if len(attempts) >= self.limit:
+                return self.window - (now - attempts[0])
+            attempts.append(now)
+            # Forget idle clients so the table does not grow without bound
+            if len(self._attempts) > 10000:
+                for stale in [k for k, v in self._attempts.items() if not v or now - v[-1] >= self.window]:
+                    del self._attempts[stale]
+            return 0
+
+
+login_limiter = RateLimiter()
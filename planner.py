@@ -0,0 +1,332 @@
+import bisect
+import os
+import threading
+import time
+from array import array
+
+from cache import reference_cache
+from stops import direct_route
+
+# Journey planner tuning
+MIN_TRANSFER_SECONDS = int(os.getenv('PLANNER_MIN_TRANSFER', 900))
+MAX_TRANSFERS = int(os.getenv('PLANNER_MAX_TRANSFERS', 3))
+# Days of the daily timetable a journey may span
+HORIZON_DAYS = int(os.getenv('PLANNER_HORIZON_DAYS', 3))
+
+DAY = 86400
+
+
+def _seconds(value):
+    # MySQL TIME columns come back as timedelta
+    if hasattr(value, 'total_seconds'):
+        return int(value.total_seconds()) % DAY
+    hours, minutes, *rest = (int(part) for part in str(value).split(':'))
+    return (hours * 3600 + minutes * 60 + (rest[0] if rest else 0)) % DAY
+
+
+def _clock(seconds):
+    seconds %= DAY
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+# Round-based connection search over the daily timetable (RAPTOR style).
+#
+# Every train hop is a connection (departure, arrival, from stop, to stop,
+# trip) stored in flat arrays, with a pointer to the trip's next hop. Each
+# stop keeps its outgoing departures as a sorted array, so boarding is a
+# binary search at the time a passenger can be on the platform. Round k only
+# scans stops first reached in round k - 1 (i.e. with k - 1 transfers), which
+# yields earliest arrival and fewest transfers in one pass and keeps queries
+# proportional to the part of the network actually reachable.
+class JourneyPlanner:
+    def __init__(self, min_transfer=MIN_TRANSFER_SECONDS, max_transfers=MAX_TRANSFERS, horizon_days=HORIZON_DAYS):
+        self.min_transfer = min_transfer
+        self.max_transfers = max_transfers
+        self.horizon_days = horizon_days
+        self._lock = threading.Lock()
+        self._reset()
+        self.stations = {}
+        self.codes = {}
+        self.versions = None
+        self.built_at = None
+        self.build_seconds = None
+
+    def _reset(self):
+        self.departures = array('i')
+        self.arrivals = array('i')
+        self.from_stops = array('i')
+        self.to_stops = array('i')
+        self.trips = array('i')
+        self.hop_numbers = array('i')
+        self.next_hops = array('i')
+        # stop -> (sorted departure seconds, connection index for each)
+        self.by_stop = {}
+        self.trip_names = {}
+
+    def _current_versions(self):
+        return (reference_cache.version('schedules'), reference_cache.version('stations'))
+
+    # Append the hops of one trip, each (departure, arrival, from, to) in
+    # seconds since the trip's first departure day, linked in travel order
+    def _append_trip(self, trip, name, hops):
+        first = len(self.departures)
+        for number, (departure, arrival, source, destination) in enumerate(hops):
+            self.departures.append(departure)
+            self.arrivals.append(arrival)
+            self.from_stops.append(source)
+            self.to_stops.append(destination)
+            self.trips.append(trip)
+            self.hop_numbers.append(number)
+            self.next_hops.append(first + number + 1 if number + 1 < len(hops) else -1)
+        self.trip_names[trip] = name
+        return range(first, len(self.departures))
+
+    def _index(self, indexes):
+        per_stop = {}
+        for index in indexes:
+            per_stop.setdefault(self.from_stops[index], []).append((self.departures[index], index))
+        for stop, entries in per_stop.items():
+            if stop in self.by_stop:
+                departures, connections = self.by_stop[stop]
+                for departure, index in entries:
+                    position = bisect.bisect_right(departures, departure)
+                    departures.insert(position, departure)
+                    connections.insert(position, index)
+            else:
+                entries.sort()
+                self.by_stop[stop] = (array('i', (d for d, _ in entries)), array('i', (i for _, i in entries)))
+
+    def _load_stations(self, cursor):
+        cursor.execute("SELECT station_id, code, station_name FROM stations")
+        self.stations = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        self.codes = {code: station_id for station_id, (code, _) in self.stations.items()}
+
+    # Hops between consecutive stops of a route given as (station_id,
+    # arrival_offset, departure_offset) minutes after the train's departure
+    def _hops(self, departure, route):
+        start = _seconds(departure)
+        return [
+            (start + route[k][2] * 60, start + route[k + 1][1] * 60, route[k][0], route[k + 1][0])
+            for k in range(len(route) - 1)
+        ]
+
+    # Build the connection arrays and per-stop indexes from scratch
+    def rebuild(self, connection):
+        started = time.perf_counter()
+        versions = self._current_versions()
+        cursor = connection.cursor()
+        try:
+            self._load_stations(cursor)
+            cursor.execute("""
+                SELECT schedule_id, train_name, source_station_id, destination_station_id, departure_time, arrival_time
+                FROM train_schedule
+            """)
+            rows = cursor.fetchall()
+            cursor.execute("""
+                SELECT schedule_id, station_id, arrival_offset, departure_offset
+                FROM schedule_stops ORDER BY schedule_id, stop_sequence
+            """)
+            routes = {}
+            for schedule_id, station_id, arrival, departure in cursor.fetchall():
+                routes.setdefault(schedule_id, []).append((station_id, arrival, departure))
+        finally:
+            cursor.close()
+
+        with self._lock:
+            self._reset()
+            for schedule_id, name, source, destination, departure, arrival in rows:
+                route = routes.get(schedule_id)
+                if route is None or len(route) < 2:
+                    if source is None or destination is None or departure is None or arrival is None:
+                        continue
+                    route = direct_route(source, destination, departure, arrival)
+                if departure is None:
+                    continue
+                self._append_trip(schedule_id, name, self._hops(departure, route))
+            self._index(range(len(self.departures)))
+            self.versions = versions
+            self.built_at = time.time()
+            self.build_seconds = round(time.perf_counter() - started, 4)
+
+    # Rebuild when another worker (or the importer) changed schedules or
+    # stations since the arrays were built
+    def ensure_current(self, connection):
+        versions = self._current_versions()
+        if self.versions is None or versions[0] != self.versions[0]:
+            self.rebuild(connection)
+        elif versions[1] != self.versions[1]:
+            cursor = connection.cursor()
+            try:
+                self._load_stations(cursor)
+            finally:
+                cursor.close()
+            self.versions = versions
+
+    # Add one new schedule in place instead of rebuilding. Call after the
+    # schedules dataset was invalidated so the new stamp is recorded.
+    def add_schedule(self, schedule_id, train_name, departure, route):
+        with self._lock:
+            if self.versions is None:
+                return
+            if any(station_id not in self.stations for station_id, _, _ in route):
+                # New station: let the next query do a full rebuild
+                self.versions = None
+                return
+            self._index(self._append_trip(schedule_id, train_name, self._hops(departure, route)))
+            self.versions = self._current_versions()
+
+    # Force a full rebuild on the next query (bulk imports), even if the
+    # cache signal file could not be written
+    def invalidate(self):
+        with self._lock:
+            self.versions = None
+
+    def warm(self, connection_factory):
+        try:
+            with connection_factory() as connection:
+                self.rebuild(connection)
+        except Exception as e:
+            print(f"Journey planner warm-up failed: {e}")
+
+    def _rounds(self, origin, target, start, max_transfers, min_transfer):
+        arrivals, to_stops, trips = self.arrivals, self.to_stops, self.trips
+        hop_numbers, next_hops = self.hop_numbers, self.next_hops
+        labels = {origin: start}
+        pointers = {}
+        marked = [origin]
+        rounds = []
+
+        for round_number in range(max_transfers + 1):
+            previous = labels
+            labels = dict(previous)
+            pointers = dict(pointers)
+            improved = set()
+            # (trip, day offset) -> earliest hop boarded this round
+            boarded = {}
+            best = labels.get(target)
+
+            for stop in marked:
+                if stop not in self.by_stop:
+                    continue
+                departures, connections = self.by_stop[stop]
+                ready = previous[stop] + (0 if stop == origin else min_transfer)
+                for day in range(self.horizon_days):
+                    offset = day * DAY
+                    for position in range(bisect.bisect_left(departures, ready - offset), len(departures)):
+                        if best is not None and departures[position] + offset >= best:
+                            break
+                        board = connections[position]
+                        trip = (trips[board], offset)
+                        if boarded.get(trip, hop_numbers[board] + 1) <= hop_numbers[board]:
+                            continue
+                        boarded[trip] = hop_numbers[board]
+
+                        # Ride the trip to every later stop
+                        hop = board
+                        while hop != -1:
+                            arrival = arrivals[hop] + offset
+                            if best is not None and arrival >= best:
+                                break
+                            destination = to_stops[hop]
+                            known = labels.get(destination)
+                            if known is None or arrival < known:
+                                labels[destination] = arrival
+                                pointers[destination] = ((board, offset), (hop, offset), round_number)
+                                improved.add(destination)
+                                if destination == target:
+                                    best = arrival
+                            hop = next_hops[hop]
+
+            rounds.append((labels, pointers))
+            marked = [stop for stop in improved if stop != target]
+            if not marked:
+                break
+        return rounds
+
+    # Walk the leg pointers back from the target; a leg found in round r
+    # boarded at a stop reached in round r - 1
+    def _journey(self, round_pointers, round_number, target):
+        legs = []
+        stop = target
+        while True:
+            (board, board_offset), (alight, alight_offset), round_number = round_pointers[round_number][stop]
+            legs.append(self._leg(board, board_offset, alight, alight_offset))
+            stop = self.from_stops[board]
+            if round_number == 0:
+                break
+            round_number -= 1
+        legs.reverse()
+        first, last = legs[0], legs[-1]
+        return {
+            'departure': first['departure'],
+            'arrival': last['arrival'],
+            'arrival_day_offset': last['arrival_day_offset'],
+            'duration_seconds': last['_arrival_abs'] - first['_departure_abs'],
+            'transfers': len(legs) - 1,
+            'legs': [{k: v for k, v in leg.items() if not k.startswith('_')} for leg in legs]
+        }
+
+    def _leg(self, board, board_offset, alight, alight_offset):
+        departure = self.departures[board] + board_offset
+        arrival = self.arrivals[alight] + alight_offset
+        source, destination = self.from_stops[board], self.to_stops[alight]
+        return {
+            'schedule_id': self.trips[board],
+            'train_name': self.trip_names.get(self.trips[board]),
+            'from': self.stations[source][0],
+            'from_name': self.stations[source][1],
+            'to': self.stations[destination][0],
+            'to_name': self.stations[destination][1],
+            'departure': _clock(departure),
+            'departure_day_offset': departure // DAY,
+            'arrival': _clock(arrival),
+            'arrival_day_offset': arrival // DAY,
+            '_departure_abs': departure,
+            '_arrival_abs': arrival
+        }
+
+    # Earliest-arrival and fewest-transfer journeys between two station codes,
+    # leaving at or after `departure_after` (seconds of day). Returns None for
+    # unknown stations.
+    def plan(self, from_code, to_code, departure_after=0, max_transfers=None, min_transfer=None):
+        origin, target = self.codes.get(from_code), self.codes.get(to_code)
+        if origin is None or target is None:
+            return None
+        max_transfers = self.max_transfers if max_transfers is None else max_transfers
+        min_transfer = self.min_transfer if min_transfer is None else min_transfer
+
+        with self._lock:
+            rounds = self._rounds(origin, target, departure_after, max_transfers, min_transfer) if origin != target else []
+            round_pointers = [pointers for _, pointers in rounds]
+
+            # One option per transfer count that arrives earlier than any
+            # option with fewer transfers (the Pareto front)
+            options = []
+            best = None
+            for round_number, (labels, _) in enumerate(rounds):
+                arrival = labels.get(target)
+                if arrival is not None and (best is None or arrival < best):
+                    best = arrival
+                    options.append(self._journey(round_pointers, round_number, target))
+
+        return {
+            'from': from_code,
+            'to': to_code,
+            'departure_after': _clock(departure_after),
+            'min_transfer_seconds': min_transfer,
+            'earliest_arrival': options[-1] if options else None,
+            'fewest_transfers': options[0] if options else None,
+            'options': options
+        }
+
+    def stats(self):
+        return {
+            'connections': len(self.departures),
+            'trips': len(self.trip_names),
+            'stations': len(self.stations),
+            'built_at': self.built_at,
+            'build_seconds': self.build_seconds
+        }
+
+
+journey_planner = JourneyPlanner()
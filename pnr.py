@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# PNR status is served from booking_summary: one row per booking holding
+# everything pnrstatus.html shows, written in the booking transaction, so a
+# lookup is a single primary-key read instead of a 7-table join. Lookups go
+# through a bounded LRU cache per worker; entries are dropped when a booking
+# changes in this worker, and PNR_CACHE_TTL bounds how long another worker
+# can serve a stale copy.
+PNR_CACHE_SIZE = int(os.getenv('PNR_CACHE_SIZE', 50000))
+PNR_CACHE_TTL = float(os.getenv('PNR_CACHE_TTL', 30))
+PNR_BATCH_LIMIT = int(os.getenv('PNR_BATCH_LIMIT', 100))
+BACKFILL_BATCH_SIZE = 5000
+
+SUMMARY_COLUMNS = (
+    'booking_id', 'passenger_id', 'schedule_id', 'booking_date', 'name', 'email', 'train_name',
+    'source_name', 'destination_name', 'seat_number', 'seat_numbers', 'travel_date', 'amount', 'payment_method',
+    'status', 'waitlist_number'
+)
+
+# The summary row of each matching booking, built from the normalized tables.
+# Payments are aggregated so a second payment row cannot duplicate seats.
+# Waitlisted bookings have no tickets yet and take their travel date from
+# the waitlist entry. The name is the one the booking was made under
+# (bookings from before migration 11 fall back to the passenger's).
+_SUMMARY_SELECT = """
+    SELECT b.booking_id, b.passenger_id, b.schedule_id, b.booking_date, COALESCE(b.passenger_name, p.name), p.email,
+           ts.train_name, s1.station_name, s2.station_name,
+           SUBSTRING_INDEX(GROUP_CONCAT(t.seat_number ORDER BY t.ticket_id), ',', 1),
+           GROUP_CONCAT(t.seat_number ORDER BY t.ticket_id),
+           COALESCE(MIN(t.travel_date), w.travel_date), py.amount, py.payment_method,
+           b.status, w.waitlist_number
+    FROM bookings b
+    JOIN passengers p ON b.passenger_id = p.passenger_id
+    JOIN train_schedule ts ON b.schedule_id = ts.schedule_id
+    JOIN stations s1 ON ts.source_station_id = s1.station_id
+    JOIN stations s2 ON ts.destination_station_id = s2.station_id
+    LEFT JOIN tickets t ON b.booking_id = t.booking_id
+    LEFT JOIN waitlist w ON b.booking_id = w.booking_id
+    JOIN (
+        SELECT booking_id, MIN(amount) as amount, MIN(payment_method) as payment_method
+        FROM payments WHERE {payment_filter} GROUP BY booking_id
+    ) py ON b.booking_id = py.booking_id
+    WHERE {booking_filter}
+    GROUP BY b.booking_id, b.passenger_id, b.schedule_id, b.booking_date, b.passenger_name, p.name, p.email,
+             ts.train_name, s1.station_name, s2.station_name, py.amount, py.payment_method, b.status,
+             w.travel_date, w.waitlist_number
+"""
+
+
+def _placeholders(count):
+    return ', '.join(['%s'] * count)
+
+
+# Primary-key read of summary rows
+def summary_query(booking_ids):
+    return (
+        f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM booking_summary WHERE booking_id IN ({_placeholders(len(booking_ids))})",
+        tuple(booking_ids)
+    )
+
+
+# (Re)write the summary rows of the given bookings from the normalized tables
+def refresh_statement(booking_ids):
+    ids = _placeholders(len(booking_ids))
+    select = _SUMMARY_SELECT.format(payment_filter=f"booking_id IN ({ids})", booking_filter=f"b.booking_id IN ({ids})")
+    return f"REPLACE INTO booking_summary ({', '.join(SUMMARY_COLUMNS)}) {select}", tuple(booking_ids) * 2
+
+
+def refresh(cursor, booking_ids):
+    if not booking_ids:
+        return 0
+    cursor.execute(*refresh_statement(booking_ids))
+    return cursor.rowcount
+
+
+# Write summaries for bookings that have none yet (bookings made before the
+# table existed), one booking_id range per statement
+def backfill(cursor, batch_size=BACKFILL_BATCH_SIZE):
+    cursor.execute("SELECT MIN(booking_id), MAX(booking_id) FROM bookings")
+    low, high = cursor.fetchone()
+    written = 0
+    if low is None:
+        return written
+    for start in range(low, high + 1, batch_size):
+        end = start + batch_size - 1
+        select = _SUMMARY_SELECT.format(
+            payment_filter='booking_id BETWEEN %s AND %s',
+            booking_filter='b.booking_id BETWEEN %s AND %s '
+                           'AND NOT EXISTS (SELECT 1 FROM booking_summary bs WHERE bs.booking_id = b.booking_id)'
+        )
+        cursor.execute(
+            f"INSERT IGNORE INTO booking_summary ({', '.join(SUMMARY_COLUMNS)}) {select}",
+            (start, end, start, end)
+        )
+        written += cursor.rowcount
+    return written
+
+
+# Response body of one summary row (dict), as GET /api/bookings/<id> returns it
+def summary_response(row):
+    row['seat_numbers'] = row['seat_numbers'].split(',') if row.get('seat_numbers') else []
+    return row
+
+
+# Bounded LRU of PNR responses keyed by booking_id
+class PnrCache:
+    def __init__(self, max_size=PNR_CACHE_SIZE, ttl=PNR_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0}
+
+    # Cached responses for the ids, and the ids that must be read
+    def get_many(self, booking_ids):
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for booking_id in booking_ids:
+                entry = self._entries.get(booking_id)
+                if entry is not None and now - entry[1] >= self.ttl:
+                    del self._entries[booking_id]
+                    self._counters['expired'] += 1
+                    entry = None
+                if entry is None:
+                    self._counters['misses'] += 1
+                    missing.append(booking_id)
+                else:
+                    self._entries.move_to_end(booking_id)
+                    self._counters['hits'] += 1
+                    found[booking_id] = entry[0]
+        return found, missing
+
+    def put(self, booking_id, booking):
+        with self._lock:
+            self._entries[booking_id] = (booking, time.monotonic())
+            self._entries.move_to_end(booking_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def invalidate(self, *booking_ids):
+        with self._lock:
+            for booking_id in booking_ids:
+                if self._entries.pop(booking_id, None) is not None:
+                    self._counters['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return dict(
+                self._counters,
+                entries=len(self._entries),
+                hit_rate=round(self._counters['hits'] / lookups, 4) if lookups else 0.0
+            )
+
+
+pnr_cache = PnrCache()
+
+
+def store_summaries(rows):
+    result = {}
+    for row in rows:
+        booking = summary_response(row)
+        pnr_cache.put(row['booking_id'], booking)
+        result[row['booking_id']] = booking
+    return result
+
+
+# PNR responses for the ids that exist, keyed by booking_id. A connection is
+# only borrowed when something is not cached. A booking with no summary row
+# yet (made before the table existed) gets one written on its first lookup.
+def lookup(connection_factory, booking_ids):
+    found, missing = pnr_cache.get_many(booking_ids)
+    if not missing:
+        return found
+    with connection_factory() as connection:
+        with connection.cursor(dictionary=True) as cursor:
+            cursor.execute(*summary_query(missing))
+            found.update(store_summaries(cursor.fetchall()))
+            unwritten = [booking_id for booking_id in missing if booking_id not in found]
+            if unwritten and refresh(cursor, unwritten):
+                connection.commit()
+                cursor.execute(*summary_query(unwritten))
+                found.update(store_summaries(cursor.fetchall()))
+    return found
+
+
+# Booking ids of a batch request body {"pnrs": [...]}, deduplicated in order;
+# raises ValueError with the message for a 400
+def parse_batch(data):
+    pnrs = data.get('pnrs') if isinstance(data, dict) else None
+    if not isinstance(pnrs, list) or not pnrs:
+        raise ValueError('pnrs must be a non-empty list of booking ids')
+    if len(pnrs) > PNR_BATCH_LIMIT:
+        raise ValueError(f"At most {PNR_BATCH_LIMIT} PNRs per request")
+    try:
+        return list(dict.fromkeys(int(pnr) for pnr in pnrs))
+    except (TypeError, ValueError):
+        raise ValueError('pnrs must be a non-empty list of booking ids')
+
+
+# PNR lookups are public and booking ids are sequential, so the passenger's
+# email is never returned. Batch lookups take up to PNR_BATCH_LIMIT ids at a
+# time and also leave out who is travelling.
+PUBLIC_HIDDEN_FIELDS = ('email',)
+BATCH_HIDDEN_FIELDS = ('passenger_id', 'name', 'email')
+
+
+# Copy of a cached summary without the hidden fields
+def _without(booking, hidden):
+    return {key: value for key, value in booking.items() if key not in hidden}
+
+
+def public_response(booking):
+    return _without(booking, PUBLIC_HIDDEN_FIELDS)
+
+
+def batch_response(booking_ids, found):
+    return {
+        'bookings': [_without(found[booking_id], BATCH_HIDDEN_FIELDS)
+                     for booking_id in booking_ids if booking_id in found],
+        'not_found': [booking_id for booking_id in booking_ids if booking_id not in found]
+    }
+
+
+if __name__ == '__main__':
+    from db import get_connection
+
+    parser = argparse.ArgumentParser(description='PNR booking summaries')
+    parser.add_argument('command', choices=['backfill'], help='write summaries for bookings that have none')
+    parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            written = backfill(cursor, args.batch_size)
+            connection.commit()
+        finally:
+            cursor.close()
+    print(json.dumps({'written': written}, indent=2))
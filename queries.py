@@ -0,0 +1,104 @@
+from datetime import datetime
+
+from inventory import SEAT_CLASSES, class_capacity
+
+# Read paths served by both the Flask app and the async server (asgi.py).
+# Each is split into building the SQL, which either MySQL driver can run,
+# and shaping the fetched rows into the response body, so the two entry
+# points cannot drift apart.
+
+
+# Search trains between two stations (stations.code, then schedule_stops by
+# idx_stop_station at the origin and the primary key for the later stops)
+SEARCH_SORTS = {
+    'departure': 'departure_seconds, s.schedule_id',
+    'duration': 'duration_seconds, departure_seconds, s.schedule_id'
+}
+
+
+# Validate search query arguments; raises ValueError with the message for a 400
+def parse_search(args):
+    search = {
+        'source_code': args.get('from', '').strip().upper(),
+        'destination_code': args.get('to', '').strip().upper(),
+        'travel_date': args.get('date') or None,
+        'seat_class': args.get('class') or None,
+        'sort': args.get('sort', 'departure')
+    }
+    if not search['source_code'] or not search['destination_code']:
+        raise ValueError('Both from and to station codes are required')
+    if search['sort'] not in SEARCH_SORTS:
+        raise ValueError(f"sort must be one of: {', '.join(SEARCH_SORTS)}")
+    if search['seat_class'] and search['seat_class'] not in SEAT_CLASSES:
+        raise ValueError(f"class must be one of: {', '.join(SEAT_CLASSES)}")
+    try:
+        search['page'] = max(int(args.get('page', 1)), 1)
+        search['limit'] = min(max(int(args.get('limit', 20)), 1), 100)
+        if search['travel_date']:
+            datetime.strptime(search['travel_date'], '%Y-%m-%d')
+    except ValueError:
+        raise ValueError('Invalid page, limit or date (expected YYYY-MM-DD)')
+    return search
+
+
+# Trains that stop at the origin and later at the destination; clock times at
+# both stops come from the stop offsets. Fetches one extra row to know whether
+# another page exists.
+def search_statement(search):
+    query = f"""
+    SELECT s.schedule_id as id, s.train_name, ss.station_name as source, ds.station_name as destination,
+           ss.code as from_code, ds.code as to_code, fs.stop_sequence as from_stop, ts.stop_sequence as to_stop,
+           SEC_TO_TIME(MOD(TIME_TO_SEC(s.departure_time) + fs.departure_offset * 60, 86400)) as departure_time,
+           SEC_TO_TIME(MOD(TIME_TO_SEC(s.departure_time) + ts.arrival_offset * 60, 86400)) as arrival_time,
+           MOD(TIME_TO_SEC(s.departure_time) + fs.departure_offset * 60, 86400) as departure_seconds,
+           (ts.arrival_offset - fs.departure_offset) * 60 as duration_seconds,
+           s.total_seats
+    FROM stations ss
+    JOIN schedule_stops fs ON fs.station_id = ss.station_id
+    JOIN schedule_stops ts ON ts.schedule_id = fs.schedule_id AND ts.stop_sequence > fs.stop_sequence
+    JOIN stations ds ON ds.station_id = ts.station_id
+    JOIN train_schedule s ON s.schedule_id = fs.schedule_id
+    WHERE ss.code = %s AND ds.code = %s
+    ORDER BY {SEARCH_SORTS[search['sort']]}
+    LIMIT %s OFFSET %s
+    """
+    limit = search['limit']
+    return query, (search['source_code'], search['destination_code'], limit + 1, (search['page'] - 1) * limit)
+
+
+# Legs and seat totals of this page's trains, for leg_availability
+def search_legs(search, schedules):
+    schedules = schedules[:search['limit']]
+    return (
+        {s['id']: (s['from_stop'], s['to_stop']) for s in schedules},
+        {s['id']: s['total_seats'] for s in schedules}
+    )
+
+
+# Seats free on each train's leg come from the per-segment seat maps; dates
+# with no sales yet are fully available
+def search_response(search, schedules, availability):
+    limit = search['limit']
+    has_more = len(schedules) > limit
+    seat_class = search['seat_class']
+    results = []
+    for schedule in schedules[:limit]:
+        if schedule['id'] in availability:
+            schedule['available_seats'] = sum(availability[schedule['id']].values())
+        elif seat_class:
+            schedule['available_seats'] = class_capacity(schedule['total_seats'], seat_class)
+        else:
+            schedule['available_seats'] = schedule['total_seats']
+        for key in ('departure_seconds', 'total_seats', 'from_stop', 'to_stop'):
+            del schedule[key]
+        results.append(schedule)
+
+    return {
+        'results': results,
+        'page': search['page'],
+        'limit': limit,
+        'has_more': has_more,
+        'sort': search['sort'],
+        'date': search['travel_date'],
+        'class': seat_class
+    }
@@ -0,0 +1,135 @@
+import argparse
+import json
+import sys
+from datetime import date
+
+from booking import refund_query
+from feedback import feedback_query
+from inventory import leg_availability_query
+from livestatus import LiveStatusStore
+from pnr import refresh_statement, summary_query
+from queries import parse_search, search_statement
+from stats import grouped_query, ranked_query, station_names_query, train_names_query
+from stops import stops_query, terminal_stops_query
+from waitlist import entry_query, queue_position_query
+
+# EXPLAIN every request-path read query, built by the same functions and
+# constants the routes use, and fail when one reads a whole table or walks a
+# whole index. Run it in CI or after a migration against a database with
+# realistic data (init_db.py --synthetic-stations/--synthetic-schedules,
+# benchmark.py --seed-db): on near-empty tables MySQL may choose a scan
+# because it is cheaper. The full listings (GET /api/stations,
+# /api/schedules) and the journey planner's timetable load read whole tables
+# by design and are served from memory, so they are not checked. Writes
+# (booking, cancellation, waitlist promotion, live event ingest, idempotency
+# claims) lock the rows they change by primary or unique key.
+
+
+def _app():
+    # Deferred: app.py builds the Flask app on import
+    import app
+    return app
+
+
+def _bookings(**filters):
+    app = _app()
+    return app.build_bookings_query(filters, app.BOOKINGS_PAGE_SIZE)
+
+
+# (name, build) pairs; build() returns (query, params)
+def checks():
+    today = date.today()
+    ids = [1, 2, 3]
+    search = parse_search({'from': 'NDLS', 'to': 'BSB', 'date': today.isoformat()})
+    return [
+        ('admin_login', lambda: (_app().ADMIN_LOGIN_QUERY, ('admin',))),
+        ('user_login', lambda: (_app().USER_LOGIN_QUERY, ('admin',))),
+        ('signup_username_taken', lambda: (_app().USERNAME_TAKEN_QUERY, ('admin',))),
+        ('schedule_by_id', lambda: (_app().SCHEDULE_QUERY, (1,))),
+        ('schedule_departure', lambda: (_app().SCHEDULE_DEPARTURE_QUERY, (1,))),
+        ('schedule_seats', lambda: (_app().SCHEDULE_SEATS_QUERY, (1,))),
+        ('schedule_stops', lambda: stops_query(1)),
+        ('schedule_terminal_stops', lambda: terminal_stops_query(1)),
+        ('schedule_search', lambda: search_statement(search)),
+        ('leg_availability', lambda: leg_availability_query(today, {i: (0, 1) for i in ids})),
+        ('pnr_lookup', lambda: summary_query(ids)),
+        ('pnr_refresh', lambda: refresh_statement(ids)),
+        ('refund', lambda: refund_query(1)),
+        ('waitlist_entry', lambda: entry_query(1)),
+        ('waitlist_position', lambda: queue_position_query(1, today, 'SL', 1000)),
+        ('bookings_count', lambda: (_app().BOOKINGS_COUNT_QUERY, ())),
+        ('bookings_page', lambda: _bookings()),
+        ('bookings_after_id', lambda: _bookings(after_id='1000')),
+        ('bookings_by_travel_date', lambda: _bookings(from_date=today.isoformat(), to_date=today.isoformat())),
+        ('bookings_by_schedule', lambda: _bookings(schedule_id='1')),
+        ('bookings_by_station', lambda: _bookings(station='NDLS')),
+        ('feedback_page', lambda: feedback_query({})[:2]),
+        ('feedback_after_id', lambda: feedback_query({'after_id': '1000'})[:2]),
+        ('feedback_by_category', lambda: feedback_query({'category': 'General'})[:2]),
+        ('feedback_search', lambda: feedback_query({'q': 'delay'})[:2]),
+        ('dashboard_by_day', lambda: grouped_query('day', 'AND dim_key >= %s', (today.isoformat(),), order='dim_key DESC')),
+        ('dashboard_by_payment', lambda: grouped_query('payment')),
+        ('dashboard_top_trains', lambda: ranked_query('train', 10)),
+        ('dashboard_top_routes', lambda: ranked_query('route', 10)),
+        ('dashboard_train_names', lambda: train_names_query(ids)),
+        ('dashboard_station_names', lambda: station_names_query(ids)),
+        ('live_status_poll', lambda: LiveStatusStore().poll_statement()),
+        # The key bookings upsert passengers on
+        ('passenger_by_email', lambda: ("SELECT passenger_id FROM passengers WHERE email_key = %s", ('a@example.com',))),
+    ]
+
+
+# Checks whose plan walks an index in order and stops at the LIMIT (newest
+# first pages keyed on the primary key): the tables allowed a full index scan
+INDEX_WALKS = {
+    'bookings_page': {'b'},
+    'bookings_by_travel_date': {'b'},
+    'bookings_by_station': {'b'},
+    'feedback_page': {'feedbacks'},
+}
+SCAN_TYPES = ('ALL', 'index')
+
+
+# EXPLAIN one query; returns (plan rows, full table or index scans).
+# Materialized derived tables (<derivedN>) hold already filtered rows and are
+# skipped.
+def explain(cursor, query, params, walks=()):
+    cursor.execute(f"EXPLAIN {query}", tuple(params))
+    plan = cursor.fetchall()
+    scans = [row for row in plan
+             if row.get('type') in SCAN_TYPES and not str(row.get('table') or '').startswith('<')
+             and not (row.get('type') == 'index' and row.get('table') in walks)]
+    return plan, scans
+
+
+def run(connection):
+    report = []
+    cursor = connection.cursor(dictionary=True)
+    try:
+        for name, build in checks():
+            query, params = build()
+            plan, scans = explain(cursor, query, params, INDEX_WALKS.get(name, ()))
+            report.append({
+                'check': name,
+                'full_scans': [{'table': row['table'], 'type': row['type'], 'rows': row.get('rows')} for row in scans],
+                'plan': [{key: row.get(key) for key in ('table', 'type', 'key', 'rows', 'Extra')} for row in plan]
+            })
+        connection.commit()
+    finally:
+        cursor.close()
+    return report
+
+
+if __name__ == '__main__':
+    from db import get_connection
+
+    parser = argparse.ArgumentParser(description='Fail if a request-path query plans a full table or index scan')
+    parser.add_argument('--verbose', action='store_true', help='print every plan, not just failures')
+    args = parser.parse_args()
+
+    with get_connection() as connection:
+        report = run(connection)
+    failures = [entry for entry in report if entry['full_scans']]
+    print(json.dumps(report if args.verbose else failures, indent=2, default=str))
+    print(f"{len(report) - len(failures)}/{len(report)} queries use indexes", file=sys.stderr)
+    sys.exit(1 if failures else 0)
@@ -9,28 +9,38 @@ CREATE TABLE IF NOT EXISTS stations (
 CREATE TABLE IF NOT EXISTS train_schedule (
   schedule_id INT AUTO_INCREMENT PRIMARY KEY,
   train_name VARCHAR(100),
+  train_number VARCHAR(20),
   source_station_id INT,
   destination_station_id INT,
   departure_time TIME,
   arrival_time TIME,
   total_seats INT,
+  INDEX idx_schedule_route (source_station_id, destination_station_id, departure_time),
+  INDEX idx_schedule_destination (destination_station_id),
+  UNIQUE KEY uq_schedule_train_route (train_number, source_station_id, destination_station_id),
   FOREIGN KEY (source_station_id) REFERENCES stations(station_id),
   FOREIGN KEY (destination_station_id) REFERENCES stations(station_id)
 );
 
--- 3. Passengers Table
+-- 3. Passengers Table (one row per email address; bookings upsert on the normalized email_key)
 CREATE TABLE IF NOT EXISTS passengers (
   passenger_id INT AUTO_INCREMENT PRIMARY KEY,
   name VARCHAR(100),
-  email VARCHAR(100)
+  email VARCHAR(100),
+  email_key VARCHAR(100) AS (LOWER(TRIM(email))) VIRTUAL,
+  UNIQUE KEY uq_passenger_email (email_key)
 );
 
 -- 4. Bookings Table
 CREATE TABLE IF NOT EXISTS bookings (
   booking_id INT AUTO_INCREMENT PRIMARY KEY,
   passenger_id INT,
+  passenger_name VARCHAR(100),
   schedule_id INT,
   booking_date DATE,
+  status VARCHAR(12) NOT NULL DEFAULT 'CONFIRMED',
+  cancelled_at DATETIME NULL,
+  cancel_token_hash CHAR(64) NULL,
   FOREIGN KEY (passenger_id) REFERENCES passengers(passenger_id),
   FOREIGN KEY (schedule_id) REFERENCES train_schedule(schedule_id)
 );
@@ -41,6 +51,8 @@ CREATE TABLE IF NOT EXISTS tickets (
   booking_id INT,
   seat_number VARCHAR(20),
   travel_date DATE,
+  INDEX idx_ticket_booking (booking_id, travel_date),
+  INDEX idx_ticket_travel_date (travel_date),
   FOREIGN KEY (booking_id) REFERENCES bookings(booking_id)
 );
 
@@ -51,16 +63,163 @@ CREATE TABLE IF NOT EXISTS payments (
   amount DECIMAL(10, 2),
   payment_date DATETIME,
   payment_method VARCHAR(50),
+  INDEX idx_payment_booking (booking_id, amount, payment_method),
   FOREIGN KEY (booking_id) REFERENCES bookings(booking_id)
 );
 
--- 7. Feedbacks Table
+-- 7. Feedbacks Table (written in batches by each worker's feedback queue; listed newest first by id)
 CREATE TABLE IF NOT EXISTS feedbacks (
     id INT AUTO_INCREMENT PRIMARY KEY,
     email VARCHAR(100) NOT NULL,
     category VARCHAR(50) NOT NULL,
     message TEXT NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_feedback_category (category, id),
+    INDEX idx_feedback_created (created_at),
+    FULLTEXT INDEX ft_feedback_message (message)
+);
+
+-- 8. Seat Reservations (one row per sold seat and leg; the primary key stops two bookings boarding the same seat at the same stop)
+CREATE TABLE IF NOT EXISTS seat_reservations (
+  schedule_id INT NOT NULL,
+  travel_date DATE NOT NULL,
+  seat_number VARCHAR(20) NOT NULL,
+  from_stop SMALLINT NOT NULL DEFAULT 0,
+  to_stop SMALLINT NOT NULL DEFAULT 1,
+  seat_class VARCHAR(5) NOT NULL,
+  booking_id INT NOT NULL,
+  PRIMARY KEY (schedule_id, travel_date, seat_number, from_stop),
+  INDEX idx_reservation_booking (booking_id),
+  FOREIGN KEY (schedule_id) REFERENCES train_schedule(schedule_id),
+  FOREIGN KEY (booking_id) REFERENCES bookings(booking_id)
+);
+
+-- 9. Seat Inventory (seats free over the whole route and one occupancy bitmap per route segment, per schedule, travel date and class; rows are created on first sale)
+CREATE TABLE IF NOT EXISTS seat_inventory (
+  schedule_id INT NOT NULL,
+  travel_date DATE NOT NULL,
+  seat_class VARCHAR(5) NOT NULL,
+  capacity INT NOT NULL,
+  remaining INT NOT NULL,
+  segments SMALLINT NOT NULL DEFAULT 1,
+  seat_map VARBINARY(16384) NOT NULL DEFAULT '',
+  waiting INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (schedule_id, travel_date, seat_class),
+  INDEX idx_inventory_waiting (waiting, travel_date),
+  FOREIGN KEY (schedule_id) REFERENCES train_schedule(schedule_id)
+);
+
+-- 10. Booking Stats (dashboard aggregates per dimension: total, day, train, route, payment; train and route keep one row per key, ranked by revenue)
+CREATE TABLE IF NOT EXISTS booking_stats (
+  dimension VARCHAR(10) NOT NULL,
+  dim_key VARCHAR(50) NOT NULL,
+  slot TINYINT NOT NULL DEFAULT 0,
+  bookings INT NOT NULL DEFAULT 0,
+  tickets INT NOT NULL DEFAULT 0,
+  revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (dimension, dim_key, slot),
+  INDEX idx_stats_rank (dimension, revenue)
+);
+
+-- 11. Schedule Stops (ordered stops of each train; offsets are minutes after the train's departure_time)
+CREATE TABLE IF NOT EXISTS schedule_stops (
+  schedule_id INT NOT NULL,
+  stop_sequence SMALLINT NOT NULL,
+  station_id INT NOT NULL,
+  arrival_offset INT NULL,
+  departure_offset INT NULL,
+  PRIMARY KEY (schedule_id, stop_sequence),
+  INDEX idx_stop_station (station_id, schedule_id, stop_sequence),
+  FOREIGN KEY (schedule_id) REFERENCES train_schedule(schedule_id),
+  FOREIGN KEY (station_id) REFERENCES stations(station_id)
+);
+
+-- 12. Booking Summary (one row per booking with everything PNR status shows, written in the booking transaction; a lookup is one primary-key read)
+CREATE TABLE IF NOT EXISTS booking_summary (
+  booking_id INT PRIMARY KEY,
+  passenger_id INT,
+  schedule_id INT,
+  booking_date DATE,
+  name VARCHAR(100),
+  email VARCHAR(100),
+  train_name VARCHAR(100),
+  source_name VARCHAR(100),
+  destination_name VARCHAR(100),
+  seat_number VARCHAR(20),
+  seat_numbers VARCHAR(255),
+  travel_date DATE,
+  amount DECIMAL(10, 2),
+  payment_method VARCHAR(50),
+  status VARCHAR(12),
+  waitlist_number INT NULL,
+  FOREIGN KEY (booking_id) REFERENCES bookings(booking_id)
+);
+
+-- 13. Live Status (latest derived running state per train; version goes up on every change, and workers poll updated_at for changes)
+CREATE TABLE IF NOT EXISTS live_status (
+  train_number VARCHAR(20) PRIMARY KEY,
+  version INT NOT NULL,
+  reported_at DATETIME(6) NOT NULL,
+  state TEXT NOT NULL,
+  updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+  INDEX idx_live_status_updated (updated_at)
+);
+
+-- 14. Waitlist (queue of waitlisted bookings per schedule, travel date and class; waitlist_id is the queue order and promotion walks the index in batches)
+CREATE TABLE IF NOT EXISTS waitlist (
+  waitlist_id INT AUTO_INCREMENT PRIMARY KEY,
+  schedule_id INT NOT NULL,
+  travel_date DATE NOT NULL,
+  seat_class VARCHAR(5) NOT NULL,
+  from_stop SMALLINT NOT NULL DEFAULT 0,
+  to_stop SMALLINT NOT NULL DEFAULT 1,
+  seat_count TINYINT NOT NULL,
+  preference VARCHAR(10) NULL,
+  booking_id INT NOT NULL,
+  waitlist_number INT NOT NULL,
+  status VARCHAR(12) NOT NULL DEFAULT 'WAITING',
+  created_at DATETIME NOT NULL,
+  promoted_at DATETIME NULL,
+  UNIQUE KEY uq_waitlist_booking (booking_id),
+  INDEX idx_waitlist_queue (schedule_id, travel_date, seat_class, status, waitlist_id),
+  FOREIGN KEY (schedule_id) REFERENCES train_schedule(schedule_id),
+  FOREIGN KEY (booking_id) REFERENCES bookings(booking_id)
+);
+
+-- 15. Refunds (one per cancelled booking; the amount follows the cancellation rules at the time of cancelling)
+CREATE TABLE IF NOT EXISTS refunds (
+  refund_id INT AUTO_INCREMENT PRIMARY KEY,
+  booking_id INT NOT NULL,
+  amount DECIMAL(10, 2) NOT NULL,
+  refund_percent TINYINT NOT NULL,
+  status VARCHAR(12) NOT NULL DEFAULT 'PENDING',
+  reason VARCHAR(255) NULL,
+  created_at DATETIME NOT NULL,
+  UNIQUE KEY uq_refund_booking (booking_id),
+  FOREIGN KEY (booking_id) REFERENCES bookings(booking_id)
+);
+
+-- 16. Idempotency Keys (response of each write request sent with an Idempotency-Key, by hash of endpoint, user and key; PENDING while the first request runs)
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  key_hash BINARY(32) PRIMARY KEY,
+  scope VARCHAR(150) NOT NULL,
+  fingerprint BINARY(32) NOT NULL,
+  state VARCHAR(10) NOT NULL,
+  locked_until DATETIME(6) NOT NULL,
+  expires_at DATETIME(6) NOT NULL,
+  created_at DATETIME(6) NOT NULL,
+  response_status SMALLINT NULL,
+  response_type VARCHAR(100) NULL,
+  response_body MEDIUMBLOB NULL,
+  INDEX idx_idempotency_expires (expires_at)
+);
+
+-- 17. Schema Migrations (versions applied by migrations.py, see migrations.MIGRATIONS)
+CREATE TABLE IF NOT EXISTS schema_migrations (
+  version INT PRIMARY KEY,
+  name VARCHAR(100) NOT NULL,
+  applied_at DATETIME NOT NULL,
+  duration_ms INT NOT NULL
 );
 
 -- Optional Admin Table
@@ -0,0 +1,157 @@
+# Coach layouts and a bitmap seat allocator.
+#
+# Occupancy for one (schedule, travel_date, class) is a single integer bitmap:
+# bit n is seat n (0-based) counted coach by coach. Finding a free seat is a
+# couple of big-int operations (free & -free) rather than a scan, and the
+# bitmap is stored as bytes on the seat_inventory row so it can be read and
+# written under that row's lock.
+
+# berths per coach, coach code prefix and the berth pattern of one bay
+COACH_LAYOUTS = {
+    'SL': (72, 'S', ('LB', 'MB', 'UB', 'LB', 'MB', 'UB', 'SL', 'SU')),
+    '3A': (64, 'B', ('LB', 'MB', 'UB', 'LB', 'MB', 'UB', 'SL', 'SU')),
+    '2A': (48, 'A', ('LB', 'UB', 'LB', 'UB', 'SL', 'SU')),
+    '1A': (24, 'H', ('LB', 'UB', 'LB', 'UB'))
+}
+
+# Berth types that satisfy each preference hint
+PREFERENCES = {
+    'lower': ('LB', 'SL'),
+    'window': ('LB', 'SL', 'SU')
+}
+
+MAX_GROUP_SIZE = 6
+
+_mask_cache = {}
+
+
+def decode_map(raw):
+    return int.from_bytes(raw or b'', 'little')
+
+
+def encode_map(occupied):
+    return occupied.to_bytes((occupied.bit_length() + 7) // 8, 'little')
+
+
+# Multi-stop trains keep one occupancy bitmap per segment (stop k to k + 1),
+# stored back to back in seat_map at a fixed width. Single-segment maps keep
+# the original variable-length format.
+def decode_segments(raw, segments, capacity):
+    if segments <= 1:
+        return [decode_map(raw)]
+    raw = raw or b''
+    width = (capacity + 7) // 8
+    return [decode_map(raw[k * width:(k + 1) * width]) for k in range(segments)]
+
+
+def encode_segments(maps, capacity):
+    if len(maps) == 1:
+        return encode_map(maps[0])
+    width = (capacity + 7) // 8
+    return b''.join(occupied.to_bytes(width, 'little') for occupied in maps)
+
+
+# Seats taken on any segment of stops start .. end
+def leg_occupancy(maps, start, end):
+    occupied = 0
+    for segment in maps[start:end]:
+        occupied |= segment
+    return occupied
+
+
+def free_count(occupied, capacity):
+    return bin(((1 << capacity) - 1) & ~occupied).count('1')
+
+
+def seat_label(seat_class, index):
+    per_coach, prefix, _ = COACH_LAYOUTS[seat_class]
+    coach, berth = divmod(index, per_coach)
+    return f"{seat_class}-{prefix}{coach + 1}-{berth + 1}"
+
+
+def berth_type(seat_class, index):
+    per_coach, _, bay = COACH_LAYOUTS[seat_class]
+    return bay[(index % per_coach) % len(bay)]
+
+
+def _masks(seat_class, capacity):
+    key = (seat_class, capacity)
+    masks = _mask_cache.get(key)
+    if masks is None:
+        per_coach, _, bay = COACH_LAYOUTS[seat_class]
+        masks = {'all': (1 << capacity) - 1, 'bays': [], 'coaches': []}
+        for name, berths in PREFERENCES.items():
+            masks[name] = sum(1 << i for i in range(capacity) if berth_type(seat_class, i) in berths)
+        for start in range(0, capacity, len(bay)):
+            end = min(start + len(bay), capacity)
+            masks['bays'].append(((1 << end) - 1) ^ ((1 << start) - 1))
+        for start in range(0, capacity, per_coach):
+            end = min(start + per_coach, capacity)
+            masks['coaches'].append(((1 << end) - 1) ^ ((1 << start) - 1))
+        _mask_cache[key] = masks
+    return masks
+
+
+def _take_lowest(free, count):
+    picked = []
+    while free and len(picked) < count:
+        low = free & -free
+        picked.append(low.bit_length() - 1)
+        free ^= low
+    return picked
+
+
+def _pick(free, count, preferred):
+    # Fill preferred berths first, then anything else that is free
+    picked = _take_lowest(free & preferred, count) if preferred else []
+    if len(picked) < count:
+        taken = sum(1 << i for i in picked)
+        picked += _take_lowest(free & ~taken, count - len(picked))
+    return picked
+
+
+# Choose `count` free seats from the occupancy bitmap. Groups are kept in one
+# bay if possible, then in one coach, before being spread across the train.
+# Returns the sorted seat indexes, or None if there are not enough free seats.
+def allocate(occupied, seat_class, capacity, count=1, preference=None):
+    masks = _masks(seat_class, capacity)
+    free = masks['all'] & ~occupied
+    if bin(free).count('1') < count:
+        return None
+    preferred = masks.get(preference, 0)
+
+    if count > 1:
+        for group in ('bays', 'coaches'):
+            for unit in masks[group]:
+                unit_free = free & unit
+                if bin(unit_free).count('1') >= count:
+                    return sorted(_pick(unit_free, count, preferred))
+
+    return sorted(_pick(free, count, preferred))
+
+
+def mark(occupied, indexes):
+    for index in indexes:
+        occupied |= 1 << index
+    return occupied
+
+
+def unmark(occupied, indexes):
+    for index in indexes:
+        occupied &= ~(1 << index)
+    return occupied
+
+
+# Seat index of a label written by seat_label, or None if it is not one
+def seat_index(seat_class, label):
+    per_coach, prefix, _ = COACH_LAYOUTS[seat_class]
+    try:
+        label_class, coach, berth = str(label).split('-')
+        if label_class != seat_class or not coach.startswith(prefix):
+            return None
+        coach, berth = int(coach[len(prefix):]) - 1, int(berth) - 1
+    except ValueError:
+        return None
+    if coach < 0 or not 0 <= berth < per_coach:
+        return None
+    return coach * per_coach + berth
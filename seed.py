@@ -0,0 +1,346 @@
+import random
+import re
+
+from mysql.connector import Error
+
+import migrations
+import pnr
+import stops
+from passwords import hash_password
+
+# Real Indian Railway Data
+REAL_STATIONS = [
+    ("New Delhi", "NDLS"),
+    ("Mumbai Central", "MMCT"),
+    ("Kolkata Howrah", "HWH"),
+    ("Chennai Central", "MAS"),
+    ("KSR Bengaluru", "SBC"),
+    ("Hyderabad Deccan", "HYB"),
+    ("Ahmedabad Junction", "ADI"),
+    ("Pune Junction", "PUNE"),
+    ("Jaipur Junction", "JP"),
+    ("Lucknow Charbagh", "LKO"),
+    ("Varanasi Junction", "BSB"),
+    ("Trivandrum Central", "TVC"),
+    ("Patna Junction", "PNBE"),
+    ("Bhopal Junction", "BPL")
+]
+
+REAL_TRAINS = [
+    # -- New Delhi <-> Varanasi --
+    ("Vande Bharat Exp (22436)", "New Delhi", "Varanasi Junction", "06:00:00", "14:00:00", 1128),
+    ("Shiv Ganga Express (12560)", "New Delhi", "Varanasi Junction", "18:55:00", "07:00:00", 1200),
+    ("Kashi Vishwanath Exp (14258)", "New Delhi", "Varanasi Junction", "11:35:00", "04:30:00", 900),
+    ("Mahamana Express (22418)", "New Delhi", "Varanasi Junction", "18:35:00", "08:25:00", 1000),
+
+    # -- Mumbai <-> New Delhi --
+    ("Mumbai Rajdhani (12951)", "Mumbai Central", "New Delhi", "17:00:00", "08:30:00", 1200),
+    ("August Kranti Rajdhani (12953)", "Mumbai Central", "New Delhi", "17:15:00", "09:40:00", 1100),
+    ("Golden Temple Mail (12903)", "Mumbai Central", "New Delhi", "18:45:00", "07:00:00", 1300),
+    ("Paschim Express (12925)", "Mumbai Central", "New Delhi", "11:25:00", "10:40:00", 1400),
+    ("Maharashtra Sampark Kranti (12907)", "Mumbai Central", "New Delhi", "17:30:00", "13:35:00", 1000),
+    
+    # -- Kolkata <-> New Delhi --
+    ("Howrah Rajdhani (12301)", "Kolkata Howrah", "New Delhi", "16:50:00", "10:00:00", 1200),
+    ("Poorva Express (12303)", "Kolkata Howrah", "New Delhi", "08:00:00", "06:00:00", 1300),
+    ("Netaji Express (12311)", "Kolkata Howrah", "New Delhi", "21:55:00", "20:55:00", 1100),
+
+    # -- Kolkata <-> Chennai --
+    ("Coromandel Express (12841)", "Kolkata Howrah", "Chennai Central", "15:20:00", "16:50:00", 1500),
+    ("Howrah - Chennai Mail (12839)", "Kolkata Howrah", "Chennai Central", "23:55:00", "03:50:00", 1200),
+
+    # -- Delhi <-> Bhopal --
+    ("Shatabdi Express (12002)", "New Delhi", "Bhopal Junction", "06:00:00", "14:30:00", 900),
+    ("Gondwana Express (12406)", "New Delhi", "Bhopal Junction", "15:05:00", "07:30:00", 1100),
+    ("Grand Trunk Express (12616)", "New Delhi", "Bhopal Junction", "16:10:00", "03:35:00", 1250),
+
+    # -- Bangalore <-> Delhi --
+    ("Karnataka Express (12627)", "KSR Bengaluru", "New Delhi", "19:20:00", "09:00:00", 1400),
+    ("Rajdhani Express (22691)", "KSR Bengaluru", "New Delhi", "20:00:00", "05:30:00", 1000),
+    ("YPR DEE Duronto (12213)", "KSR Bengaluru", "New Delhi", "23:40:00", "07:00:00", 800),
+
+    # -- Hyderabad <-> Chennai --
+    ("Charminar Express (12760)", "Hyderabad Deccan", "Chennai Central", "18:00:00", "08:15:00", 1100),
+    ("Chennai Express (12604)", "Hyderabad Deccan", "Chennai Central", "16:50:00", "05:40:00", 1200),
+    ("Kacheguda Express (17652)", "Hyderabad Deccan", "Chennai Central", "16:00:00", "07:00:00", 950),
+
+    # -- Hyderabad <-> Bangalore --
+    ("Kacheguda Exp (12785)", "Hyderabad Deccan", "KSR Bengaluru", "19:05:00", "06:25:00", 1100),
+    ("Wainganga Exp (12252)", "Hyderabad Deccan", "KSR Bengaluru", "21:30:00", "11:00:00", 900),
+
+    # -- Mumbai <-> Ahmedabad --
+    ("Shatabdi Express (12010)", "Ahmedabad Junction", "Mumbai Central", "14:40:00", "21:20:00", 800),
+    ("Gujarat Mail (12902)", "Ahmedabad Junction", "Mumbai Central", "22:00:00", "06:25:00", 1200),
+    ("Karnavati Express (12934)", "Ahmedabad Junction", "Mumbai Central", "04:55:00", "12:15:00", 1000),
+    ("Vande Bharat Exp (20902)", "Ahmedabad Junction", "Mumbai Central", "15:00:00", "20:25:00", 1128),
+    
+    # -- Pune <-> Mumbai --
+    ("Deccan Queen (12124)", "Pune Junction", "Mumbai Central", "07:15:00", "10:25:00", 800),
+    ("Indrayani Express (22106)", "Pune Junction", "Mumbai Central", "18:35:00", "22:00:00", 900),
+    ("Sinhagad Express (11010)", "Pune Junction", "Mumbai Central", "06:05:00", "09:55:00", 1500),
+    ("Deccan Express (11008)", "Pune Junction", "Mumbai Central", "15:15:00", "19:05:00", 1200),
+
+    # -- Lucknow <-> Delhi --
+    ("Gomti Express (12419)", "Lucknow Charbagh", "New Delhi", "06:00:00", "15:00:00", 1000),
+    ("Lucknow Mail (12229)", "Lucknow Charbagh", "New Delhi", "22:00:00", "06:45:00", 1200),
+    ("Shatabdi Express (12003)", "Lucknow Charbagh", "New Delhi", "15:35:00", "22:15:00", 900),
+    
+    # -- Chennai <-> Bangalore --
+    ("Shatabdi Express (12027)", "Chennai Central", "KSR Bengaluru", "17:30:00", "22:25:00", 900),
+    ("Brindavan Express (12640)", "KSR Bengaluru", "Chennai Central", "15:10:00", "21:10:00", 1200),
+    ("Lalbagh Express (12608)", "KSR Bengaluru", "Chennai Central", "06:30:00", "12:35:00", 1100),
+    ("Chennai Mail (12658)", "KSR Bengaluru", "Chennai Central", "22:40:00", "04:20:00", 1400),
+
+    # -- Trivandrum <-> Delhi --
+    ("Kerala Express (12626)", "New Delhi", "Trivandrum Central", "11:25:00", "14:30:00", 1600),
+    ("Rajdhani Express (12432)", "New Delhi", "Trivandrum Central", "10:55:00", "05:15:00", 1000),
+
+    # -- Jaipur <-> Delhi --
+    ("Ajmer Shatabdi (12016)", "New Delhi", "Jaipur Junction", "06:10:00", "10:45:00", 800),
+    ("Pink City Express (12964)", "Jaipur Junction", "New Delhi", "11:00:00", "16:00:00", 1000),
+    ("Double Decker Exp (12985)", "Jaipur Junction", "New Delhi", "06:00:00", "10:30:00", 1300),
+
+    # -- Cross Country --
+    ("Sanghamitra Exp (12295)", "KSR Bengaluru", "Patna Junction", "09:00:00", "07:40:00", 1400),
+    ("Patna Rajdhani (12309)", "Patna Junction", "New Delhi", "17:30:00", "06:00:00", 1100),
+    ("Bhopal Express (12155)", "Bhopal Junction", "New Delhi", "21:00:00", "05:00:00", 1200),
+    ("Ganga Kaveri Exp (12670)", "Varanasi Junction", "Chennai Central", "21:00:00", "14:00:00", 1300),
+    ("Sabarmati Express (19167)", "Ahmedabad Junction", "Varanasi Junction", "20:00:00", "04:00:00", 900),
+    ("Duronto Express (12245)", "Kolkata Howrah", "KSR Bengaluru", "10:50:00", "16:00:00", 1200),
+]
+
+SEED_BATCH_SIZE = 5000
+DEFAULT_SEED = 42
+
+TRAIN_NUMBER_PATTERN = re.compile(r'\((\d{4,6})\)')
+
+# Tables emptied by --reset, children first
+RESET_TABLES = (
+    'idempotency_keys', 'live_status', 'refunds', 'waitlist', 'booking_stats', 'booking_summary', 'seat_inventory', 'seat_reservations', 'payments',
+    'tickets', 'bookings', 'passengers', 'schedule_stops', 'train_schedule', 'stations'
+)
+
+
+# Split a SQL script into statements. Semicolons inside quoted strings and
+# comments do not end a statement, and comments are dropped.
+def split_sql(script):
+    statements = []
+    current = []
+    i, n = 0, len(script)
+    while i < n:
+        ch = script[i]
+        if ch in "'\"`":
+            end = i + 1
+            while end < n and script[end] != ch:
+                end += 2 if script[end] == '\\' and ch != '`' else 1
+            current.append(script[i:end + 1])
+            i = end + 1
+        elif script.startswith('--', i) and (i + 2 == n or script[i + 2].isspace()) or ch == '#':
+            end = script.find('\n', i)
+            i = n if end == -1 else end + 1
+            current.append('\n')
+        elif script.startswith('/*', i):
+            end = script.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+            current.append(' ')
+        elif ch == ';':
+            statements.append(''.join(current).strip())
+            current = []
+            i += 1
+        else:
+            current.append(ch)
+            i += 1
+    statements.append(''.join(current).strip())
+    return [s for s in statements if s]
+
+
+def apply_schema(cursor, path='schema.sql'):
+    with open(path, 'r') as f:
+        statements = split_sql(f.read())
+    outputs = []
+    for statement in statements:
+        try:
+            cursor.execute(statement)
+            outputs.append(f"Executed: {statement[:30]}...")
+        except Error as e:
+            outputs.append(f"Skipped/Error: {statement[:30]}... ({e})")
+    return outputs
+
+
+def train_number(name):
+    match = TRAIN_NUMBER_PATTERN.search(name)
+    return match.group(1) if match else None
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def upsert_stations(cursor, stations, batch_size=SEED_BATCH_SIZE):
+    count = 0
+    for batch in _batches(stations, batch_size):
+        cursor.executemany(
+            """
+            INSERT INTO stations (station_name, code) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE station_name = VALUES(station_name)
+            """,
+            batch
+        )
+        count += len(batch)
+    return count
+
+
+def station_ids(cursor):
+    cursor.execute("SELECT code, station_id FROM stations")
+    return dict(cursor.fetchall())
+
+
+# Schedules are (train_number, train_name, source_code, destination_code,
+# departure, arrival, seats) and are upserted on (train_number, route)
+def upsert_schedules(cursor, schedules, ids, batch_size=SEED_BATCH_SIZE):
+    rows = (
+        (number, name, ids[source], ids[destination], departure, arrival, seats)
+        for number, name, source, destination, departure, arrival, seats in schedules
+    )
+    count = 0
+    for batch in _batches(rows, batch_size):
+        cursor.executemany(
+            """
+            INSERT INTO train_schedule
+            (train_number, train_name, source_station_id, destination_station_id, departure_time, arrival_time, total_seats)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                train_name = VALUES(train_name),
+                departure_time = VALUES(departure_time),
+                arrival_time = VALUES(arrival_time),
+                total_seats = VALUES(total_seats)
+            """,
+            batch
+        )
+        count += len(batch)
+    return count
+
+
+def real_network(seed=DEFAULT_SEED):
+    codes = {name: code for name, code in REAL_STATIONS}
+    schedules = [
+        (train_number(name), name, codes[source], codes[destination], departure, arrival, seats)
+        for name, source, destination, departure, arrival, seats in REAL_TRAINS
+    ]
+
+    # One generated express for every city pair without a real train, so
+    # every pair in the station dropdown is connected
+    rng = random.Random(seed)
+    served = {(source, destination) for _, _, source, destination, _, _, _ in schedules}
+    for source_name, source in REAL_STATIONS:
+        for destination_name, destination in REAL_STATIONS:
+            if source == destination or (source, destination) in served:
+                continue
+            dep_hour = rng.randint(5, 22)
+            dep_min = rng.choice(['00', '15', '30', '45'])
+            arr_hour = (dep_hour + rng.randint(4, 24)) % 24
+            schedules.append((
+                f"{source}-{destination}",
+                f"{source_name.split(' ')[0]}-{destination_name.split(' ')[0]} Express",
+                source, destination,
+                f"{dep_hour:02d}:{dep_min}:00", f"{arr_hour:02d}:{dep_min}:00",
+                rng.choice([800, 1000, 1200, 1500])
+            ))
+    return list(REAL_STATIONS), schedules
+
+
+# Deterministic synthetic network for load testing: the same seed always
+# yields the same stations and schedules, so reruns upsert in place
+def synthetic_network(station_count, schedule_count, seed=DEFAULT_SEED):
+    rng = random.Random(seed)
+    stations = [(f"Synthetic Station {i}", f"Z{i:05d}") for i in range(1, station_count + 1)]
+
+    def schedules():
+        if station_count < 2:
+            return
+        for i in range(1, schedule_count + 1):
+            source, destination = rng.sample(range(station_count), 2)
+            dep_hour = rng.randint(0, 23)
+            dep_min = rng.choice(['00', '15', '30', '45'])
+            arr_hour = (dep_hour + rng.randint(1, 30)) % 24
+            yield (
+                f"Z{i:07d}", f"Synthetic Express {i}",
+                stations[source][1], stations[destination][1],
+                f"{dep_hour:02d}:{dep_min}:00", f"{arr_hour:02d}:{dep_min}:00",
+                rng.choice([800, 1000, 1200, 1500])
+            )
+    return stations, schedules()
+
+
+def ensure_admin(cursor):
+    hashed_pw = hash_password('admin123')
+    cursor.execute(
+        """
+        INSERT INTO admin (username, password, is_admin) VALUES ('admin', %s, TRUE)
+        ON DUPLICATE KEY UPDATE is_admin = TRUE
+        """,
+        (hashed_pw,)
+    )
+
+
+def reset(cursor):
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    try:
+        for table in RESET_TABLES:
+            cursor.execute(f"DELETE FROM {table}")
+    finally:
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+
+# Seed the real network (plus an optional synthetic one) in one transaction.
+# Every write is an upsert on a natural key, so running it again is a no-op
+# apart from refreshing names, times and seat counts.
+def seed_database(connection, schema_path=None, synthetic_stations=0, synthetic_schedules=0,
+         seed=DEFAULT_SEED, wipe=False, batch_size=SEED_BATCH_SIZE):
+    outputs = []
+    cursor = connection.cursor()
+    try:
+        if schema_path:
+            outputs += apply_schema(cursor, schema_path)
+            connection.commit()
+        # DDL commits implicitly, so it runs before the seeding transaction
+        for migration in migrations.upgrade(connection):
+            outputs.append(f"Migrated: {migration['version']} {migration['name']} ({migration['duration_ms']} ms)")
+
+        if wipe:
+            reset(cursor)
+
+        stations, schedules = real_network(seed)
+        counts = {'stations': upsert_stations(cursor, stations, batch_size)}
+        ids = station_ids(cursor)
+        counts['schedules'] = upsert_schedules(cursor, schedules, ids, batch_size)
+
+        if synthetic_stations:
+            stations, schedules = synthetic_network(synthetic_stations, synthetic_schedules, seed)
+            counts['stations'] += upsert_stations(cursor, stations, batch_size)
+            ids = station_ids(cursor)
+            counts['schedules'] += upsert_schedules(cursor, schedules, ids, batch_size)
+
+        # Direct trains get their two stops (source and destination)
+        counts['stops'] = stops.backfill(cursor)
+        # PNR summaries for bookings made before booking_summary existed
+        counts['booking_summaries'] = pnr.backfill(cursor)
+
+        ensure_admin(cursor)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    outputs.append(f"Seeded {counts['stations']} stations and {counts['schedules']} schedules")
+    return outputs, counts
+
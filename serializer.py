@@ -0,0 +1,130 @@
+import json
+import os
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+from flask.json.provider import DefaultJSONProvider
+from mysql.connector import FieldType
+from werkzeug.http import http_date
+
+# JSON encoding for API responses. orjson (JSON_ENCODER=orjson, the default)
+# encodes straight to UTF-8 bytes; JSON_ENCODER=json or a missing orjson
+# falls back to the standard library with the same output. The wire format
+# is the one the API always had: TIME columns as HH:MM:SS, datetimes in ISO
+# format, dates as HTTP dates (as Flask writes them) and decimals as strings.
+JSON_ENCODER = os.getenv('JSON_ENCODER', 'orjson')
+if JSON_ENCODER == 'orjson':
+    try:
+        import orjson
+    except ImportError:
+        JSON_ENCODER = 'json'
+
+
+# MySQL TIME values arrive as timedelta (hours may exceed 24). Timetables
+# repeat a few thousand distinct times, so formatted values are cached.
+@lru_cache(maxsize=65536)
+def format_time(value):
+    seconds = value.days * 86400 + value.seconds
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+@lru_cache(maxsize=4096)
+def format_date(value):
+    return http_date(value)
+
+
+def _default(value):
+    if isinstance(value, timedelta):
+        return format_time(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, date):
+        return format_date(value)
+    if isinstance(value, Decimal):
+        return str(value)
+    # UUIDs, dataclasses and markup as Flask handles them
+    return DefaultJSONProvider.default(value)
+
+
+if JSON_ENCODER == 'orjson':
+    # Dates and datetimes go through _default so they keep the formats above
+    _OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def encode(data, indent=False):
+        return orjson.dumps(data, default=_default, option=_OPTIONS | orjson.OPT_INDENT_2 if indent else _OPTIONS)
+
+    decode = orjson.loads
+else:
+    def encode(data, indent=False):
+        if indent:
+            return json.dumps(data, default=_default, ensure_ascii=False, indent=2).encode('utf-8')
+        return json.dumps(data, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    decode = json.loads
+
+
+# Converter for each column type that JSON cannot carry as-is. The type codes
+# are the MySQL protocol's, so descriptions from either driver work.
+_CONVERTERS = {
+    FieldType.TIME: format_time,
+    FieldType.DATE: format_date,
+    FieldType.NEWDATE: format_date,
+    FieldType.DATETIME: datetime.isoformat,
+    FieldType.TIMESTAMP: datetime.isoformat,
+    FieldType.DECIMAL: str,
+    FieldType.NEWDECIMAL: str
+}
+
+
+# Column names and the (index, converter) pairs of one result set, worked out
+# once from cursor.description instead of type-checking every value
+def columns(description):
+    names = tuple(column[0] for column in description)
+    converters = tuple(
+        (index, _CONVERTERS[column[1]]) for index, column in enumerate(description) if column[1] in _CONVERTERS
+    )
+    return names, converters
+
+
+# Plain (tuple) cursor rows as dicts of JSON-ready values. Conversion runs a
+# column at a time, so each value costs one converter call.
+def row_objects(description, rows):
+    names, converters = columns(description)
+    if converters and rows:
+        values = list(zip(*rows))
+        for index, convert in converters:
+            values[index] = [None if value is None else convert(value) for value in values[index]]
+        rows = zip(*values)
+    return [dict(zip(names, row)) for row in rows]
+
+
+def encode_rows(description, rows):
+    return encode(row_objects(description, rows))
+
+
+def encode_row(description, row):
+    return encode(row_objects(description, [row])[0])
+
+
+# Newline-delimited JSON, one object per row
+def encode_lines(description, rows):
+    return b''.join(encode(row) + b'\n' for row in row_objects(description, rows))
+
+
+# Flask JSON provider on the same encoder, so jsonify(), request.get_json()
+# and the async server all share it. Keys keep their insertion (column)
+# order instead of being sorted.
+class JSONProvider(DefaultJSONProvider):
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        return encode(obj, indent=bool(kwargs.get('indent'))).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return decode(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(encode(obj, indent) + b'\n', mimetype=self.mimetype)
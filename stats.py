@@ -0,0 +1,200 @@
+import argparse
+import json
+import random
+from datetime import date, timedelta
+
+# Dashboard aggregates live in booking_stats, one row per (dimension, key,
+# slot). The booking transaction adds to them, so reading the dashboard never
+# touches the bookings table. Each booking picks a random slot so concurrent
+# bookings do not all queue on the same hot 'total' / today row; readers sum
+# the slots back together. Train and route rows are not sharded, so a single
+# row per key lets the dashboard read the top `top` of them straight off
+# idx_stats_rank instead of grouping every key. A train row is only shared by
+# bookings of that train, which already queue on its inventory rows. A route
+# row is shared by every train running between the same two stations, whose
+# bookings therefore queue on it as well; callers make this upsert the last
+# statement before the commit, so the row lock is held only for the commit
+# and a route served by a handful of trains waits no longer than one train.
+# A route with many trains and heavy booking would need its own slots.
+STAT_SLOTS = 16
+RANKED_DIMENSIONS = ('train', 'route')
+
+# SQL expression producing the key of each dimension from a booking row
+DIMENSIONS = {
+    'total': "''",
+    'day': "CAST(b.booking_date AS CHAR)",
+    'train': "CAST(b.schedule_id AS CHAR)",
+    'route': "CONCAT(ts.source_station_id, '-', ts.destination_station_id)",
+    'payment': "py.payment_method"
+}
+
+
+# Add one booking to every dimension in a single statement (caller commits).
+# Promotions and cancellations adjust the booking's existing figures with
+# bookings=0 / -1 and negative tickets and amounts.
+def record_booking(cursor, schedule_id, booking_date, tickets, amount, payment_method, bookings=1):
+    slot = random.randrange(STAT_SLOTS)
+    values = (slot, bookings, tickets, amount)
+    ranked = (0, bookings, tickets, amount)
+    cursor.execute(
+        """
+        INSERT INTO booking_stats (dimension, dim_key, slot, bookings, tickets, revenue)
+        SELECT 'total', '', %s, %s, %s, %s
+        UNION ALL SELECT 'day', %s, %s, %s, %s, %s
+        UNION ALL SELECT 'train', %s, %s, %s, %s, %s
+        UNION ALL SELECT 'payment', %s, %s, %s, %s, %s
+        UNION ALL SELECT 'route', CONCAT(source_station_id, '-', destination_station_id), %s, %s, %s, %s
+            FROM train_schedule WHERE schedule_id = %s
+        ON DUPLICATE KEY UPDATE
+            bookings = bookings + VALUES(bookings),
+            tickets = tickets + VALUES(tickets),
+            revenue = revenue + VALUES(revenue)
+        """,
+        values
+        + (booking_date.isoformat(),) + values
+        + (str(schedule_id),) + ranked
+        + (str(payment_method),) + values
+        + ranked + (schedule_id,)
+    )
+
+
+# Recompute every aggregate from bookings, tickets, payments and refunds (for
+# backfilling history or repairing drift). Cancelled bookings count neither
+# as bookings nor tickets; their revenue is what the refund kept back.
+def rebuild(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("DELETE FROM booking_stats")
+        for dimension, key_expr in DIMENSIONS.items():
+            cursor.execute(f"""
+                INSERT INTO booking_stats (dimension, dim_key, slot, bookings, tickets, revenue)
+                SELECT '{dimension}', {key_expr}, 0, COUNT(CASE WHEN b.status <> 'CANCELLED' THEN 1 END),
+                       COALESCE(SUM(CASE WHEN b.status <> 'CANCELLED' THEN tc.tickets END), 0),
+                       COALESCE(SUM(py.amount), 0) - COALESCE(SUM(rf.amount), 0)
+                FROM bookings b
+                JOIN train_schedule ts ON ts.schedule_id = b.schedule_id
+                LEFT JOIN (SELECT booking_id, COUNT(*) as tickets FROM tickets GROUP BY booking_id) tc ON tc.booking_id = b.booking_id
+                LEFT JOIN payments py ON py.booking_id = b.booking_id
+                LEFT JOIN refunds rf ON rf.booking_id = b.booking_id
+                {'' if dimension == 'total' else f'GROUP BY {key_expr}'}
+            """)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return dashboard(connection)
+
+
+def _totals(row):
+    return {
+        'bookings': int(row['bookings'] or 0),
+        'tickets': int(row['tickets'] or 0),
+        'revenue': float(row['revenue'] or 0)
+    }
+
+
+TOTAL_QUERY = ("SELECT SUM(bookings) as bookings, SUM(tickets) as tickets, SUM(revenue) as revenue "
+               "FROM booking_stats WHERE dimension = 'total'")
+
+
+def grouped_query(dimension, where='', params=(), order='revenue DESC'):
+    return (
+        f"""
+        SELECT dim_key, SUM(bookings) as bookings, SUM(tickets) as tickets, SUM(revenue) as revenue
+        FROM booking_stats WHERE dimension = %s {where}
+        GROUP BY dim_key ORDER BY {order}
+        """,
+        (dimension,) + tuple(params)
+    )
+
+
+def _grouped(cursor, dimension, where='', params=(), order='revenue DESC'):
+    cursor.execute(*grouped_query(dimension, where, params, order))
+    return cursor.fetchall()
+
+
+# Highest-revenue keys of a ranked dimension: `top` entries of idx_stats_rank
+def ranked_query(dimension, top):
+    return (
+        """
+        SELECT dim_key, bookings, tickets, revenue FROM booking_stats
+        WHERE dimension = %s ORDER BY revenue DESC LIMIT %s
+        """,
+        (dimension, top)
+    )
+
+
+def _ranked(cursor, dimension, top):
+    cursor.execute(*ranked_query(dimension, top))
+    return cursor.fetchall()
+
+
+def train_names_query(ids):
+    return f"SELECT schedule_id, train_name FROM train_schedule WHERE schedule_id IN ({', '.join(['%s'] * len(ids))})", ids
+
+
+def station_names_query(ids):
+    return f"SELECT station_id, station_name FROM stations WHERE station_id IN ({', '.join(['%s'] * len(ids))})", ids
+
+
+# Reads at most STAT_SLOTS rows for the total, days * STAT_SLOTS for the day
+# series, payment methods * STAT_SLOTS and `top` index entries for each of
+# trains and routes, whatever the size of the network or the history.
+def dashboard(connection, days=30, top=10):
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(TOTAL_QUERY)
+        total = _totals(cursor.fetchone())
+
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        by_day = [dict(_totals(r), date=r['dim_key'])
+                  for r in _grouped(cursor, 'day', 'AND dim_key >= %s', (since,), order='dim_key DESC')]
+        today = next((d for d in by_day if d['date'] == date.today().isoformat()),
+                     {'date': date.today().isoformat(), 'bookings': 0, 'tickets': 0, 'revenue': 0.0})
+
+        by_payment = [dict(_totals(r), payment_method=r['dim_key']) for r in _grouped(cursor, 'payment')]
+
+        by_train = [dict(_totals(r), schedule_id=int(r['dim_key'])) for r in _ranked(cursor, 'train', top)]
+        if by_train:
+            ids = [t['schedule_id'] for t in by_train]
+            cursor.execute(*train_names_query(ids))
+            names = {r['schedule_id']: r['train_name'] for r in cursor.fetchall()}
+            for t in by_train:
+                t['train_name'] = names.get(t['schedule_id'])
+
+        by_route = []
+        for r in _ranked(cursor, 'route', top):
+            source_id, destination_id = (int(x) for x in r['dim_key'].split('-'))
+            by_route.append(dict(_totals(r), source_station_id=source_id, destination_station_id=destination_id))
+        if by_route:
+            ids = sorted({i for r in by_route for i in (r['source_station_id'], r['destination_station_id'])})
+            cursor.execute(*station_names_query(ids))
+            names = {r['station_id']: r['station_name'] for r in cursor.fetchall()}
+            for r in by_route:
+                r['source'] = names.get(r['source_station_id'])
+                r['destination'] = names.get(r['destination_station_id'])
+
+        return {
+            'total': total,
+            'today': today,
+            'by_day': by_day,
+            'by_train': by_train,
+            'by_route': by_route,
+            'by_payment': by_payment
+        }
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    from db import get_connection
+
+    parser = argparse.ArgumentParser(description='Booking dashboard aggregates')
+    parser.add_argument('command', choices=['show', 'rebuild'], help='print the dashboard or recompute it from bookings')
+    args = parser.parse_args()
+
+    with get_connection() as connection:
+        result = rebuild(connection) if args.command == 'rebuild' else dashboard(connection)
+    print(json.dumps(result, indent=2))
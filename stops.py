@@ -0,0 +1,142 @@
+from datetime import timedelta
+
+# Every schedule has an ordered list of stops in schedule_stops, with arrival
+# and departure offsets in minutes from the train's departure_time. Segment k
+# runs from stop k to stop k + 1, and a ticket from stop i to stop j occupies
+# segments i .. j - 1, so the same seat can be resold for the legs before i
+# and after j. Direct trains are simply two stops (one segment).
+
+
+def _minutes(value):
+    # HH:MM[:SS] strings or the timedelta MySQL returns for TIME columns
+    if isinstance(value, timedelta):
+        return int(value.total_seconds()) // 60
+    hours, minutes = (int(part) for part in str(value).split(':')[:2])
+    return hours * 60 + minutes
+
+
+# Turn a stop list of {station_id, arrival_time, departure_time} clock times
+# into (station_id, arrival_offset, departure_offset) rows. Times are taken to
+# roll over midnight whenever they go backwards.
+def offsets_from_times(stops):
+    if len(stops) < 2:
+        raise ValueError('A route needs at least two stops')
+    start = _minutes(stops[0]['departure_time'])
+    rows = []
+    last = 0
+    for position, stop in enumerate(stops):
+        offsets = []
+        for field in ('arrival_time', 'departure_time'):
+            skip = (position == 0 and field == 'arrival_time') or (position == len(stops) - 1 and field == 'departure_time')
+            if skip:
+                offsets.append(None)
+                continue
+            if stop.get(field) in (None, ''):
+                raise ValueError(f"Stop {position + 1} needs {field}")
+            offset = (_minutes(stop[field]) - start) % 1440
+            while offset < last:
+                offset += 1440
+            offsets.append(offset)
+            last = offset
+        rows.append((int(stop['station_id']), offsets[0], offsets[1]))
+    if len({row[0] for row in rows}) != len(rows):
+        raise ValueError('A station can only appear once on a route')
+    return rows
+
+
+# The two implicit stops of a direct train
+def direct_route(source, destination, departure_time, arrival_time):
+    duration = (_minutes(arrival_time) - _minutes(departure_time)) % 1440
+    return [(source, None, 0), (destination, duration, None)]
+
+
+def insert_stops(cursor, schedule_id, rows):
+    cursor.executemany(
+        """
+        INSERT INTO schedule_stops (schedule_id, stop_sequence, station_id, arrival_offset, departure_offset)
+        VALUES (%s, %s, %s, %s, %s)
+        """,
+        [(schedule_id, sequence, station_id, arrival, departure)
+         for sequence, (station_id, arrival, departure) in enumerate(rows)]
+    )
+
+
+# Give schedules that have no stops yet (direct trains, or rows written before
+# the stops model) their two implicit stops: source and destination
+def backfill(cursor, schedule_ids=None):
+    where = ''
+    params = ()
+    if schedule_ids:
+        where = f"AND ts.schedule_id IN ({', '.join(['%s'] * len(schedule_ids))})"
+        params = tuple(schedule_ids)
+    cursor.execute(
+        f"""
+        INSERT IGNORE INTO schedule_stops (schedule_id, stop_sequence, station_id, arrival_offset, departure_offset)
+        SELECT ts.schedule_id, 0, ts.source_station_id, NULL, 0
+        FROM train_schedule ts
+        WHERE ts.source_station_id IS NOT NULL AND ts.departure_time IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM schedule_stops ss WHERE ss.schedule_id = ts.schedule_id) {where}
+        UNION ALL
+        SELECT ts.schedule_id, 1, ts.destination_station_id,
+               MOD(TIME_TO_SEC(ts.arrival_time) - TIME_TO_SEC(ts.departure_time) + 86400, 86400) DIV 60, NULL
+        FROM train_schedule ts
+        WHERE ts.destination_station_id IS NOT NULL AND ts.arrival_time IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM schedule_stops ss WHERE ss.schedule_id = ts.schedule_id) {where}
+        """,
+        params + params
+    )
+    return cursor.rowcount
+
+
+def stops_query(schedule_id):
+    return (
+        """
+        SELECT ss.stop_sequence, ss.station_id, st.code, st.station_name, ss.arrival_offset, ss.departure_offset
+        FROM schedule_stops ss
+        JOIN stations st ON st.station_id = ss.station_id
+        WHERE ss.schedule_id = %s
+        ORDER BY ss.stop_sequence
+        """,
+        (schedule_id,)
+    )
+
+
+# Source and destination of a schedule without stop rows, in the same shape
+def terminal_stops_query(schedule_id):
+    return (
+        """
+        SELECT 0, ss.station_id, ss.code, ss.station_name, NULL, 0
+        FROM train_schedule ts JOIN stations ss ON ss.station_id = ts.source_station_id
+        WHERE ts.schedule_id = %s
+        UNION ALL
+        SELECT 1, ds.station_id, ds.code, ds.station_name,
+               MOD(TIME_TO_SEC(ts.arrival_time) - TIME_TO_SEC(ts.departure_time) + 86400, 86400) DIV 60, NULL
+        FROM train_schedule ts JOIN stations ds ON ds.station_id = ts.destination_station_id
+        WHERE ts.schedule_id = %s
+        """,
+        (schedule_id, schedule_id)
+    )
+
+
+# Ordered stops of one schedule as dicts (plain, non-dictionary cursor).
+# Falls back to source and destination for schedules without stop rows.
+def load_stops(cursor, schedule_id):
+    cursor.execute(*stops_query(schedule_id))
+    rows = cursor.fetchall()
+    if not rows:
+        cursor.execute(*terminal_stops_query(schedule_id))
+        rows = sorted(cursor.fetchall())
+    keys = ('sequence', 'station_id', 'code', 'station_name', 'arrival_offset', 'departure_offset')
+    return [dict(zip(keys, row)) for row in rows]
+
+
+# Stop sequences (from, to) for a leg given station codes; the whole route
+# when a code is omitted. Raises ValueError when the train does not serve the
+# leg in that direction.
+def leg_for(stops, from_code=None, to_code=None):
+    sequences = {stop['code']: stop['sequence'] for stop in stops}
+    start = sequences.get(from_code.upper()) if from_code else 0
+    end = sequences.get(to_code.upper()) if to_code else len(stops) - 1
+    if start is None or end is None or start >= end:
+        raise ValueError('This train does not run between those stations')
+    return start, end
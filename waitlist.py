@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+from collections import defaultdict
+from datetime import date, datetime
+
+from mysql.connector import Error, errorcode
+
+from inventory import SEAT_CLASSES
+from pnr import pnr_cache, refresh as refresh_summary
+from seats import allocate, decode_segments, encode_segments, free_count, leg_occupancy, mark, seat_label
+from stats import record_booking
+
+# Waitlist per (schedule, travel_date, class). A booking that finds the class
+# sold out can join the queue instead (booking.py); its waitlist row keeps the
+# leg, group size and seat preference. The inventory row's `waiting` counter
+# holds freed seats for the queue: allocate_seats sells nothing directly
+# while it is non-zero, so a cancellation's seats cannot be taken by a new
+# booking before promote() hands them to the waitlist in queue order.
+WAITLIST_LIMIT = int(os.getenv('WAITLIST_LIMIT', 500))
+PROMOTE_BATCH_SIZE = int(os.getenv('PROMOTE_BATCH_SIZE', 500))
+PROMOTE_RETRIES = 3
+
+
+# Add a booking to the back of the queue inside the booking transaction,
+# which already holds the inventory row lock. Returns its waitlist number, or
+# None when WAITLIST_LIMIT passengers are already waiting.
+def enqueue(cursor, booking_id, schedule_id, travel_date, seat_class, from_stop, to_stop, seat_count, preference):
+    key = (schedule_id, travel_date, seat_class)
+    cursor.execute(
+        """
+        UPDATE seat_inventory SET waiting = waiting + 1
+        WHERE schedule_id = %s AND travel_date = %s AND seat_class = %s AND waiting < %s
+        """,
+        key + (WAITLIST_LIMIT,)
+    )
+    if not cursor.rowcount:
+        return None
+    cursor.execute(
+        "SELECT waiting FROM seat_inventory WHERE schedule_id = %s AND travel_date = %s AND seat_class = %s",
+        key
+    )
+    waitlist_number = cursor.fetchone()[0]
+    cursor.execute(
+        """
+        INSERT INTO waitlist (schedule_id, travel_date, seat_class, from_stop, to_stop, seat_count, preference,
+                              booking_id, waitlist_number, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """,
+        key + (from_stop, to_stop, seat_count, preference, booking_id, waitlist_number, datetime.now())
+    )
+    return waitlist_number
+
+
+# Take a waiting booking off the queue (it is being cancelled); the caller
+# holds the inventory row lock
+def withdraw(cursor, booking_id, schedule_id, travel_date, seat_class):
+    cursor.execute("UPDATE waitlist SET status = 'CANCELLED' WHERE booking_id = %s AND status = 'WAITING'", (booking_id,))
+    if cursor.rowcount:
+        cursor.execute(
+            """
+            UPDATE seat_inventory SET waiting = GREATEST(waiting - 1, 0)
+            WHERE schedule_id = %s AND travel_date = %s AND seat_class = %s
+            """,
+            (schedule_id, travel_date, seat_class)
+        )
+    return cursor.rowcount
+
+
+def _promote_batch(cursor, schedule_id, travel_date, seat_class, after_id, batch_size):
+    key = (schedule_id, travel_date, seat_class)
+    cursor.execute(
+        """
+        SELECT capacity, segments, seat_map, waiting FROM seat_inventory
+        WHERE schedule_id = %s AND travel_date = %s AND seat_class = %s
+        FOR UPDATE
+        """,
+        key
+    )
+    row = cursor.fetchone()
+    if row is None or not row[3]:
+        return None, []
+    capacity, segments, seat_map, waiting = row
+    maps = decode_segments(seat_map, segments, capacity)
+    if all(free_count(segment, capacity) == 0 for segment in maps):
+        return None, []
+
+    # Next slice of the queue in order, straight off idx_waitlist_queue
+    cursor.execute(
+        """
+        SELECT w.waitlist_id, w.booking_id, w.from_stop, w.to_stop, w.seat_count, w.preference,
+               b.booking_date, py.payment_method
+        FROM waitlist w
+        JOIN bookings b ON b.booking_id = w.booking_id
+        LEFT JOIN payments py ON py.booking_id = w.booking_id
+        WHERE w.schedule_id = %s AND w.travel_date = %s AND w.seat_class = %s AND w.status = 'WAITING'
+          AND w.waitlist_id > %s
+        ORDER BY w.waitlist_id
+        LIMIT %s
+        """,
+        key + (after_id, batch_size)
+    )
+    entries = cursor.fetchall()
+    if not entries:
+        return None, []
+
+    # Seats go to entries in queue order; a group or leg that does not fit
+    # yet keeps its place and later entries that do fit are served
+    promoted = []
+    for waitlist_id, booking_id, from_stop, to_stop, seat_count, preference, booking_date, method in entries:
+        to_stop = min(to_stop, segments)
+        indexes = allocate(leg_occupancy(maps, from_stop, to_stop), seat_class, capacity, seat_count, preference)
+        if indexes is None:
+            continue
+        for segment in range(from_stop, to_stop):
+            maps[segment] = mark(maps[segment], indexes)
+        seats = [seat_label(seat_class, index) for index in indexes]
+        promoted.append((waitlist_id, booking_id, from_stop, to_stop, seats, booking_date, method))
+    next_id = entries[-1][0] if len(entries) == batch_size else None
+    if not promoted:
+        return next_id, []
+
+    waiting -= len(promoted)
+    cursor.execute(
+        """
+        UPDATE seat_inventory SET remaining = %s, seat_map = %s, waiting = %s
+        WHERE schedule_id = %s AND travel_date = %s AND seat_class = %s
+        """,
+        (free_count(leg_occupancy(maps, 0, segments), capacity), encode_segments(maps, capacity), waiting) + key
+    )
+    cursor.executemany(
+        """
+        INSERT INTO seat_reservations (schedule_id, travel_date, seat_number, from_stop, to_stop, seat_class, booking_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """,
+        [(schedule_id, travel_date, seat, from_stop, to_stop, seat_class, booking_id)
+         for _, booking_id, from_stop, to_stop, seats, _, _ in promoted for seat in seats]
+    )
+    cursor.executemany(
+        "INSERT INTO tickets (booking_id, seat_number, travel_date) VALUES (%s, %s, %s)",
+        [(booking_id, seat, travel_date) for _, booking_id, _, _, seats, _, _ in promoted for seat in seats]
+    )
+    ids = [entry[1] for entry in promoted]
+    placeholders = ', '.join(['%s'] * len(ids))
+    cursor.execute(
+        f"UPDATE waitlist SET status = 'PROMOTED', promoted_at = %s WHERE booking_id IN ({placeholders})",
+        [datetime.now()] + ids
+    )
+    cursor.execute(f"UPDATE bookings SET status = 'CONFIRMED' WHERE booking_id IN ({placeholders})", ids)
+
+    refresh_summary(cursor, ids)
+    # The bookings were counted when they joined; add their tickets now,
+    # one stats statement per (booking date, payment method)
+    tickets = defaultdict(int)
+    for _, _, _, _, seats, booking_date, method in promoted:
+        tickets[(booking_date, method)] += len(seats)
+    for (booking_date, method), count in tickets.items():
+        record_booking(cursor, schedule_id, booking_date, count, 0, method, bookings=0)
+    return next_id, promoted
+
+
+# Hand freed seats of one (schedule, date, class) to its waitlist in queue
+# order. Each batch of PROMOTE_BATCH_SIZE entries is its own short
+# transaction on the inventory row only, so bookings and cancellations for
+# the class interleave with a long promotion. Stops once the queue is empty
+# or walked, or every segment is full. Returns {booking_id: seats}.
+def promote(connection, schedule_id, travel_date, seat_class, batch_size=PROMOTE_BATCH_SIZE):
+    promoted = {}
+    after_id = 0
+    cursor = connection.cursor()
+    try:
+        while after_id is not None:
+            for attempt in range(PROMOTE_RETRIES):
+                try:
+                    next_id, batch = _promote_batch(cursor, schedule_id, travel_date, seat_class, after_id, batch_size)
+                    connection.commit()
+                    break
+                except Error as e:
+                    connection.rollback()
+                    if e.errno != errorcode.ER_LOCK_DEADLOCK or attempt == PROMOTE_RETRIES - 1:
+                        raise
+            pnr_cache.invalidate(*(entry[1] for entry in batch))
+            promoted.update((entry[1], entry[4]) for entry in batch)
+            after_id = next_id
+    finally:
+        cursor.close()
+    return promoted
+
+
+# Promote every class with a waitlist for travel dates from from_date on
+# (catches up after a failed pass; also run by the CLI and admin endpoint)
+def promote_pending(connection, from_date=None, batch_size=PROMOTE_BATCH_SIZE):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT schedule_id, travel_date, seat_class FROM seat_inventory WHERE waiting > 0 AND travel_date >= %s",
+            (from_date or date.today(),)
+        )
+        keys = cursor.fetchall()
+        connection.commit()
+    finally:
+        cursor.close()
+    result = []
+    for schedule_id, travel_date, seat_class in keys:
+        promoted = promote(connection, schedule_id, travel_date, seat_class, batch_size)
+        result.append({
+            'schedule_id': schedule_id,
+            'travel_date': travel_date.isoformat(),
+            'seat_class': seat_class,
+            'promoted': len(promoted)
+        })
+    return result
+
+
+def entry_query(booking_id):
+    return (
+        """
+        SELECT waitlist_id, schedule_id, travel_date, seat_class, seat_count, waitlist_number, status, promoted_at
+        FROM waitlist WHERE booking_id = %s
+        """,
+        (booking_id,)
+    )
+
+
+# Entries still waiting up to and including this one: a range of
+# idx_waitlist_queue
+def queue_position_query(schedule_id, travel_date, seat_class, waitlist_id):
+    return (
+        """
+        SELECT COUNT(*) FROM waitlist
+        WHERE schedule_id = %s AND travel_date = %s AND seat_class = %s AND status = 'WAITING' AND waitlist_id <= %s
+        """,
+        (schedule_id, travel_date, seat_class, waitlist_id)
+    )
+
+
+# Waitlist entry of a booking with its current place in the queue (1 is
+# next), counted on idx_waitlist_queue; None if it never waited
+def position(cursor, booking_id):
+    cursor.execute(*entry_query(booking_id))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    waitlist_id, schedule_id, travel_date, seat_class, seat_count, waitlist_number, status, promoted_at = row
+    current = None
+    if status == 'WAITING':
+        cursor.execute(*queue_position_query(schedule_id, travel_date, seat_class, waitlist_id))
+        current = cursor.fetchone()[0]
+    return {
+        'booking_id': booking_id,
+        'schedule_id': schedule_id,
+        'travel_date': travel_date.isoformat(),
+        'seat_class': seat_class,
+        'seat_count': seat_count,
+        'status': status,
+        'waitlist_number': waitlist_number,
+        'position': current,
+        'promoted_at': promoted_at.isoformat() if promoted_at else None
+    }
+
+
+# Body of POST /api/admin/waitlist/promote: one class
+# {"schedule_id", "travel_date", "seat_class"} or, when empty, every class
+# with a waitlist; raises ValueError with the message for a 400
+def parse_promote(data):
+    if not data:
+        return None
+    try:
+        key = (int(data['schedule_id']), datetime.strptime(str(data['travel_date']), '%Y-%m-%d').date(),
+               data.get('seat_class') or 'SL')
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('schedule_id and travel_date (YYYY-MM-DD) are required')
+    if key[2] not in SEAT_CLASSES:
+        raise ValueError(f"seat_class must be one of: {', '.join(SEAT_CLASSES)}")
+    return key
+
+
+if __name__ == '__main__':
+    from db import get_connection
+
+    parser = argparse.ArgumentParser(description='Waitlist promotion')
+    parser.add_argument('command', choices=['promote'], help='hand freed seats to waitlisted bookings')
+    parser.add_argument('--schedule-id', type=int, help='one schedule (with --date and --class), default every waitlist')
+    parser.add_argument('--date', help='travel date (YYYY-MM-DD)')
+    parser.add_argument('--class', dest='seat_class', default='SL', choices=list(SEAT_CLASSES))
+    parser.add_argument('--batch-size', type=int, default=PROMOTE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with get_connection() as connection:
+        if args.schedule_id:
+            travel_date = date.fromisoformat(args.date) if args.date else date.today()
+            promoted = promote(connection, args.schedule_id, travel_date, args.seat_class, args.batch_size)
+            result = {'promoted': len(promoted), 'bookings': promoted}
+        else:
+            result = {'classes': promote_pending(connection, batch_size=args.batch_size)}
+    print(json.dumps(result, indent=2))